@@ -18,12 +18,36 @@ NOTE:
       (If they do, the data size will be off.)
 """
 import os
+import sys
+import gzip
+import shutil
+import subprocess
+import tempfile
+import pickle
 
 import unittest
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor
 from hypothesis import given
-from hypothesis.strategies import integers, lists, recursive, builds, text, just
+from hypothesis.strategies import integers, lists, recursive, builds, text, \
+    just, tuples
 
-from tree_data import FileSystemTree
+from tree_data import AbstractTree, FileSystemTree, squarify_rect, \
+    slice_rect
+from fs_scan import scan_file_system, scan_file_system_sharded, InodeSet
+from scan_snapshot import scan_with_snapshot
+from fs_watch import PollingWatcher, InotifyWatcher, inotify_available, \
+    MODIFIED, RESCAN
+from lazy_tree import LazyFileSystemTree
+from compact_tree import compact_from_tree, compact_scan
+from manifest_tree import tree_from_manifest
+from budget_scan import scan_with_budget, PlaceholderTree, OTHER_NAME
+from treemap_index import TreemapIndex
+from parallel_layout import parallel_treemap
+from edit_journal import EditJournal
+from path_index import PathIndex
+from tree_diff import diff_trees, diff_snapshots, ADDED, REMOVED, CHANGED
+from size_report import size_report
 
 
 # This should be the path to the "B" folder in the sample data.
@@ -86,6 +110,1421 @@ class FileSystemTreeConstructorTest(unittest.TestCase):
         self.assertEqual(second.data_size, 10)
 
 
+def _tree_shape(tree):
+    """Return a nested tuple of the names and sizes in <tree>.
+
+    @type tree: AbstractTree
+    @rtype: tuple
+    """
+    return (tree._root, tree.data_size,
+            tuple(_tree_shape(subtree) for subtree in tree._subtrees))
+
+
+def _build_tree(shape):
+    """Return an AbstractTree with the shape <shape>: a leaf size, or a list
+    of the shapes of the subtrees.
+
+    @type shape: int | list
+    @rtype: AbstractTree
+    """
+    if isinstance(shape, int):
+        return AbstractTree('leaf', [], shape)
+    return AbstractTree('node', [_build_tree(child) for child in shape])
+
+
+def _recursive_treemap(tree, rect):
+    """Return the treemap of <tree> in <rect> by the slicing algorithm,
+    recursing once per level, to check the explicit-stack layouts against.
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @rtype: list[((int, int, int, int), (int, int, int))]
+    """
+    x, y, width, height = rect
+    if tree.data_size == 0:
+        return []
+    elif tree._subtrees == []:
+        return [(rect, tree.colour)]
+    tree_map = []
+    length = max(width, height)
+    used = 0
+    for subtree in tree._subtrees:
+        if subtree is tree._subtrees[-1]:
+            size = length - used
+        else:
+            size = subtree.proportionate_tree(length)
+        if width > height:
+            tree_map += _recursive_treemap(subtree,
+                                           (x + used, y, size, height))
+        else:
+            tree_map += _recursive_treemap(subtree,
+                                           (x, y + used, width, size))
+        used += size
+    return tree_map
+
+
+# Tree shapes with leaf sizes that are often 0.
+TREE_SHAPES = recursive(integers(min_value=0, max_value=1000),
+                        lambda children: lists(children, min_size=1,
+                                               max_size=5))
+
+
+class ScanFileSystemTest(unittest.TestCase):
+    def test_same_tree_as_constructor(self):
+        for path in [EXAMPLE_PATH, 'TestFolder', 'empty folder case']:
+            expected = _tree_shape(FileSystemTree(path))
+            for workers in [1, 4]:
+                tree = scan_file_system(path, workers)
+                self.assertEqual(_tree_shape(tree), expected)
+
+    def test_parent_tree_links(self):
+        tree = scan_file_system('TestFolder')
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            for subtree in node._subtrees:
+                self.assertIs(subtree._parent_tree, node)
+                stack.append(subtree)
+
+    def test_sharded_same_tree_as_constructor(self):
+        for path in [EXAMPLE_PATH, 'TestFolder']:
+            tree = scan_file_system_sharded(path, 2)
+            self.assertEqual(_tree_shape(tree),
+                             _tree_shape(FileSystemTree(path)))
+            for subtree in tree._subtrees:
+                self.assertIs(subtree._parent_tree, tree)
+
+    def test_single_file(self):
+        tree = scan_file_system(os.path.join(EXAMPLE_PATH, 'f4.txt'))
+        self.assertEqual(tree._root, 'f4.txt')
+        self.assertEqual(tree._subtrees, [])
+        self.assertEqual(tree.data_size, 10)
+
+
+def _write_file(path, text):
+    """Write <text> to a new file at <path>.
+
+    @type path: str
+    @type text: str
+    @rtype: None
+    """
+    with open(path, 'w') as file:
+        file.write(text)
+
+
+def _make_old(path):
+    """Set the access and modification times of <path> an hour back.
+
+    @type path: str
+    @rtype: None
+    """
+    old_ns = os.stat(path).st_mtime_ns - 3600 * 10 ** 9
+    os.utime(path, ns=(old_ns, old_ns))
+
+
+@unittest.skipUnless(hasattr(os, 'link') and shutil.which('du'),
+                     'needs hard links and du')
+class DiskUsageScanTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'data')
+        shutil.copytree(EXAMPLE_PATH, self.path)
+        os.link(os.path.join(self.path, 'f4.txt'),
+                os.path.join(self.path, 'A', 'f4-link.txt'))
+        os.mkdir(os.path.join(self.path, 'empty'))
+        with open(os.path.join(self.path, 'sparse'), 'wb') as file:
+            file.truncate(10 ** 7)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_matches_du(self):
+        output = subprocess.check_output(['du', '-s', '-B1', self.path])
+        tree = scan_file_system(self.path, disk_usage=True)
+        self.assertEqual(tree.data_size, int(output.split()[0]))
+
+    def test_sharded_matches_threaded(self):
+        tree = scan_file_system_sharded(self.path, 2, disk_usage=True)
+        self.assertEqual(
+            _tree_shape(tree),
+            _tree_shape(scan_file_system(self.path, disk_usage=True)))
+
+    def test_hard_link_counted_once(self):
+        tree = scan_file_system(self.path, disk_usage=True)
+        sizes = {}
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            sizes.setdefault(node._root, []).append(node.data_size)
+            stack.extend(node._subtrees)
+        self.assertEqual(sorted(sizes['f4.txt'] + sizes['f4-link.txt'])[0], 0)
+        self.assertLess(sizes['sparse'][0], 10 ** 7)
+
+    def test_default_sizes_unchanged(self):
+        tree = scan_file_system(self.path)
+        self.assertEqual(tree.data_size, 50 + 10 ** 7)
+
+    def test_watcher_keeps_allocated_sizes(self):
+        tree = scan_file_system(self.path, disk_usage=True)
+        watcher = PollingWatcher(tree, self.path, 0, disk_usage=True)
+        _write_file(os.path.join(self.path, 'A', 'f1.txt'), 'x' * 10000)
+        _write_file(os.path.join(self.path, 'new.txt'), 'x' * 5000)
+        self.assertTrue(watcher.poll())
+        output = subprocess.check_output(['du', '-s', '-B1', self.path])
+        self.assertEqual(tree.data_size, int(output.split()[0]))
+
+
+class InodeSetTest(unittest.TestCase):
+    @given(lists(tuples(integers(min_value=0, max_value=3),
+                        integers(min_value=0, max_value=2 ** 64 - 1) |
+                        integers(min_value=0, max_value=3000))))
+    def test_same_as_set(self, inodes):
+        expected = set()
+        found = InodeSet()
+        for device, number in inodes:
+            inode = (device << 64) | number
+            self.assertEqual(found.add(inode), inode not in expected)
+            expected.add(inode)
+        for device, number in inodes:
+            self.assertIn((device << 64) | number, found)
+            self.assertEqual((device << 64) | (number ^ 1) in found,
+                             (device << 64) | (number ^ 1) in expected)
+
+
+class ScanSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'data')
+        shutil.copytree(EXAMPLE_PATH, self.path)
+        for dir_path, _, _ in os.walk(self.path):
+            _make_old(dir_path)
+        self.snapshot = os.path.join(self.root, 'scan.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_first_scan(self):
+        tree = scan_with_snapshot(self.path, self.snapshot)
+        self.assertEqual(_tree_shape(tree),
+                         _tree_shape(FileSystemTree(self.path)))
+        self.assertTrue(os.path.exists(self.snapshot))
+
+    def test_unchanged_directories_reused(self):
+        scan_with_snapshot(self.path, self.snapshot)
+        # Growing a file in place does not change its folder's mtime, so
+        # without checking files the size saved in the snapshot is used.
+        _write_file(os.path.join(self.path, 'A', 'f1.txt'), 'x' * 100)
+        tree = scan_with_snapshot(self.path, self.snapshot,
+                                  check_files=False)
+        self.assertEqual(tree.data_size, 40)
+
+    def test_grown_file_resized(self):
+        scan_with_snapshot(self.path, self.snapshot)
+        _write_file(os.path.join(self.path, 'A', 'f1.txt'), 'x' * 100)
+        tree = scan_with_snapshot(self.path, self.snapshot)
+        self.assertEqual(_tree_shape(tree),
+                         _tree_shape(FileSystemTree(self.path)))
+
+    def test_changed_directory_relisted(self):
+        scan_with_snapshot(self.path, self.snapshot)
+        _write_file(os.path.join(self.path, 'A', 'new.txt'), 'x' * 5)
+        tree = scan_with_snapshot(self.path, self.snapshot)
+        self.assertEqual(_tree_shape(tree),
+                         _tree_shape(FileSystemTree(self.path)))
+        self.assertEqual(tree.data_size, 45)
+
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'data')
+        shutil.copytree(EXAMPLE_PATH, self.path)
+        self.tree = FileSystemTree(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _child(self, name):
+        for subtree in self.tree._subtrees:
+            if subtree._root == name:
+                return subtree
+
+    def check_watcher(self, watcher):
+        _write_file(os.path.join(self.path, 'A', 'new.txt'), 'x' * 5)
+        os.mkdir(os.path.join(self.path, 'C'))
+        _write_file(os.path.join(self.path, 'C', 'f5.txt'), 'x' * 7)
+        self.assertTrue(watcher.poll())
+        self.assertEqual(self.tree.data_size, 52)
+        self.assertEqual(self._child('A').data_size, 35)
+
+        _write_file(os.path.join(self.path, 'f4.txt'), 'x' * 20)
+        os.remove(os.path.join(self.path, 'A', 'f1.txt'))
+        self.assertTrue(watcher.poll())
+        self.assertEqual(self.tree.data_size, 47)
+        names = [subtree._root for subtree in self._child('A')._subtrees]
+        self.assertNotIn('f1.txt', names)
+
+        shutil.rmtree(os.path.join(self.path, 'C'))
+        self.assertTrue(watcher.poll())
+        self.assertEqual(self.tree.data_size, 40)
+        self.assertFalse(watcher.poll())
+        watcher.close()
+
+    def test_polling_watcher(self):
+        self.check_watcher(PollingWatcher(self.tree, self.path, 0))
+
+    @unittest.skipUnless(inotify_available(), 'inotify is not available')
+    def test_inotify_watcher(self):
+        self.check_watcher(InotifyWatcher(self.tree, self.path))
+
+    def test_rescan(self):
+        watcher = PollingWatcher(self.tree, self.path, 3600)
+        _write_file(os.path.join(self.path, 'A', 'new.txt'), 'x' * 5)
+        os.remove(os.path.join(self.path, 'f4.txt'))
+        self.assertFalse(watcher.poll())
+        self.assertTrue(watcher._apply(RESCAN, self.path))
+        self.assertEqual(_tree_shape(self.tree),
+                         _tree_shape(FileSystemTree(self.path)))
+        _write_file(os.path.join(self.path, 'A', 'new.txt'), 'x' * 10)
+        self.assertTrue(watcher._apply(
+            MODIFIED, os.path.join(self.path, 'A', 'new.txt')))
+        self.assertEqual(self.tree.data_size, 40)
+
+    def test_deleted_without_the_index(self):
+        watcher = PollingWatcher(self.tree, self.path, 0)
+        folder = self._child('A')
+        folder.delete_selected_leaf()
+        _write_file(os.path.join(self.path, 'A', 'f1.txt'), 'x' * 100)
+        watcher.poll()
+        self.assertEqual(self.tree.data_size, 10)
+        self.assertEqual(folder.data_size, 30)
+
+    def test_edits_share_the_index(self):
+        paths = PathIndex(self.tree)
+        watcher = PollingWatcher(self.tree, self.path, 0, paths)
+        journal = EditJournal(self.tree, paths)
+        folder = self._child('A')
+        for leaf in folder._subtrees:
+            if leaf._root == 'f1.txt':
+                journal.delete_selected_leaf(leaf)
+        _write_file(os.path.join(self.path, 'A', 'f1.txt'), 'x' * 100)
+        self.assertFalse(watcher.poll())
+        self.assertEqual(folder.data_size, 15)
+        self.assertEqual(self.tree.data_size, 25)
+        journal.undo()
+        _write_file(os.path.join(self.path, 'A', 'f1.txt'), 'x' * 50)
+        self.assertTrue(watcher.poll())
+        self.assertEqual(self.tree.data_size, 75)
+
+
+class LazyFileSystemTreeTest(unittest.TestCase):
+    def test_same_treemap_when_everything_visible(self):
+        tree = LazyFileSystemTree('TestFolder', 1)
+        rects = tree.generate_treemap((0, 0, 1100, 900))
+        expected = FileSystemTree('TestFolder').generate_treemap(
+            (0, 0, 1100, 900))
+        self.assertEqual([rect for rect, _ in rects],
+                         [rect for rect, _ in expected])
+        self.assertEqual(_tree_shape(tree),
+                         _tree_shape(FileSystemTree('TestFolder')))
+
+    def test_small_folders_stay_collapsed(self):
+        tree = LazyFileSystemTree('TestFolder', 5000)
+        rects = tree.generate_treemap((0, 0, 100, 90))
+        self.assertEqual(len(rects), 3)
+        self.assertEqual(tree.data_size, 11)
+        for subtree in tree._subtrees:
+            self.assertEqual(subtree._subtrees, [])
+
+    def test_unchanged_tree_not_walked(self):
+        tree = LazyFileSystemTree('TestFolder', 1)
+        rects = tree.generate_treemap((0, 0, 100, 90))
+
+        def fail(rect, strategy):
+            raise AssertionError('walked an unchanged tree')
+        for subtree in [tree] + tree._subtrees:
+            subtree._sub_rects = fail
+        self.assertEqual(tree.generate_treemap((0, 0, 100, 90)), rects)
+
+    def test_find_leaf_expands_folder(self):
+        tree = LazyFileSystemTree(EXAMPLE_PATH, 10 ** 9)
+        leaf = tree.find_leaf((0, 0, 100, 100), (50, 50))
+        self.assertTrue(leaf._root.endswith('.txt'))
+        self.assertEqual(tree.data_size, 40)
+
+
+class CompactTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = FileSystemTree('TestFolder')
+        self.compact = compact_from_tree(self.tree).root()
+
+    def test_scan(self):
+        self.assertEqual(_tree_shape(compact_scan('TestFolder').root()),
+                         _tree_shape(self.tree))
+
+    def test_generate_treemap(self):
+        for rect in [(0, 0, 1100, 900), (5, 7, 333, 901), (0, 0, 17, 3)]:
+            self.assertEqual(self.compact.generate_treemap(rect),
+                             self.tree.generate_treemap(rect))
+
+    def test_same_arguments(self):
+        rect = (0, 0, 300, 200)
+        changed = []
+        tree_map = self.compact.generate_treemap(rect, changed,
+                                                 squarify_rect, 500)
+        self.assertEqual(tree_map, self.tree.generate_treemap(
+            rect, None, squarify_rect, 500))
+        self.assertEqual([leaf_rect for _, leaf_rect in changed],
+                         [leaf_rect for leaf_rect, _ in tree_map])
+
+    def test_find_leaf(self):
+        rect = (0, 0, 1100, 900)
+        for point in [(0, 0), (1090, 50), (90, 800), (550, 450)]:
+            leaf = self.tree.find_leaf(rect, point)
+            compact_leaf = self.compact.find_leaf(rect, point)
+            self.assertEqual(compact_leaf.get_separator(),
+                             leaf.get_separator())
+            self.assertEqual(compact_leaf.colour, leaf.colour)
+
+    def test_find_leaf_in_empty_folder(self):
+        root = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(root, 'empty'))
+            os.mkdir(os.path.join(root, 'zero'))
+            _write_file(os.path.join(root, 'zero', 'zero.txt'), '')
+            rect = (0, 0, 100, 100)
+            tree = FileSystemTree(root)
+            compact = compact_scan(root).root()
+            for point in [(0, 0), (50, 50)]:
+                self.assertIsNone(tree.find_leaf(rect, point))
+                self.assertIsNone(compact.find_leaf(rect, point))
+            self.assertIsNone(compact_from_tree(
+                tree._subtrees[0]).root().find_leaf(rect, (50, 50)))
+        finally:
+            shutil.rmtree(root)
+
+    def test_mutate_and_delete(self):
+        rect = (0, 0, 1100, 900)
+        leaf = self.tree.find_leaf(rect, (1090, 50))
+        compact_leaf = self.compact.find_leaf(rect, (1090, 50))
+        for _ in range(3):
+            leaf.mutate_size('increase')
+            compact_leaf.mutate_size('increase')
+        self.assertEqual(compact_leaf.data_size, leaf.data_size)
+        self.assertEqual(self.compact.data_size, self.tree.data_size)
+        leaf.delete_selected_leaf()
+        compact_leaf.delete_selected_leaf()
+        self.assertEqual(_tree_shape(self.compact), _tree_shape(self.tree))
+        self.assertEqual(self.compact.generate_treemap(rect),
+                         self.tree.generate_treemap(rect))
+
+
+class ManifestTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.root, 'manifest')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write_manifest(self, path, files_only=False, compress=False):
+        """Write a manifest of <path> in the order find lists it."""
+        records = []
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            if os.path.isdir(current):
+                if not files_only:
+                    records.append('4096 ' + current)
+                names = os.listdir(current)
+                stack.extend(os.path.join(current, name)
+                             for name in reversed(names))
+            else:
+                records.append('{} {}'.format(os.path.getsize(current),
+                                              current))
+        data = ''.join(record + '\0' for record in records).encode()
+        if compress:
+            data = gzip.compress(data)
+        with open(self.manifest, 'wb') as file:
+            file.write(data)
+
+    def test_same_tree_as_constructor(self):
+        for path in [EXAMPLE_PATH, 'TestFolder']:
+            for compress in [False, True]:
+                self._write_manifest(path, compress=compress)
+                self.assertEqual(_tree_shape(tree_from_manifest(self.manifest)),
+                                 _tree_shape(FileSystemTree(path)))
+
+    def test_files_only(self):
+        self._write_manifest('TestFolder', files_only=True)
+        tree = tree_from_manifest(self.manifest, root='TestFolder')
+        self.assertEqual(_tree_shape(tree),
+                         _tree_shape(FileSystemTree('TestFolder')))
+
+    @unittest.skipUnless(shutil.which('find'), 'needs find')
+    def test_find_output(self):
+        with open(self.manifest, 'wb') as file:
+            subprocess.check_call(['find', EXAMPLE_PATH, '-printf', '%s %p\\0'],
+                                  stdout=file)
+        tree = tree_from_manifest(self.manifest)
+        self.assertEqual(tree.data_size, FileSystemTree(EXAMPLE_PATH).data_size)
+        self.assertEqual(len(tree._subtrees), 2)
+
+    def test_root_folder(self):
+        with open(self.manifest, 'wb') as file:
+            file.write(b'0 /\x000 /data\x003 /data/a\x005 /b\x00')
+        for root in [None, '/']:
+            tree = tree_from_manifest(self.manifest, root=root)
+            # As for FileSystemTree('/'), the root folder's name is empty.
+            self.assertEqual(_tree_shape(tree),
+                             ('', 8, (('data', 3, (('a', 3, ()),)),
+                                       ('b', 5, ()))))
+
+    def test_record_outside_root(self):
+        with open(self.manifest, 'wb') as file:
+            file.write(b'0 data\x003 data/a\x005 other/b\x00')
+        with self.assertRaises(ValueError):
+            tree_from_manifest(self.manifest)
+
+
+class BudgetScanTest(unittest.TestCase):
+    def _count_nodes(self, tree):
+        count = 0
+        stack = list(tree._subtrees)
+        while stack:
+            subtree = stack.pop()
+            count += 1
+            stack.extend(subtree._subtrees)
+        return count
+
+    def test_no_budget(self):
+        for path in [EXAMPLE_PATH, 'TestFolder']:
+            self.assertEqual(_tree_shape(scan_with_budget(path)),
+                             _tree_shape(FileSystemTree(path)))
+
+    def test_max_depth(self):
+        tree = scan_with_budget(EXAMPLE_PATH, max_depth=1)
+        folder = [subtree for subtree in tree._subtrees
+                  if subtree._root == 'A'][0]
+        self.assertIsInstance(folder, PlaceholderTree)
+        self.assertTrue(folder.is_estimated())
+        self.assertEqual(tree.data_size, sum(subtree.data_size
+                                             for subtree in tree._subtrees))
+
+    def test_known_sizes_are_exact(self):
+        known_sizes = {os.path.join(EXAMPLE_PATH, 'A'): 30}
+        tree = scan_with_budget(EXAMPLE_PATH, max_depth=1,
+                                known_sizes=known_sizes)
+        self.assertEqual(tree.data_size, 40)
+        for subtree in tree._subtrees:
+            self.assertFalse(isinstance(subtree, PlaceholderTree) and
+                             subtree.is_estimated())
+
+    def test_max_nodes(self):
+        root = tempfile.mkdtemp()
+        try:
+            for i in range(50):
+                _write_file(os.path.join(root, 'f{}.txt'.format(i)), 'xx')
+            tree = scan_with_budget(root, max_nodes=10)
+            self.assertEqual(self._count_nodes(tree), 10)
+            self.assertEqual(tree.data_size, 100)
+            other = tree._subtrees[-1]
+            self.assertEqual(other._root, OTHER_NAME)
+            self.assertFalse(other.is_estimated())
+        finally:
+            shutil.rmtree(root)
+
+    def test_max_seconds(self):
+        tree = scan_with_budget('TestFolder', max_seconds=0)
+        self.assertEqual(len(tree._subtrees), 3)
+        for subtree in tree._subtrees:
+            self.assertIsInstance(subtree, PlaceholderTree)
+            self.assertGreater(subtree.data_size, 0)
+
+
+class IterTreemapTest(unittest.TestCase):
+    @given(TREE_SHAPES, integers(min_value=1, max_value=1000),
+           integers(min_value=1, max_value=1000))
+    def test_same_as_slicing_algorithm(self, shape, width, height):
+        tree = _build_tree(shape)
+        rects = list(tree.iter_treemap((5, 7, width, height)))
+        tree.delete_empty_trees()
+        self.assertEqual(rects, _recursive_treemap(
+            tree, (5, 7, width, height)))
+
+    def test_tree_unchanged(self):
+        tree = _build_tree([[3, 0], 0, [0, 0], 5])
+        list(tree.iter_treemap((0, 0, 100, 100)))
+        self.assertEqual(len(tree._subtrees), 4)
+        self.assertEqual(len(tree._subtrees[0]._subtrees), 2)
+
+    @given(TREE_SHAPES)
+    def test_compact_tree(self, shape):
+        tree = _build_tree(shape)
+        compact = compact_from_tree(tree).root()
+        self.assertEqual(list(compact.iter_treemap((0, 0, 300, 200))),
+                         list(tree.iter_treemap((0, 0, 300, 200))))
+
+
+class LayoutCacheTest(unittest.TestCase):
+    def _leaves(self, tree):
+        leaves = []
+        stack = [tree]
+        while stack:
+            subtree = stack.pop()
+            if subtree._subtrees == []:
+                leaves.append(subtree)
+            stack.extend(subtree._subtrees)
+        return leaves
+
+    @given(TREE_SHAPES, lists(integers(min_value=0, max_value=1000),
+                              max_size=10))
+    def test_same_as_fresh_layout(self, shape, choices):
+        tree = _build_tree(shape)
+        rect = (0, 0, 400, 300)
+        for choice in choices:
+            tree.generate_treemap(rect)
+            leaves = [leaf for leaf in self._leaves(tree)
+                      if leaf._parent_tree is not None]
+            if leaves == []:
+                break
+            leaf = leaves[choice % len(leaves)]
+            if choice % 3 == 0:
+                leaf.delete_selected_leaf()
+            else:
+                leaf.mutate_size('increase' if choice % 3 == 1 else
+                                 'decrease')
+            self.assertEqual(tree.generate_treemap(rect),
+                             list(tree.iter_treemap(rect)))
+
+    def test_unchanged_subtree_reused(self):
+        tree = _build_tree([[10, 10], [10, 10], [100, 5]])
+        rect = (0, 0, 300, 100)
+        tree.generate_treemap(rect)
+        first = tree._subtrees[0]._layout
+        tree._subtrees[2]._subtrees[1].mutate_size('increase')
+        self.assertIsNone(tree._layout)
+        self.assertIsNone(tree._subtrees[2]._layout)
+        tree.generate_treemap(rect)
+        self.assertIs(tree._subtrees[0]._layout, first)
+
+    @given(TREE_SHAPES)
+    def test_cached_rects_bounded(self, shape):
+        tree = _build_tree(shape)
+        tree_map = tree.generate_treemap((0, 0, 400, 300))
+        kept = sum(len(subtree._layout[4]) for subtree in _preorder(tree)
+                   if subtree._layout is not None and
+                   subtree._layout[4] is not None)
+        self.assertLessEqual(
+            kept, len(tree_map) * (tree.data_size.bit_length() + 1))
+
+    def test_deep_tree_keeps_one_copy(self):
+        tree = AbstractTree('leaf', [], 1)
+        for _ in range(999):
+            tree = AbstractTree('node', [AbstractTree('leaf', [], 1), tree])
+        tree_map = tree.generate_treemap((0, 0, 400, 300))
+        self.assertEqual(tree._layout[4], tuple(tree_map))
+        self.assertTrue(all(subtree._layout is None or
+                            subtree._layout[4] is None
+                            for subtree in _preorder(tree)[1:]))
+
+    def test_inserted_subtree(self):
+        tree = _build_tree([[10, 10], 10])
+        rect = (0, 0, 300, 100)
+        tree.generate_treemap(rect)
+        tree._subtrees[0].insert_child(AbstractTree('new', [], 20))
+        self.assertEqual(tree.generate_treemap(rect),
+                         list(tree.iter_treemap(rect)))
+        self.assertEqual(len(tree.generate_treemap(rect)), 4)
+
+
+class TreemapIndexTest(unittest.TestCase):
+    def _leaf_rects(self, tree, rect):
+        """Return the rectangle of every leaf with an area in the treemap
+        of <tree>, computed without any cached layout."""
+        leaf_rects = {}
+        stack = [(tree, rect)]
+        while stack:
+            subtree, rect = stack.pop()
+            if subtree.data_size == 0 or rect[2] <= 0 or rect[3] <= 0:
+                continue
+            if subtree._subtrees == []:
+                leaf_rects[subtree] = rect
+            else:
+                stack.extend(subtree._sub_rects(rect))
+        return leaf_rects
+
+    @given(TREE_SHAPES, lists(integers(min_value=0, max_value=1000),
+                              max_size=10))
+    def test_incremental_updates(self, shape, choices):
+        tree = _build_tree(shape)
+        index = TreemapIndex(tree, 8)
+        rect = (0, 0, 120, 90)
+        index.generate_treemap(rect)
+        for choice in choices:
+            leaves = list(index._rects)
+            if leaves == []:
+                break
+            leaf = leaves[choice % len(leaves)]
+            if choice % 2 == 0 and leaf._parent_tree is not None:
+                leaf.delete_selected_leaf()
+            else:
+                leaf.mutate_size('increase')
+            index.generate_treemap(rect)
+            expected = self._leaf_rects(tree, rect)
+            self.assertEqual(index._rects, expected)
+            for leaf, (x, y, width, height) in expected.items():
+                self.assertIs(index.leaf_at((x, y)), leaf)
+                self.assertIs(index.leaf_at((x + width - 1,
+                                             y + height - 1)), leaf)
+
+    def test_leaves_in(self):
+        tree = _build_tree([[10, 10], [10, 10]])
+        index = TreemapIndex(tree)
+        index.generate_treemap((0, 0, 200, 100))
+        self.assertEqual(len(index.leaves_in((0, 0, 200, 100))), 4)
+        self.assertEqual(index.leaves_in((0, 0, 10, 10)),
+                         [tree._subtrees[0]._subtrees[0]])
+        self.assertEqual(index.leaves_in((500, 500, 10, 10)), [])
+
+    def test_find_leaf_same_as_tree(self):
+        tree = FileSystemTree(EXAMPLE_PATH)
+        index = TreemapIndex(tree)
+        rect = (0, 0, 800, 1000)
+        index.generate_treemap(rect)
+        for point in [(10, 10), (450, 300), (700, 10), (300, 900)]:
+            self.assertIs(index.find_leaf(rect, point),
+                          tree.find_leaf(rect, point))
+
+    def test_rebuilt_after_outside_layout(self):
+        tree = _build_tree([10, 10])
+        index = TreemapIndex(tree)
+        index.generate_treemap((0, 0, 100, 100))
+        tree.generate_treemap((0, 0, 50, 50))
+        index.generate_treemap((0, 0, 100, 100))
+        self.assertIs(index.leaf_at((5, 80)), tree._subtrees[1])
+
+    def _assert_indexed(self, index, tree, rect):
+        expected = self._leaf_rects(tree, rect)
+        self.assertEqual(index._rects, expected)
+        for leaf, (x, y, _, _) in expected.items():
+            self.assertIs(index.find_leaf(rect, (x, y)), leaf)
+
+    def test_resize_then_find(self):
+        # The small subtree is drawn in the same rectangle at both sizes.
+        tree = _build_tree([[5, 5], 1000])
+        index = TreemapIndex(tree)
+        index.generate_treemap((0, 0, 800, 600))
+        index.generate_treemap((0, 0, 801, 600))
+        self._assert_indexed(index, tree, (0, 0, 801, 600))
+
+    def test_relayout_then_find(self):
+        tree = _build_tree([[10, 10], 20])
+        index = TreemapIndex(tree)
+        rect = (0, 0, 100, 100)
+        index.generate_treemap(rect)
+        # Lay the first subtree out where it is drawn once the second one
+        # has grown.
+        tree._subtrees[0].generate_treemap((0, 0, 100, 25))
+        grown = tree._subtrees[1]
+        grown.data_size += 40
+        grown.update_data_size(40)
+        index.generate_treemap(rect)
+        self._assert_indexed(index, tree, rect)
+
+    def test_zoom_in_again(self):
+        # The folder has no area in the whole tree's treemap.
+        tree = _build_tree([[[1, 1], 1], 100000])
+        folder = tree._subtrees[0]
+        rect = (0, 0, 100, 100)
+        root_index = TreemapIndex(tree, min_area=1)
+        root_index.generate_treemap(rect)
+        TreemapIndex(folder, min_area=1).generate_treemap(rect)
+        root_index.generate_treemap(rect)
+        index = TreemapIndex(folder, min_area=1)
+        index.generate_treemap(rect)
+        self._assert_indexed(index, folder, rect)
+
+    def test_undone_delete_indexed(self):
+        tree = FileSystemTree('TestFolder')
+        index = TreemapIndex(tree, min_area=1)
+        journal = EditJournal(tree)
+        rect = (0, 0, 1100, 900)
+        index.generate_treemap(rect)
+        expected = self._leaf_rects(tree, rect)
+        journal.delete_selected_leaf(tree._subtrees[-1])
+        index.generate_treemap(rect)
+        journal.undo()
+        index.generate_treemap(rect)
+        self.assertEqual(index._rects, expected)
+        self._assert_indexed(index, tree, rect)
+
+
+class SquarifyTest(unittest.TestCase):
+    @given(lists(integers(min_value=0, max_value=1000), min_size=1,
+                 max_size=30),
+           integers(min_value=0, max_value=500),
+           integers(min_value=0, max_value=500))
+    def test_tiles_rect(self, sizes, width, height):
+        if sum(sizes) == 0:
+            return
+        rects = squarify_rect((3, 4, width, height), sizes, sum(sizes))
+        self.assertEqual(len(rects), len(sizes))
+        self.assertEqual(sum(w * h for _, _, w, h in rects), width * height)
+        for size, (x, y, w, h) in zip(sizes, rects):
+            self.assertGreaterEqual(w, 0)
+            self.assertGreaterEqual(h, 0)
+            self.assertTrue(3 <= x and x + w <= 3 + width)
+            self.assertTrue(4 <= y and y + h <= 4 + height)
+            if size == 0:
+                self.assertEqual(w * h, 0)
+
+    @given(TREE_SHAPES)
+    def test_find_leaf_matches_layout(self, shape):
+        tree = _build_tree(shape)
+        rect = (0, 0, 400, 300)
+        changed = []
+        tree.generate_treemap(rect, changed, squarify_rect)
+        for leaf, (x, y, width, height) in changed:
+            if width > 2 and height > 2:
+                point = x + width // 2, y + height // 2
+                self.assertIs(tree.find_leaf(rect, point, squarify_rect),
+                              leaf)
+
+    def test_same_as_iter_treemap(self):
+        tree = _build_tree([[5, 1, 30], 7, [2, 2, 2, 90], 12])
+        rect = (0, 0, 640, 480)
+        self.assertEqual(tree.generate_treemap(rect, None, squarify_rect),
+                         list(tree.iter_treemap(rect, squarify_rect)))
+
+    def test_order_sorted_once(self):
+        tree = _build_tree([3, 9, 1, 5])
+        tree.generate_treemap((0, 0, 100, 100), None, squarify_rect)
+        order = tree._order
+        self.assertEqual(order, [1, 3, 0, 2])
+        tree.find_leaf((0, 0, 100, 100), (50, 50), squarify_rect)
+        self.assertIs(tree._order, order)
+        tree._subtrees[2].mutate_size('increase')
+        self.assertIsNone(tree._order)
+
+    def test_squarer_than_slices(self):
+        tree = _build_tree([[10] * 200, [20] * 100])
+        rect = (0, 0, 1000, 700)
+
+        def mean_ratio(strategy):
+            ratios = [max(w / h, h / w) for (_, _, w, h), _ in
+                      tree.iter_treemap(rect, strategy) if w > 0 and h > 0]
+            return sum(ratios) / len(ratios)
+        self.assertLess(mean_ratio(squarify_rect), 2)
+        self.assertGreater(mean_ratio(None), 50)
+
+
+class LevelOfDetailTest(unittest.TestCase):
+    def test_small_subtree_not_divided(self):
+        tree = _build_tree([[1] * 50, 50])
+        small = tree._subtrees[0]
+        rects = tree.generate_treemap((0, 0, 20, 10), None, None, 150)
+        self.assertEqual(rects, [((0, 0, 10, 10), small.colour),
+                                 ((10, 0, 10, 10),
+                                  tree._subtrees[1].colour)])
+
+    def test_no_area_left_out(self):
+        tree = _build_tree([[1, 1], 1000])
+        rects = tree.generate_treemap((0, 0, 100, 10), None, None, 1)
+        self.assertEqual(rects, [((0, 0, 100, 10),
+                                  tree._subtrees[1].colour)])
+
+    @given(TREE_SHAPES, integers(min_value=0, max_value=2000))
+    def test_same_as_iter_treemap(self, shape, min_area):
+        tree = _build_tree(shape)
+        rect = (0, 0, 400, 300)
+        expected = list(tree.iter_treemap(rect, None, min_area))
+        self.assertEqual(tree.generate_treemap(rect, None, None, min_area),
+                         expected)
+        compact = compact_from_tree(tree).root()
+        self.assertEqual([rect for rect, _ in compact.iter_treemap(
+            rect, None, min_area)], [rect for rect, _ in expected])
+
+    def test_cached_layout_not_reused(self):
+        tree = _build_tree([[1] * 20, [1] * 20])
+        rect = (0, 0, 100, 100)
+        self.assertEqual(len(tree.generate_treemap(rect, None, None, 0)), 40)
+        self.assertEqual(len(tree.generate_treemap(rect, None, None, 10 ** 4)),
+                         2)
+        self.assertEqual(len(tree.generate_treemap(rect)), 40)
+
+    def test_index_finds_leaf_inside(self):
+        tree = _build_tree([[1] * 50, 50])
+        rect = (0, 0, 100, 100)
+        index = TreemapIndex(tree, min_area=10 ** 4)
+        self.assertEqual(len(index.generate_treemap(rect)), 2)
+        self.assertIs(index.find_leaf(rect, (10, 30)),
+                      tree.find_leaf(rect, (10, 30)))
+        self.assertIs(index.find_leaf(rect, (10, 30))._parent_tree,
+                      tree._subtrees[0])
+
+
+class PureLayoutTest(unittest.TestCase):
+    def test_empty_subtrees_kept(self):
+        tree = _build_tree([[0, 5], 0, 10])
+        rects = tree.generate_treemap((0, 0, 150, 100))
+        self.assertEqual([rect for rect, _ in rects],
+                         [(0, 0, 50, 100), (50, 0, 100, 100)])
+        self.assertEqual(len(tree._subtrees), 3)
+        self.assertEqual(len(tree._subtrees[0]._subtrees), 2)
+        tree.delete_empty_trees()
+        self.assertEqual(len(tree._subtrees), 2)
+        self.assertEqual(tree.generate_treemap((0, 0, 150, 100)), rects)
+
+    def test_threads_same_as_serial(self):
+        tree = _build_tree([[3] * 40, [[1, 2, 0] * 20, 7], 0, [5] * 30])
+        rects = [(0, 0, 400 + i, 300 - i) for i in range(16)]
+        expected = [list(tree.iter_treemap(rect, squarify_rect))
+                    for rect in rects]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(
+                lambda rect: tree.generate_treemap(rect, None,
+                                                   squarify_rect),
+                rects))
+        self.assertEqual(results, expected)
+
+    def test_snapshot(self):
+        tree = _build_tree([[3, 1, 0], [8, [2, 2]], 4])
+        rect = (0, 0, 300, 200)
+        expected = tree.generate_treemap(rect, None, squarify_rect)
+        snapshot = pickle.loads(pickle.dumps(compact_from_tree(tree)))
+        tree._subtrees[0]._subtrees[0].mutate_size('increase')
+        tree._subtrees[2].delete_selected_leaf()
+        self.assertEqual(snapshot.root().generate_treemap(rect, None,
+                                                          squarify_rect),
+                         expected)
+
+
+class ParallelLayoutTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = _build_tree([[3] * 30, [[1, 2, 0] * 10, 7, [4, 4]], 0,
+                                 [5] * 20, 9])
+        self.rect = (0, 0, 640, 480)
+
+    def test_same_as_serial(self):
+        for split_depth in range(4):
+            self.assertEqual(parallel_treemap(self.tree, self.rect,
+                                              split_depth, 2),
+                             self.tree.generate_treemap(self.rect))
+
+    def test_strategy_and_min_area(self):
+        self.assertEqual(parallel_treemap(self.tree, self.rect, 1, 3,
+                                          squarify_rect, 500),
+                         self.tree.generate_treemap(self.rect, None,
+                                                    squarify_rect, 500))
+
+    def test_compact_node(self):
+        node = compact_from_tree(self.tree).root()._subtrees[1]
+        self.assertEqual(parallel_treemap(node, self.rect, 1, 2),
+                         node.generate_treemap(self.rect))
+
+
+def _linear_slice(rect, sizes, total, sorted_order=None):
+    """Lay out like slice_rect, but without letting find_leaf know it, so
+    that find_leaf checks every slice in turn.
+    """
+    return slice_rect(rect, sizes, total, sorted_order)
+
+
+class SliceOffsetsTest(unittest.TestCase):
+    @given(TREE_SHAPES, integers(min_value=-5, max_value=405),
+           integers(min_value=-5, max_value=305))
+    def test_same_as_linear_search(self, shape, x, y):
+        tree = _build_tree(shape)
+        if tree.data_size == 0:
+            return
+        for rect in [(0, 0, 400, 300), (0, 0, 300, 400)]:
+            self.assertIs(tree.find_leaf(rect, (x, y)),
+                          tree.find_leaf(rect, (x, y), _linear_slice))
+
+    def test_edges_and_empty_slices(self):
+        tree = _build_tree([10, 0, 0, 10, 0])
+        rect = (0, 0, 100, 10)
+        for x in [0, 49, 50, 51, 100]:
+            self.assertIs(tree.find_leaf(rect, (x, 5)),
+                          tree.find_leaf(rect, (x, 5), _linear_slice))
+        self.assertIsNone(tree.find_leaf(rect, (101, 5)))
+
+    def test_kept_up_to_date(self):
+        tree = _build_tree([[10, 10], 20])
+        rect = (0, 0, 400, 100)
+        first = tree._subtrees[0]._subtrees[0]
+        self.assertIs(tree.find_leaf(rect, (150, 50)),
+                      tree._subtrees[0]._subtrees[1])
+        first.mutate_size('increase')
+        self.assertIsNone(tree._offsets)
+        self.assertIs(tree.find_leaf(rect, (150, 50)),
+                      tree.find_leaf(rect, (150, 50), _linear_slice))
+        tree._subtrees[0].delete_child(first)
+        self.assertIs(tree.find_leaf(rect, (50, 50)),
+                      tree._subtrees[0]._subtrees[0])
+        tree._subtrees[1].update_data_size(0)
+        tree.insert_child(AbstractTree('new', [], 60), 0)
+        self.assertEqual(tree.find_leaf(rect, (50, 50))._root, 'new')
+
+
+def _preorder(tree):
+    """Return the trees in <tree>, each before the trees inside it.
+
+    @type tree: AbstractTree
+    @rtype: list[AbstractTree]
+    """
+    trees = []
+    stack = [tree]
+    while stack:
+        tree = stack.pop()
+        trees.append(tree)
+        stack.extend(reversed(tree._subtrees))
+    return trees
+
+
+class BatchDeleteTest(unittest.TestCase):
+    @given(TREE_SHAPES, lists(integers(min_value=1, max_value=1000),
+                              max_size=20))
+    def test_same_as_one_at_a_time(self, shape, choices):
+        tree = _build_tree(shape)
+        expected = _build_tree(shape)
+        trees = _preorder(tree)
+        if len(trees) == 1:
+            return
+        chosen = sorted({choice % (len(trees) - 1) + 1
+                         for choice in choices})
+        tree.delete_subtrees([trees[i] for i in chosen])
+        expected_trees = _preorder(expected)
+        # Trees inside other chosen trees are deleted first, so that no
+        # size is taken away twice.
+        for i in reversed(chosen):
+            expected_trees[i].delete_selected_leaf()
+        self.assertEqual(_tree_shape(tree), _tree_shape(expected))
+
+    def test_self_deleted(self):
+        tree = _build_tree([[2, 4], 8])
+        folder = tree._subtrees[0]
+        folder.delete_subtrees([folder, folder._subtrees[0]])
+        self.assertEqual(tree.data_size, 8)
+        self.assertEqual(len(tree._subtrees), 1)
+        root = _build_tree([2, 4])
+        root.delete_subtrees([root, root._subtrees[0]])
+        self.assertEqual(root.data_size, 0)
+
+    def test_layout_updated(self):
+        tree = _build_tree([[10, 10, 10], [10, 10], 10])
+        rect = (0, 0, 600, 100)
+        tree.generate_treemap(rect)
+        leaves = [tree._subtrees[0]._subtrees[1], tree._subtrees[1],
+                  tree._subtrees[2]]
+        tree.delete_subtrees(leaves)
+        self.assertEqual(tree.data_size, 20)
+        self.assertEqual(tree.generate_treemap(rect),
+                         list(tree.iter_treemap(rect)))
+        self.assertEqual(len(tree.generate_treemap(rect)), 2)
+
+    def test_index_drag_selection(self):
+        tree = _build_tree([[1] * 100, [1] * 100])
+        rect = (0, 0, 200, 50)
+        index = TreemapIndex(tree)
+        index.generate_treemap(rect)
+        tree.delete_subtrees(index.leaves_in((50, 0, 100, 50)))
+        self.assertEqual(tree.data_size, 100)
+        self.assertEqual(len(index.generate_treemap(rect)), 100)
+
+
+def _leaf_sizes(tree):
+    """Return the shape of <tree>, as taken by _build_tree, with the size of
+    each leaf read from the leaf itself.
+
+    @type tree: AbstractTree
+    @rtype: int | list
+    """
+    if tree._subtrees == []:
+        return tree.data_size
+    return [_leaf_sizes(subtree) for subtree in tree._subtrees]
+
+
+def _rects(tree_map):
+    """Return the rectangles of <tree_map> without their colours.
+
+    @type tree_map: list[((int, int, int, int), (int, int, int))]
+    @rtype: list[(int, int, int, int)]
+    """
+    return [rect for rect, _ in tree_map]
+
+
+class DeferredSizeTest(unittest.TestCase):
+    @given(TREE_SHAPES, lists(integers(min_value=0, max_value=1000),
+                              max_size=30))
+    def test_same_as_fresh_tree(self, shape, choices):
+        tree = _build_tree(shape)
+        rect = (0, 0, 400, 300)
+        for choice in choices:
+            trees = _preorder(tree)
+            node = trees[choice % len(trees)]
+            if choice % 5 == 0:
+                node.data_size
+            elif choice % 5 == 1:
+                node.generate_treemap(rect)
+            elif node._subtrees:
+                node.insert_child(AbstractTree('new', [], choice))
+            elif node._parent_tree is not None and choice % 5 == 2:
+                node.delete_selected_leaf()
+            else:
+                node.mutate_size('increase' if choice % 2 else 'decrease')
+        for node in _preorder(tree):
+            if node._subtrees:
+                self.assertEqual(node.data_size, sum(
+                    subtree.data_size for subtree in node._subtrees))
+        expected = _build_tree(_leaf_sizes(tree))
+        self.assertEqual(_rects(tree.generate_treemap(rect)),
+                         _rects(expected.generate_treemap(rect)))
+
+    def test_changes_share_one_pass(self):
+        leaves = [AbstractTree('leaf', [], 100) for _ in range(3)]
+        folder = AbstractTree('folder', leaves)
+        tree = AbstractTree('top', [AbstractTree('middle', [folder])])
+        leaves[0].mutate_size('increase')
+        self.assertEqual(tree._data_size, 300)
+        self.assertIsNotNone(tree._dirty)
+        # The path above the folder is already marked, so later changes
+        # stop there.
+        for leaf in leaves:
+            leaf.mutate_size('increase')
+            self.assertEqual(len(tree._dirty), 1)
+        self.assertEqual(folder._dirty, set(leaves))
+        self.assertEqual(folder.data_size, 305)
+        self.assertEqual(tree.data_size, 305)
+        self.assertIsNone(tree._dirty)
+
+    def test_zoomed_layout_updated(self):
+        tree = _build_tree([[10, [10, 10]], [10, 10]])
+        rect = (0, 0, 300, 100)
+        folder = tree._subtrees[0]
+        leaf = folder._subtrees[1]._subtrees[0]
+        tree.generate_treemap(rect)
+        leaf.mutate_size('increase')
+        folder.generate_treemap(rect)
+        leaf.mutate_size('increase')
+        self.assertEqual(folder.generate_treemap(rect),
+                         list(folder.iter_treemap(rect)))
+        self.assertEqual(tree.generate_treemap(rect),
+                         list(tree.iter_treemap(rect)))
+        self.assertEqual(tree.data_size, 52)
+
+    def test_threads_read_changed_tree(self):
+        tree = _build_tree([[[1] * 50] * 20] * 20)
+        for leaf in _preorder(tree)[::7]:
+            if leaf._subtrees == []:
+                leaf.mutate_size('increase')
+        expected = _build_tree(_leaf_sizes(tree))
+        rect = (0, 0, 800, 600)
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(tree.generate_treemap, [rect] * 4))
+        for result in results:
+            self.assertEqual(_rects(result),
+                             _rects(expected.generate_treemap(rect)))
+
+
+def _state(tree):
+    """Return every tree in <tree>, in order, with its data_size.
+
+    @type tree: AbstractTree
+    @rtype: list[(AbstractTree, int)]
+    """
+    return [(subtree, subtree.data_size) for subtree in _preorder(tree)]
+
+
+class EditJournalTest(unittest.TestCase):
+    @given(TREE_SHAPES, lists(lists(integers(min_value=0, max_value=1000),
+                                    min_size=1, max_size=4), max_size=10))
+    def test_undo_and_redo_everything(self, shape, edits):
+        tree = _build_tree(shape)
+        rect = (0, 0, 400, 300)
+        journal = EditJournal(tree)
+        states = [_state(tree)]
+        for choices in edits:
+            trees = _preorder(tree)[1:]
+            if trees == []:
+                break
+            chosen = [trees[choice % len(trees)] for choice in choices]
+            tree.generate_treemap(rect)
+            if choices[0] % 3 == 0 and chosen[0]._subtrees == []:
+                journal.mutate_size(chosen[0], 'increase')
+            elif len(chosen) == 1:
+                journal.delete_selected_leaf(chosen[0])
+            else:
+                journal.delete_subtrees(chosen)
+            # Resizing a tree with a data_size of 0 changes nothing, and is
+            # not recorded.
+            if _state(tree) != states[-1]:
+                states.append(_state(tree))
+        for state in reversed(states[:-1]):
+            tree.generate_treemap(rect)
+            self.assertTrue(journal.undo())
+            self.assertEqual(_state(tree), state)
+            self.assertEqual(tree.generate_treemap(rect),
+                             list(tree.iter_treemap(rect)))
+        self.assertFalse(journal.undo())
+        for state in states[1:]:
+            self.assertTrue(journal.redo())
+            self.assertEqual(_state(tree), state)
+        self.assertFalse(journal.redo())
+
+    def test_new_edit_drops_redo(self):
+        leaves = [AbstractTree('leaf', [], 10) for _ in range(3)]
+        tree = AbstractTree('node', leaves)
+        journal = EditJournal(tree)
+        journal.delete_selected_leaf(leaves[1])
+        journal.undo()
+        journal.mutate_size(leaves[1], 'decrease')
+        self.assertFalse(journal.redo())
+        self.assertEqual(tree._subtrees, leaves)
+        self.assertEqual(tree.data_size, 29)
+
+    def test_whole_tree_deleted(self):
+        leaves = [AbstractTree('leaf', [], 10) for _ in range(3)]
+        tree = AbstractTree('node', leaves)
+        journal = EditJournal(tree)
+        journal.delete_subtrees([tree, leaves[0]])
+        self.assertEqual(tree.data_size, 0)
+        self.assertEqual(tree._subtrees, leaves)
+        journal.undo()
+        self.assertEqual(tree.data_size, 30)
+
+
+# Names for the subtrees of a folder, some of them prefixes of others.
+_NAMES = ['a', 'ab', 'abc', 'b', 'ba']
+
+
+def _build_file_tree(shape, name='top'):
+    """Return a FileSystemTree with the shape <shape>, as for _build_tree,
+    whose subtrees are named after their positions.
+
+    @type shape: int | list
+    @type name: str
+    @rtype: FileSystemTree
+    """
+    if isinstance(shape, int):
+        return FileSystemTree(name, [], shape)
+    return FileSystemTree(name, [
+        _build_file_tree(child, _NAMES[i % 5] + str(i // 5) * (i >= 5))
+        for i, child in enumerate(shape)])
+
+
+class PathIndexTest(unittest.TestCase):
+    @given(TREE_SHAPES, text('ab0' + os.sep, max_size=12))
+    def test_same_as_every_path(self, shape, prefix):
+        tree = _build_file_tree(shape)
+        index = PathIndex(tree)
+        trees = _preorder(tree)
+        self.assertEqual(len(index), len(trees))
+        for subtree in trees:
+            self.assertIs(index.find(subtree.get_separator()), subtree)
+        prefix = os.path.join('top', prefix)
+        self.assertEqual(index.with_prefix(prefix),
+                         [(subtree.get_separator(), subtree)
+                          for subtree in trees
+                          if subtree.get_separator().startswith(prefix)])
+
+    @given(TREE_SHAPES, lists(integers(min_value=0, max_value=1000),
+                              max_size=10))
+    def test_kept_in_sync_by_journal(self, shape, choices):
+        tree = _build_file_tree(shape)
+        index = PathIndex(tree)
+        journal = EditJournal(tree, index)
+        for choice in choices:
+            trees = _preorder(tree)[1:]
+            if choice % 4 == 0 or trees == []:
+                journal.undo()
+            elif choice % 4 == 1:
+                journal.redo()
+            else:
+                journal.delete_selected_leaf(trees[choice % len(trees)])
+            self.assertEqual(index._nodes, PathIndex(tree)._nodes)
+
+    def test_moved_tree_gets_new_path(self):
+        tree = _build_file_tree([[[1, 2]], [3]])
+        leaf = tree._subtrees[0]._subtrees[0]._subtrees[1]
+        moved = tree._subtrees[0]._subtrees[0]
+        self.assertEqual(leaf.get_separator(),
+                         os.path.join('top', 'a', 'a', 'ab'))
+        moved.delete_selected_leaf()
+        tree._subtrees[1].insert_child(moved)
+        self.assertEqual(leaf.get_separator(),
+                         os.path.join('top', 'ab', 'a', 'ab'))
+        self.assertIs(leaf.get_separator(), leaf.get_separator())
+
+
+def _file_sizes(tree):
+    """Return the size of every file in <tree>, by its path.
+
+    @type tree: FileSystemTree
+    @rtype: dict[str, int]
+    """
+    return {subtree.get_separator(): subtree.data_size
+            for subtree in _preorder(tree)[1:] if subtree._subtrees == []}
+
+
+def _file_changes(diff):
+    """Return the status and size_change of every file in <diff>, by its
+    path.
+
+    @type diff: DiffTree
+    @rtype: dict[str, (str, int)]
+    """
+    return {subtree.get_separator(): (subtree.status, subtree.size_change)
+            for subtree in _preorder(diff)[1:] if subtree._subtrees == []}
+
+
+class TreeDiffTest(unittest.TestCase):
+    @given(TREE_SHAPES, TREE_SHAPES)
+    def test_same_as_every_path(self, old_shape, new_shape):
+        old = _build_file_tree([old_shape])
+        new = _build_file_tree([new_shape])
+        diff = diff_trees(old, new)
+        old_sizes = _file_sizes(old)
+        new_sizes = _file_sizes(new)
+        expected = {}
+        for path, size in new_sizes.items():
+            if path not in old_sizes:
+                expected[path] = ADDED, size
+            elif old_sizes[path] != size:
+                expected[path] = CHANGED, size - old_sizes[path]
+        for path, size in old_sizes.items():
+            if path not in new_sizes:
+                expected[path] = REMOVED, -size
+        self.assertEqual(_file_changes(diff), expected)
+        self.assertEqual(diff.size_change, new.data_size - old.data_size)
+        for subtree in _preorder(diff):
+            if subtree._subtrees:
+                self.assertEqual(subtree.data_size, sum(
+                    abs(leaf.size_change) for leaf in _preorder(subtree)
+                    if leaf._subtrees == []))
+
+    def test_snapshots(self):
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, 'data')
+            shutil.copytree(EXAMPLE_PATH, path)
+            os.mkdir(os.path.join(path, 'gone'))
+            _write_file(os.path.join(path, 'gone', 'x.txt'), 'x' * 3)
+            old_snapshot = os.path.join(root, 'old.snapshot')
+            new_snapshot = os.path.join(root, 'new.snapshot')
+            old = scan_with_snapshot(path, old_snapshot)
+            _write_file(os.path.join(path, 'A', 'f1.txt'), 'x' * 100)
+            _write_file(os.path.join(path, 'new.txt'), 'x' * 5)
+            os.remove(os.path.join(path, 'f4.txt'))
+            shutil.rmtree(os.path.join(path, 'gone'))
+            os.makedirs(os.path.join(path, 'D', 'E'))
+            _write_file(os.path.join(path, 'D', 'E', 'g.txt'), 'x' * 7)
+            new = scan_with_snapshot(path, new_snapshot)
+            diff = diff_snapshots(old_snapshot, new_snapshot)
+            self.assertEqual(_file_changes(diff),
+                             _file_changes(diff_trees(old, new)))
+            self.assertEqual(diff.size_change, new.data_size - old.data_size)
+            statuses = {subtree._root: subtree.status
+                        for subtree in diff._subtrees}
+            self.assertEqual(statuses, {'new.txt': ADDED, 'f4.txt': REMOVED,
+                                        'A': CHANGED, 'D': ADDED,
+                                        'gone': REMOVED})
+        finally:
+            shutil.rmtree(root)
+
+    def test_nothing_changed(self):
+        tree = _build_file_tree([[1, 2], 3])
+        diff = diff_trees(tree, _build_file_tree([[1, 2], 3]))
+        self.assertEqual(diff._subtrees, [])
+        self.assertEqual(diff.data_size, 0)
+
+
+def _depths(tree):
+    """Return each tree in <tree> with the number of trees between it and
+    <tree>, each before the trees inside it.
+
+    @type tree: AbstractTree
+    @rtype: list[(AbstractTree, int)]
+    """
+    found = []
+    stack = [(tree, 0)]
+    while stack:
+        tree, depth = stack.pop()
+        found.append((tree, depth))
+        for subtree in reversed(tree._subtrees):
+            stack.append((subtree, depth + 1))
+    return found
+
+
+class LargestTest(unittest.TestCase):
+    @given(TREE_SHAPES, integers(min_value=0, max_value=6),
+           integers(min_value=0, max_value=3),
+           integers(min_value=0, max_value=4) | just(None),
+           text('ab*?', max_size=3) | just(None))
+    def test_same_as_sorting(self, shape, k, min_depth, max_depth, pattern):
+        tree = _build_file_tree([shape])
+        for leaves in [True, False]:
+            if leaves:
+                found = tree.largest_leaves(k, min_depth, max_depth, pattern)
+            else:
+                found = tree.largest_internal_trees(k, min_depth, max_depth,
+                                                    pattern)
+            matches = [node for node, depth in _depths(tree)
+                       if (node._subtrees == []) == leaves and
+                       depth >= min_depth and
+                       (max_depth is None or depth <= max_depth) and
+                       (pattern is None or fnmatch(node._root, pattern))]
+            self.assertEqual(len(set(found)), len(found))
+            self.assertTrue(all(node in matches for node in found))
+            self.assertEqual(
+                [node.data_size for node in found],
+                sorted([node.data_size for node in matches],
+                       reverse=True)[:k])
+
+    def test_after_resize(self):
+        tree = _build_file_tree([[1, 2], [3, [4]]])
+        leaf = tree._subtrees[0]._subtrees[0]
+        leaf.data_size += 10
+        leaf.update_data_size(10)
+        self.assertEqual(tree.largest_leaves(1), [leaf])
+        self.assertEqual(tree.largest_internal_trees(2, 1),
+                         [tree._subtrees[0], tree._subtrees[1]])
+
+    def test_size_report(self):
+        report = size_report(scan_file_system(EXAMPLE_PATH), 1)
+        self.assertEqual(report.splitlines(), [
+            'Largest 1 files:',
+            '{:>12}  {}'.format(15, os.path.join('B', 'A', 'f1.txt')),
+            'Largest 1 folders:',
+            '{:>12}  {}'.format(30, os.path.join('B', 'A'))])
+
+
+class DeepTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.depth = sys.getrecursionlimit() * 2
+        self.leaf = FileSystemTree('f', [], 1)
+        self.tree = self.leaf
+        for _ in range(self.depth):
+            self.tree = FileSystemTree('d', [self.tree])
+
+    def test_generate_treemap(self):
+        rects = self.tree.generate_treemap((0, 0, 100, 50))
+        self.assertEqual(rects, [((0, 0, 100, 50), self.leaf.colour)])
+
+    def test_find_leaf(self):
+        self.assertIs(self.tree.find_leaf((0, 0, 100, 50), (10, 10)),
+                      self.leaf)
+
+    def test_get_separator(self):
+        self.assertEqual(self.leaf.get_separator(),
+                         os.path.join(*(['d'] * self.depth + ['f'])))
+
+    def test_update_data_size(self):
+        self.leaf.update_data_size(4)
+        self.assertEqual(self.tree.data_size, 5)
+
+
 class GenerateTreemapTest(unittest.TestCase):
     @given(integers(min_value=100, max_value=1000),
            integers(min_value=100, max_value=1000),
@@ -0,0 +1,305 @@
+"""Assignment 2: Budgeted File System Scanning
+
+=== Module Description ===
+This module contains a scanner that stops walking a folder once it runs
+out of a *budget*, so that a tree can be shown quickly for any volume, no
+matter how many files it holds.
+
+A budget limits any combination of:
+  - the wall time spent listing folders (max_seconds),
+  - the number of nodes in the tree (max_nodes),
+  - the number of folder levels listed below the scanned folder
+    (max_depth, counted like find's -maxdepth).
+
+Folders are listed breadth-first by a pool of threads, as in fs_scan.py,
+so the folders nearest the top are always listed first. Whatever is left
+over when the budget runs out is represented by PlaceholderTree leaves:
+  - a folder that was never listed becomes a single placeholder with the
+    folder's name,
+  - when a folder holds more entries than the node budget has room for,
+    the entries that do not fit are merged into a single placeholder
+    named OTHER_NAME.
+
+A placeholder's size is exact when it is cheaply known: for files whose
+listing has already been read, and for folders whose total size is given
+in known_sizes (e.g. from an earlier scan). Otherwise, each folder whose
+size is unknown is estimated as the average size of the folders that were
+scanned completely (or, if there are none yet, as the average size of the
+files seen), and the placeholder is marked as estimated. An estimate is
+never 0, so that placeholders stay visible in the treemap.
+"""
+import os
+import time
+from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
+
+from tree_data import FileSystemTree
+from fs_scan import DEFAULT_WORKERS, list_directory, submit_listing
+
+
+# The name of the placeholder for the entries of a folder that did not fit
+# in the node budget.
+OTHER_NAME = '(other)'
+
+# The colour of every placeholder, so they stand out in the treemap.
+PLACEHOLDER_COLOUR = (128, 128, 128)
+
+
+class PlaceholderTree(FileSystemTree):
+    """A leaf standing in for files and folders that a budgeted scan did not
+    add to the tree.
+
+    === Private Attributes ===
+    @type _unknown_folders: int
+        The number of folders whose size is included in data_size as an
+        estimate.
+    """
+    def __init__(self, name, data_size, unknown_folders=0):
+        """Initialize a new placeholder named <name>.
+
+        @type self: PlaceholderTree
+        @type name: str
+        @type data_size: int
+            The exactly known part of the size of the contents.
+        @type unknown_folders: int
+        @rtype: None
+
+        >>> T = PlaceholderTree('big', 10, 2)
+        >>> T.is_estimated()
+        True
+        """
+        FileSystemTree.__init__(self, name, [], data_size)
+        self._unknown_folders = unknown_folders
+        self.colour = PLACEHOLDER_COLOUR
+
+    def is_estimated(self):
+        """Return True if the data_size of this placeholder is an estimate.
+
+        @type self: PlaceholderTree
+        @rtype: bool
+        """
+        return self._unknown_folders > 0
+
+
+def scan_with_budget(path, max_seconds=None, max_nodes=None, max_depth=None,
+                     workers=DEFAULT_WORKERS, known_sizes=None):
+    """Return a FileSystemTree of the file or folder at <path>, scanning no
+    further than the given budget allows.
+
+    A limit of None means there is no limit. With no limits at all, the
+    returned tree is the same as FileSystemTree(path). Otherwise, the parts
+    of <path> left over when the budget runs out are represented by
+    PlaceholderTree leaves.
+
+    Precondition: <path> is a valid path for this computer.
+                  max_nodes is None or max_nodes >= 1
+                  max_depth is None or max_depth >= 1
+                  workers >= 1
+
+    @type path: str
+    @type max_seconds: float | None
+        Folders other than <path> are not listed after this many seconds.
+        Listings already started are waited for.
+    @type max_nodes: int | None
+        The maximum number of nodes below the root, not counting the
+        placeholders which hold the entries of a folder whose listing
+        arrived after the budget was used up.
+    @type max_depth: int | None
+    @type workers: int
+        The number of threads used to list directories.
+    @type known_sizes: dict[str, int] | None
+        The total size of folders known in advance, by path.
+    @rtype: FileSystemTree
+
+    >>> T = scan_with_budget('TestFolder', max_depth=1)
+    >>> T._subtrees[0]._subtrees
+    []
+    >>> T._subtrees[0].is_estimated()
+    True
+    >>> T = scan_with_budget('TestFolder', max_depth=1,
+    ...                      known_sizes={os.path.join('TestFolder', 'F1'): 3})
+    >>> T._subtrees[0].data_size
+    3
+    """
+    if not os.path.isdir(path):
+        return FileSystemTree(path)
+    if known_sizes is None:
+        known_sizes = {}
+    listings, left_out = _budgeted_listings(path, max_seconds, max_nodes,
+                                            max_depth, workers, known_sizes)
+    return _build_budgeted_tree(path, listings, left_out, known_sizes)
+
+
+def _budgeted_listings(path, max_seconds, max_nodes, max_depth, workers,
+                       known_sizes):
+    """Return the listings of the folders under <path> that fit in the
+    budget, and the size of what was left out.
+
+    The first dictionary maps each listed folder to the entries kept for
+    it. The second maps each folder with entries that were read but not
+    kept to the known size of those entries, and to the number of folders
+    among them whose size is unknown. A folder in both had the entries
+    that did not fit in the node budget left out; a folder only in the
+    second had all of them left out.
+
+    @type path: str
+    @type max_seconds: float | None
+    @type max_nodes: int | None
+    @type max_depth: int | None
+    @type workers: int
+    @type known_sizes: dict[str, int]
+    @rtype: (dict[str, list[(str, bool, int)]], dict[str, (int, int)])
+    """
+    deadline = None
+    if max_seconds is not None:
+        deadline = time.monotonic() + max_seconds
+    listings = {}
+    left_out = {}
+    nodes = 0
+    # As in fs_scan.scan_listings, listings are taken from <finished> as
+    # they finish. The depth of each pending folder is kept in <depths>.
+    finished = Queue()
+    pending = {}
+    depths = {path: 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        submit_listing(pool, list_directory, path, pending, finished)
+        while pending:
+            # The root is always listed, however small the budget.
+            timeout = None
+            if deadline is not None and listings:
+                timeout = max(0, deadline - time.monotonic())
+            try:
+                future = finished.get(timeout=timeout)
+            except Empty:
+                # Out of time: the folders still pending become
+                # placeholders.
+                for future in pending:
+                    future.cancel()
+                break
+            dir_path = pending.pop(future)
+            depth = depths.pop(dir_path)
+            entries = future.result()
+            if max_nodes is not None and nodes >= max_nodes:
+                left_out[dir_path] = _entries_size(dir_path, entries,
+                                                   known_sizes)
+                continue
+            if max_nodes is not None and nodes + len(entries) > max_nodes:
+                keep = max_nodes - nodes - 1
+                left_out[dir_path] = _entries_size(
+                    dir_path, entries[keep:], known_sizes)
+                entries = entries[:keep]
+                nodes += 1
+            nodes += len(entries)
+            listings[dir_path] = entries
+            if max_depth is not None and depth + 1 >= max_depth or \
+                    deadline is not None and time.monotonic() >= deadline:
+                continue
+            for entry in entries:
+                if max_nodes is not None and nodes >= max_nodes:
+                    break
+                subpath = os.path.join(dir_path, entry[0])
+                if entry[1] and subpath not in known_sizes:
+                    depths[subpath] = depth + 1
+                    submit_listing(pool, list_directory, subpath, pending,
+                                   finished)
+    return listings, left_out
+
+
+def _entries_size(dir_path, entries, known_sizes):
+    """Return the total size of the files in <entries> and of the folders
+    among them in <known_sizes>, and the number of other folders among
+    them.
+
+    @type dir_path: str
+        The folder the entries are in.
+    @type entries: list[(str, bool, int)]
+    @type known_sizes: dict[str, int]
+    @rtype: (int, int)
+    """
+    size = 0
+    unknown_folders = 0
+    for name, is_dir, entry_size in entries:
+        subpath = os.path.join(dir_path, name)
+        if not is_dir:
+            size += entry_size
+        elif subpath in known_sizes:
+            size += known_sizes[subpath]
+        else:
+            unknown_folders += 1
+    return size, unknown_folders
+
+
+def _build_budgeted_tree(path, listings, left_out, known_sizes):
+    """Return the FileSystemTree for the folder <path> from the results of
+    _budgeted_listings.
+
+    Once the tree is built, every estimated placeholder gets an estimate
+    for each folder it stands for, as described in the module docstring,
+    and the sizes of its parents are updated to match.
+
+    @type path: str
+    @type listings: dict[str, list[(str, bool, int)]]
+    @type left_out: dict[str, (int, int)]
+    @type known_sizes: dict[str, int]
+    @rtype: FileSystemTree
+    """
+    estimated = []
+    complete_size = 0
+    complete_count = 0
+    file_size = 0
+    file_count = 0
+    # Each stack frame holds a folder path, an iterator over the entries of
+    # that folder which have not been visited yet, the subtrees built so far
+    # for the entries which have, and whether no estimate was needed for
+    # any of them.
+    stack = [[path, iter(listings[path]), [], True]]
+    while True:
+        frame = stack[-1]
+        for name, is_dir, size in frame[1]:
+            if not is_dir:
+                frame[2].append(FileSystemTree(name, [], size))
+                file_size += size
+                file_count += 1
+                continue
+            subpath = os.path.join(frame[0], name)
+            if subpath in listings:
+                stack.append([subpath, iter(listings[subpath]), [], True])
+                break
+            if subpath in known_sizes:
+                placeholder = PlaceholderTree(name, known_sizes[subpath])
+            else:
+                placeholder = PlaceholderTree(
+                    name, *left_out.get(subpath, (0, 1)))
+            frame[2].append(placeholder)
+            if placeholder.is_estimated():
+                estimated.append(placeholder)
+                frame[3] = False
+        else:
+            stack.pop()
+            if frame[0] in left_out:
+                placeholder = PlaceholderTree(OTHER_NAME, *left_out[frame[0]])
+                frame[2].append(placeholder)
+                if placeholder.is_estimated():
+                    estimated.append(placeholder)
+                    frame[3] = False
+            tree = FileSystemTree(frame[0], frame[2])
+            if not stack:
+                break
+            stack[-1][2].append(tree)
+            if frame[3]:
+                complete_size += tree.data_size
+                complete_count += 1
+            else:
+                stack[-1][3] = False
+    if complete_count != 0:
+        average = complete_size // complete_count
+    elif file_count != 0:
+        average = file_size // file_count
+    else:
+        average = 1
+    average = max(average, 1)
+    for placeholder in estimated:
+        size_change = placeholder._unknown_folders * average
+        placeholder.data_size += size_change
+        placeholder.update_data_size(size_change)
+    return tree
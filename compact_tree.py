@@ -0,0 +1,575 @@
+"""Assignment 2: Compact Trees
+
+=== Module Description ===
+This module contains CompactTree, an alternative way of storing a tree for
+the treemap visualiser that uses far less memory than AbstractTree objects.
+
+Every AbstractTree node is a separate Python object with its own attribute
+dictionary, list of subtrees and colour tuple, which adds up to several
+hundred bytes per file. A CompactTree instead stores one column per
+attribute, using the array module, with one row per node:
+  - the index of the node's parent,
+  - the index of its first child and of its next sibling,
+  - its data_size,
+  - its colour, packed into a single 0xRRGGBB integer,
+  - the index of its name in a table of names, in which every distinct
+    name is stored only once.
+That comes to 28 bytes per node, plus the names.
+
+Nodes are identified by their row index, with the root at index 0. The
+treemap visualiser works with CompactNode objects: small views of a single
+row which provide the same methods as AbstractTree (generate_treemap,
+find_leaf, mutate_size, delete_selected_leaf and get_separator). Views are
+created when needed and hold no data of their own.
+
+Deleted nodes are unlinked from their parent but their rows are not reused.
+"""
+import os
+import math
+from array import array
+from random import getrandbits
+
+from tree_data import slice_rect
+from fs_scan import list_directory
+
+
+# The value used in the index columns for "no node".
+NO_NODE = -1
+
+
+class CompactTree:
+    """A tree stored as columns of numbers, one row per node.
+
+    === Private Attributes ===
+    @type _parents: array[int]
+        The row of each node's parent, or NO_NODE for the root.
+    @type _first_child: array[int]
+        The row of each node's first child, or NO_NODE for a leaf.
+    @type _next_sibling: array[int]
+        The row of the next child of each node's parent, or NO_NODE if the
+        node is the last child.
+    @type _sizes: array[int]
+        The data_size of each node.
+    @type _colours: array[int]
+        The colour of each node, packed as 0xRRGGBB.
+    @type _name_ids: array[int]
+        The index in _names of each node's name.
+    @type _names: list[str]
+        Every distinct name in this tree.
+    @type _name_lookup: dict[str, int]
+        The index in _names of each name.
+    @type _last_child: array[int] | None
+        The row of each node's last child, kept only while the tree is being
+        built so that children can be appended in constant time.
+
+    === Representation Invariants ===
+    - If a node has children, its size is the sum of their sizes.
+    """
+    def __init__(self):
+        """Initialize a new tree with no nodes.
+
+        @type self: CompactTree
+        @rtype: None
+        """
+        self._parents = array('i')
+        self._first_child = array('i')
+        self._next_sibling = array('i')
+        self._sizes = array('q')
+        self._colours = array('I')
+        self._name_ids = array('i')
+        self._names = []
+        self._name_lookup = {}
+        self._last_child = array('i')
+
+    def __len__(self):
+        """Return the number of rows in this tree, including deleted nodes.
+
+        @type self: CompactTree
+        @rtype: int
+        """
+        return len(self._parents)
+
+    def add_node(self, name, parent, data_size=0, colour=None):
+        """Add a new node as the last child of <parent> and return its row.
+
+        The sizes of <parent> and its ancestors are NOT updated; whoever
+        builds the tree is responsible for adding up the sizes of folders.
+
+        @type self: CompactTree
+        @type name: str
+        @type parent: int
+            The row of the parent, or NO_NODE for the root.
+        @type data_size: int
+        @type colour: (int, int, int) | None
+            A random colour is chosen if this is None.
+        @rtype: int
+
+        >>> T = CompactTree()
+        >>> T.add_node('root', NO_NODE)
+        0
+        >>> T.add_node('leaf', 0, 15)
+        1
+        >>> T.root()._subtrees[0].data_size
+        15
+        """
+        index = len(self._parents)
+        name_id = self._name_lookup.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._names.append(name)
+            self._name_lookup[name] = name_id
+        if colour is None:
+            packed = getrandbits(24)
+        else:
+            packed = (colour[0] << 16) | (colour[1] << 8) | colour[2]
+        self._parents.append(parent)
+        self._first_child.append(NO_NODE)
+        self._next_sibling.append(NO_NODE)
+        self._sizes.append(data_size)
+        self._colours.append(packed)
+        self._name_ids.append(name_id)
+        self._last_child.append(NO_NODE)
+        if parent != NO_NODE:
+            last = self._last_child[parent]
+            if last == NO_NODE:
+                self._first_child[parent] = index
+            else:
+                self._next_sibling[last] = index
+            self._last_child[parent] = index
+        return index
+
+    def finish(self):
+        """Release the memory only needed while building this tree.
+
+        No nodes may be added afterwards.
+
+        @type self: CompactTree
+        @rtype: None
+        """
+        self._last_child = None
+        self._name_lookup = None
+
+    def root(self):
+        """Return a view of the root of this tree.
+
+        @type self: CompactTree
+        @rtype: CompactNode
+        """
+        return CompactNode(self, 0)
+
+    def children(self, index):
+        """Return the rows of the children of the node at row <index>.
+
+        @type self: CompactTree
+        @type index: int
+        @rtype: list[int]
+        """
+        children = []
+        child = self._first_child[index]
+        while child != NO_NODE:
+            children.append(child)
+            child = self._next_sibling[child]
+        return children
+
+    def child_rects(self, index, rect, skip_empty, strategy=None):
+        """Return the rectangle of each child of the node at row <index>,
+        when the node is drawn in <rect>, as pairs (row, rect).
+
+        This is the same step as AbstractTree._sub_rects. If <skip_empty> is
+        True, children with a size of 0 are left out, as
+        AbstractTree.generate_treemap does.
+
+        Precondition: the node has children and its size is not 0.
+
+        @type self: CompactTree
+        @type index: int
+        @type rect: (int, int, int, int)
+        @type skip_empty: bool
+        @type strategy: callable | None
+            The layout strategy, as for AbstractTree.generate_treemap.
+        @rtype: list[(int, (int, int, int, int))]
+        """
+        if strategy is None:
+            strategy = slice_rect
+        sizes = self._sizes
+        children = self.children(index)
+        if skip_empty:
+            children = [child for child in children if sizes[child] != 0]
+        sub_rects = strategy(rect, [sizes[child] for child in children],
+                             sizes[index])
+        return list(zip(children, sub_rects))
+
+    def update_data_size(self, index, data_size):
+        """Add <data_size> to the size of every ancestor of the node at row
+        <index>.
+
+        @type self: CompactTree
+        @type index: int
+        @type data_size: int
+        @rtype: None
+        """
+        parent = self._parents[index]
+        while parent != NO_NODE:
+            self._sizes[parent] += data_size
+            parent = self._parents[parent]
+
+    def delete_child(self, parent, index):
+        """Unlink the node at row <index> from the children of the node at
+        row <parent>, and update the sizes of its ancestors.
+
+        If the node is not a child of <parent>, nothing happens.
+
+        @type self: CompactTree
+        @type parent: int
+        @type index: int
+        @rtype: None
+        """
+        previous = NO_NODE
+        child = self._first_child[parent]
+        while child != NO_NODE and child != index:
+            previous = child
+            child = self._next_sibling[child]
+        if child == NO_NODE:
+            return
+        if previous == NO_NODE:
+            self._first_child[parent] = self._next_sibling[index]
+        else:
+            self._next_sibling[previous] = self._next_sibling[index]
+        self._next_sibling[index] = NO_NODE
+        self.update_data_size(index, -self._sizes[index])
+
+
+class CompactNode:
+    """A view of a single node of a CompactTree.
+
+    This provides the methods of AbstractTree that the treemap visualiser
+    uses, so a CompactTree can be visualised like any other tree. Two views
+    are equal if they refer to the same row of the same tree.
+
+    === Private Attributes ===
+    @type _tree: CompactTree
+        The tree this node belongs to.
+    @type _index: int
+        The row of this node in _tree.
+    """
+    __slots__ = ('_tree', '_index')
+
+    def __init__(self, tree, index):
+        """Initialize a new view of row <index> of <tree>.
+
+        @type self: CompactNode
+        @type tree: CompactTree
+        @type index: int
+        @rtype: None
+        """
+        self._tree = tree
+        self._index = index
+
+    def __eq__(self, other):
+        """Return True if <other> is a view of the same node.
+
+        @type self: CompactNode
+        @type other: object
+        @rtype: bool
+        """
+        return isinstance(other, CompactNode) and \
+            self._tree is other._tree and self._index == other._index
+
+    def __hash__(self):
+        """Return a hash of this view.
+
+        @type self: CompactNode
+        @rtype: int
+        """
+        return hash((id(self._tree), self._index))
+
+    @property
+    def data_size(self):
+        """The total size of all leaves of this node.
+
+        @type self: CompactNode
+        @rtype: int
+        """
+        return self._tree._sizes[self._index]
+
+    @property
+    def colour(self):
+        """The RGB colour of this node.
+
+        @type self: CompactNode
+        @rtype: (int, int, int)
+        """
+        packed = self._tree._colours[self._index]
+        return packed >> 16, (packed >> 8) & 0xFF, packed & 0xFF
+
+    @property
+    def _root(self):
+        """The name of this node.
+
+        @type self: CompactNode
+        @rtype: str
+        """
+        return self._tree._names[self._tree._name_ids[self._index]]
+
+    @property
+    def _subtrees(self):
+        """Views of the children of this node.
+
+        @type self: CompactNode
+        @rtype: list[CompactNode]
+        """
+        return [CompactNode(self._tree, child)
+                for child in self._tree.children(self._index)]
+
+    @property
+    def _parent_tree(self):
+        """A view of the parent of this node, or None for the root.
+
+        @type self: CompactNode
+        @rtype: CompactNode | None
+        """
+        parent = self._tree._parents[self._index]
+        if parent == NO_NODE:
+            return None
+        return CompactNode(self._tree, parent)
+
+    def generate_treemap(self, rect, changed=None, strategy=None,
+                         min_area=0):
+        """Run the treemap algorithm on this node and return the rectangles.
+
+        The arguments are the same as AbstractTree.generate_treemap's, and
+        the rectangles are exactly the ones it returns for the same tree.
+        Nothing is cached, so if <changed> is a list, a pair (view, rect)
+        is appended to it for every rectangle returned.
+
+        @type self: CompactNode
+        @type rect: (int, int, int, int)
+        @type changed: list[(CompactNode, (int, int, int, int))] | None
+        @type strategy: callable | None
+            The layout strategy, as for AbstractTree.generate_treemap.
+        @type min_area: int
+            Subtrees drawn with fewer pixels are not divided, as for
+            AbstractTree.generate_treemap.
+        @rtype: list[((int, int, int, int), (int, int, int))]
+
+        >>> C = CompactTree()
+        >>> root = C.add_node('top', NO_NODE, 5)
+        >>> leaf = C.add_node('a', root, 5)
+        >>> C.finish()
+        >>> changed = []
+        >>> C.root().generate_treemap((0, 0, 10, 10), changed)[0][0]
+        (0, 0, 10, 10)
+        >>> changed == [(CompactNode(C, leaf), (0, 0, 10, 10))]
+        True
+        """
+        colours = self._tree._colours
+        tree_map = []
+        for index, rect in self._drawn(rect, strategy, min_area):
+            packed = colours[index]
+            tree_map.append((rect, (packed >> 16, (packed >> 8) & 0xFF,
+                                    packed & 0xFF)))
+            if changed is not None:
+                changed.append((CompactNode(self._tree, index), rect))
+        return tree_map
+
+    def iter_treemap(self, rect, strategy=None, min_area=0):
+        """Yield the rectangles of the treemap of this node, one at a time,
+        as AbstractTree.iter_treemap does.
+
+        @type self: CompactNode
+        @type rect: (int, int, int, int)
+        @type strategy: callable | None
+        @type min_area: int
+        @rtype: generator
+        """
+        colours = self._tree._colours
+        for index, rect in self._drawn(rect, strategy, min_area):
+            packed = colours[index]
+            yield rect, (packed >> 16, (packed >> 8) & 0xFF, packed & 0xFF)
+
+    def _drawn(self, rect, strategy, min_area):
+        """Yield the row and rectangle of every node drawn as a single
+        rectangle in the treemap of this node, in order.
+
+        @type self: CompactNode
+        @type rect: (int, int, int, int)
+        @type strategy: callable | None
+        @type min_area: int
+        @rtype: generator
+        """
+        tree = self._tree
+        first_child = tree._first_child
+        if tree._sizes[self._index] == 0:
+            return
+        stack = [iter([(self._index, rect)])]
+        while stack:
+            for index, rect in stack[-1]:
+                area = rect[2] * rect[3]
+                if area == 0 < min_area:
+                    continue
+                if first_child[index] == NO_NODE or area < min_area:
+                    yield index, rect
+                    continue
+                stack.append(iter(tree.child_rects(index, rect, True,
+                                                   strategy)))
+                break
+            else:
+                stack.pop()
+
+    def find_leaf(self, rect, coordinations, strategy=None):
+        """Return a view of the leaf drawn at <coordinations> when this node
+        is drawn in <rect>, as AbstractTree.find_leaf does.
+
+        None is returned if the folder found at <coordinations> has a size
+        of 0, since nothing inside it is drawn.
+
+        @type self: CompactNode
+        @type rect: (int, int, int, int)
+        @type coordinations: (int, int)
+        @type strategy: callable | None
+        @rtype: CompactNode | None
+        """
+        tree = self._tree
+        coord_x, coord_y = coordinations
+        index = self._index
+        while tree._first_child[index] != NO_NODE:
+            if tree._sizes[index] == 0:
+                return None
+            found = None
+            for child, sub_rect in tree.child_rects(index, rect, True,
+                                                    strategy):
+                x, y, sub_width, sub_height = sub_rect
+                if x <= coord_x <= x + sub_width and \
+                        y <= coord_y <= y + sub_height:
+                    found = child, sub_rect
+                    break
+            if found is None:
+                return None
+            index, rect = found
+        return CompactNode(tree, index)
+
+    def mutate_size(self, parameter):
+        """increase or decrease the data_size of this node by 1% depending
+        parameter and update all parent nodes' data size, as
+        AbstractTree.mutate_size does
+
+        @type self: CompactNode
+        @type parameter: str
+            'increase' or 'decrease'
+        @rtype: None
+        """
+        sizes = self._tree._sizes
+        size_change = math.ceil(sizes[self._index] * 0.01)
+        if parameter == 'increase':
+            sizes[self._index] += size_change
+            self._tree.update_data_size(self._index, size_change)
+        elif parameter == 'decrease':
+            if sizes[self._index] > 1:
+                sizes[self._index] -= size_change
+                self._tree.update_data_size(self._index, -size_change)
+
+    def delete_selected_leaf(self):
+        """remove this node from its parent, and update the data sizes of
+        the parent nodes
+
+        @type self: CompactNode
+        @rtype: None
+        """
+        parent = self._tree._parents[self._index]
+        if parent == NO_NODE:
+            self._tree._sizes[self._index] = 0
+        else:
+            self._tree.delete_child(parent, self._index)
+
+    def get_separator(self):
+        """return the path from the root to this node, joining names as
+        FileSystemTree.get_separator does
+
+        @type self: CompactNode
+        @rtype: str
+        """
+        tree = self._tree
+        names = []
+        index = self._index
+        while index != NO_NODE:
+            names.append(tree._names[tree._name_ids[index]])
+            index = tree._parents[index]
+        names.reverse()
+        return os.path.join(*names)
+
+
+def compact_from_tree(tree):
+    """Return a CompactTree with the same shape, names, sizes and colours
+    as <tree>.
+
+    The copy shares nothing with <tree> and can be pickled, so it can serve
+    as a snapshot of <tree> to lay out in another thread or process while
+    <tree> itself keeps changing.
+
+    @type tree: AbstractTree
+    @rtype: CompactTree
+
+    >>> from tree_data import FileSystemTree
+    >>> T = FileSystemTree('TestFolder')
+    >>> C = compact_from_tree(T)
+    >>> C.root().generate_treemap((0, 0, 100, 50)) == \\
+    ...     T.generate_treemap((0, 0, 100, 50))
+    True
+    """
+    compact = CompactTree()
+    # Nodes are added in pre-order, so each parent is added before its
+    # children and children are added in order.
+    stack = [(tree, NO_NODE)]
+    while stack:
+        node, parent = stack.pop()
+        index = compact.add_node(node._root, parent, node.data_size,
+                                 node.colour)
+        for subtree in reversed(node._subtrees):
+            stack.append((subtree, index))
+    compact.finish()
+    return compact
+
+
+def compact_scan(path):
+    """Return a CompactTree of the file or folder at <path>.
+
+    The file system is read directly into the columns of the tree, without
+    creating a Python object for each file. The tree has the same shape,
+    names and sizes as FileSystemTree(path).
+
+    Precondition: <path> is a valid path for this computer.
+
+    @type path: str
+    @rtype: CompactTree
+
+    >>> C = compact_scan('TestFolder')
+    >>> C.root().data_size
+    11
+    """
+    compact = CompactTree()
+    if not os.path.isdir(path):
+        compact.add_node(os.path.basename(path), NO_NODE,
+                         os.path.getsize(path))
+        compact.finish()
+        return compact
+    sizes = compact._sizes
+    root = compact.add_node(os.path.basename(path), NO_NODE)
+    # Each stack frame holds a folder path, its row, and an iterator over
+    # the entries of that folder which have not been visited yet.
+    stack = [(path, root, iter(list_directory(path)))]
+    while stack:
+        dir_path, index, entries = stack[-1]
+        for name, is_dir, size in entries:
+            if is_dir:
+                subpath = os.path.join(dir_path, name)
+                child = compact.add_node(name, index)
+                stack.append((subpath, child, iter(list_directory(subpath))))
+                break
+            compact.add_node(name, index, size)
+            sizes[index] += size
+        else:
+            stack.pop()
+            if stack:
+                sizes[stack[-1][1]] += sizes[index]
+    compact.finish()
+    return compact
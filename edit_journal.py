@@ -0,0 +1,253 @@
+"""Assignment 2: Edit Journal
+
+=== Module Description ===
+This module contains EditJournal, which makes deleting and resizing trees
+in the treemap visualiser undoable.
+
+delete_selected_leaf and mutate_size change the tree in place, so without
+a journal the only way back from a mistaken deletion is to scan the file
+system again. An EditJournal makes the same changes, and records for each
+of them just enough to reverse it: the tree changed, the parent tree and
+position it was deleted from, and the change in its data_size. The tree
+itself is never copied: a deleted tree is kept, whole, by its record, and
+is put back where it was.
+
+Undoing or redoing an edit goes through insert_child, update_data_size and
+delete_subtrees, so the data_size of every tree above it is kept right and
+every cached layout it affects is discarded. Each tree changed costs time
+in proportion to its depth, as for the edit itself. A PathIndex given to
+the journal is told about every tree it deletes and puts back.
+"""
+from tree_data import AbstractTree
+
+
+class EditJournal:
+    """A record of the deletions and resizes made to a tree, which can be
+    undone and redone.
+
+    Every change to the tree should go through the journal: an edit can
+    only be undone if the trees around it are as they were just after it,
+    and redone if they are as they were just before it.
+
+    === Private Attributes ===
+    @type _tree: AbstractTree
+        The tree edited.
+    @type _paths: PathIndex | None
+        The index of the paths in the tree, kept in sync with its edits.
+    @type _undo: list[list[(AbstractTree, AbstractTree | None, int | None,
+                            int)]]
+        The edits that can be undone, the last one last. An edit is a list
+        of records (tree, parent, index, size_change). A deleted tree has
+        the parent tree and index it was deleted from, and minus its
+        data_size; a resized tree has None for both, and the change in its
+        data_size.
+    @type _redo: list[list[(AbstractTree, AbstractTree | None, int | None,
+                            int)]]
+        The edits undone that can be redone, the last one undone last.
+
+    === Representation Invariants ===
+    - In each edit, a deleted tree comes after the trees inside it, and
+      trees deleted from the same parent come from the last to the first.
+    """
+    def __init__(self, tree, paths=None):
+        """Initialize a new, empty journal of the edits to <tree>.
+
+        @type self: EditJournal
+        @type tree: AbstractTree
+        @type paths: PathIndex | None
+            An index of the paths in <tree>, if it is a FileSystemTree.
+        @rtype: None
+        """
+        self._tree = tree
+        self._paths = paths
+        self._undo = []
+        self._redo = []
+
+    def delete_selected_leaf(self, tree):
+        """Delete <tree> as delete_selected_leaf does, and record it.
+
+        @type self: EditJournal
+        @type tree: AbstractTree
+        @rtype: None
+
+        >>> T1 = AbstractTree('Test1', [], 1)
+        >>> T = AbstractTree('Test', [T1, AbstractTree('Test2', [], 2)])
+        >>> journal = EditJournal(T)
+        >>> journal.delete_selected_leaf(T1)
+        >>> T.data_size
+        2
+        >>> journal.undo()
+        True
+        >>> T._subtrees[0] is T1, T.data_size
+        (True, 3)
+        """
+        self.delete_subtrees([tree])
+
+    def delete_subtrees(self, subtrees):
+        """Delete every tree in <subtrees> as delete_subtrees does, and
+        record it as a single edit.
+
+        Precondition: every tree in <subtrees> is the journal's tree or a
+                      tree inside it.
+
+        @type self: EditJournal
+        @type subtrees: collection[AbstractTree]
+        @rtype: None
+
+        >>> T1 = AbstractTree('Test1', [], 1)
+        >>> T2 = AbstractTree('Test2', [T1, AbstractTree('Test3', [], 2)])
+        >>> T = AbstractTree('Test', [T2, AbstractTree('Test4', [], 4)])
+        >>> journal = EditJournal(T)
+        >>> journal.delete_subtrees([T1, T2])
+        >>> T.data_size
+        4
+        >>> journal.undo()
+        True
+        >>> T.data_size, T2.data_size, T2._subtrees[0] is T1
+        (7, 3, True)
+        >>> journal.redo()
+        True
+        >>> T.data_size
+        4
+        """
+        doomed = set(subtrees)
+        if self._tree in doomed:
+            # Deleting the whole tree leaves the trees inside it alone.
+            doomed = {self._tree}
+        edit = []
+        # The parents are taken from the deepest up, so that undoing the
+        # edit backwards puts back every tree before the trees inside it.
+        parents = {}
+        for tree in doomed:
+            if tree._parent_tree is None:
+                edit.append((tree, None, None, -tree.data_size))
+            elif tree._parent_tree not in parents:
+                parents[tree._parent_tree] = _depth(tree._parent_tree)
+        for parent in sorted(parents, key=parents.__getitem__, reverse=True):
+            for index in range(len(parent._subtrees) - 1, -1, -1):
+                tree = parent._subtrees[index]
+                if tree in doomed:
+                    edit.append((tree, parent, index, -tree.data_size))
+        self._apply(edit)
+        if edit:
+            self._record(edit)
+
+    def mutate_size(self, tree, parameter):
+        """Change the data_size of <tree> as mutate_size does, and record
+        it, unless its data_size did not change.
+
+        @type self: EditJournal
+        @type tree: AbstractTree
+        @type parameter: str
+            'increase' or 'decrease'
+        @rtype: None
+
+        >>> T1 = AbstractTree('Test1', [], 10)
+        >>> T = AbstractTree('Test', [T1, AbstractTree('Test2', [], 10)])
+        >>> journal = EditJournal(T)
+        >>> journal.mutate_size(T1, 'increase')
+        >>> T.data_size
+        21
+        >>> journal.undo()
+        True
+        >>> T.data_size, T1.data_size
+        (20, 10)
+        >>> journal.undo()
+        False
+        """
+        data_size = tree.data_size
+        tree.mutate_size(parameter)
+        if tree.data_size != data_size:
+            self._record([(tree, None, None, tree.data_size - data_size)])
+
+    def undo(self):
+        """Undo the last edit that has not been undone, and return True, or
+        return False if there is none.
+
+        Deleted trees are put back at the positions they were deleted from.
+
+        @type self: EditJournal
+        @rtype: bool
+        """
+        if self._undo == []:
+            return False
+        edit = self._undo.pop()
+        for tree, parent, index, size_change in reversed(edit):
+            if parent is None:
+                _resize(tree, -size_change)
+            else:
+                parent.insert_child(tree, index)
+                if self._paths is not None:
+                    self._paths.add(tree)
+        self._redo.append(edit)
+        return True
+
+    def redo(self):
+        """Make the last edit undone again, and return True, or return
+        False if there is none, or if another edit was made since it was
+        undone.
+
+        @type self: EditJournal
+        @rtype: bool
+        """
+        if self._redo == []:
+            return False
+        edit = self._redo.pop()
+        self._apply(edit)
+        self._undo.append(edit)
+        return True
+
+    def _apply(self, edit):
+        """Make the deletions and resizes recorded in <edit>.
+
+        @type self: EditJournal
+        @type edit: list[(AbstractTree, AbstractTree | None, int | None,
+                          int)]
+        @rtype: None
+        """
+        deleted = [record[0] for record in edit if record[1] is not None]
+        if deleted:
+            self._tree.delete_subtrees(deleted)
+        if self._paths is not None:
+            for tree in deleted:
+                self._paths.remove(tree)
+        for tree, parent, _, size_change in edit:
+            if parent is None:
+                _resize(tree, size_change)
+
+    def _record(self, edit):
+        """Record <edit> as the last edit made, which means the edits undone
+        can no longer be redone.
+
+        @type self: EditJournal
+        @type edit: list[(AbstractTree, AbstractTree | None, int | None,
+                          int)]
+        @rtype: None
+        """
+        self._undo.append(edit)
+        self._redo = []
+
+
+def _depth(tree):
+    """Return the number of trees above <tree>.
+
+    @type tree: AbstractTree
+    @rtype: int
+    """
+    depth = 0
+    while tree._parent_tree is not None:
+        tree = tree._parent_tree
+        depth += 1
+    return depth
+
+
+def _resize(tree, size_change):
+    """Add <size_change> to the data_size of <tree> and of every tree above
+    it.
+
+    @type tree: AbstractTree
+    @type size_change: int
+    @rtype: None
+    """
+    tree.data_size += size_change
+    tree.update_data_size(size_change)
@@ -0,0 +1,561 @@
+"""Assignment 2: Parallel File System Scanning
+
+=== Module Description ===
+This module contains a scan engine that builds the same FileSystemTree as
+the FileSystemTree constructor, but much faster on large volumes.
+
+The constructor makes several system calls per entry (os.path.isdir,
+os.listdir and os.path.getsize) and lists one directory at a time. Here,
+each directory is listed with os.scandir, which tells us whether an entry
+is a directory without an extra system call, and directory listings are
+spread across a pool of threads (the system calls release the GIL, so
+several directories can be read from disk at once).
+
+Scanning happens in two phases:
+  1. scan_listings reads every directory and returns a dictionary mapping
+     each directory path to the entries it contains.
+  2. build_tree turns those listings into FileSystemTree objects.
+
+Entries are stored in the order os.scandir reports them, which is the same
+order os.listdir uses, so the resulting tree has the same child order as
+FileSystemTree(path).
+
+Threads only help while waiting for the disk: building the tree itself
+holds the GIL. scan_file_system_sharded goes further by giving each folder
+directly inside the scanned folder (a *shard*) to a separate process.
+Each process scans its shard and sends it back in a compact form: the
+names of the shard's entries in pre-order, plus one array of child counts
+and one of sizes. The main process then turns the shards into subtrees and
+joins them under a single root.
+
+=== Disk Usage Mode ===
+By default, the data_size of a file is its length, as reported by
+os.path.getsize. In disk usage mode, sizes are computed the way the `du`
+command computes them instead:
+  - a file's size is the space allocated to it on disk (st_blocks * 512),
+    which is smaller than its length for sparse files,
+  - a file with several hard links is only counted the first time it is
+    seen; later links have a data_size of 0,
+  - symbolic links are not followed,
+  - the space allocated to a folder itself is counted, as an extra leaf
+    named '.' inside that folder,
+  - optionally, folders on other file systems are skipped (like du -x).
+All of this comes from the single lstat each entry gets while scanning.
+Only files with more than one link are remembered for de-duplication. On
+volumes where almost every file has several links, such as backup
+snapshots, that is almost every file, so they are remembered in an
+InodeSet: a hash table of bare inode numbers per device, packed into an
+array of 64-bit integers, rather than a Python set of integer objects.
+"""
+import os
+import stat
+from array import array
+from functools import partial
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from tree_data import FileSystemTree
+
+
+# The number of threads used to list directories if none is given.
+DEFAULT_WORKERS = 8
+
+# The number of slots in a new InodeSet hash table.
+_INITIAL_SLOTS = 1024
+
+# The bits of a combined device and inode number holding the inode number.
+_INODE_MASK = (1 << 64) - 1
+
+# An odd constant used to spread inode numbers over the hash table slots.
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def scan_file_system(path, workers=DEFAULT_WORKERS, disk_usage=False,
+                     one_file_system=False):
+    """Return a FileSystemTree of the file or folder at <path>.
+
+    The returned tree has the same shape, child order and data_size values
+    as FileSystemTree(path), unless <disk_usage> is True, in which case
+    sizes are computed as described in the module docstring.
+
+    Precondition: <path> is a valid path for this computer.
+                  workers >= 1
+
+    @type path: str
+    @type workers: int
+        The number of threads used to list directories.
+    @type disk_usage: bool
+    @type one_file_system: bool
+        If True, in disk usage mode, folders on a different file system
+        than <path> are skipped.
+    @rtype: FileSystemTree
+
+    >>> T = scan_file_system('TestFolder')
+    >>> T.data_size
+    11
+    >>> T = scan_file_system(os.path.join('example-data', 'B', 'f4.txt'))
+    >>> T.data_size
+    10
+    """
+    if not disk_usage:
+        if not os.path.isdir(path):
+            return FileSystemTree(path)
+        return build_tree(path, scan_listings(path, workers))
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        return FileSystemTree(path, [], allocated_size(info))
+    device = None
+    if one_file_system:
+        device = info.st_dev
+    listings = scan_listings(path, workers,
+                             partial(list_directory_usage, device=device))
+    return build_tree(path, listings, allocated_size(info))
+
+
+def scan_file_system_sharded(path, processes=None, workers=DEFAULT_WORKERS,
+                             disk_usage=False, one_file_system=False):
+    """Return a FileSystemTree of the file or folder at <path>, scanning
+    each folder directly inside <path> in a separate process.
+
+    The returned tree is the same as the one scan_file_system returns for
+    the same arguments.
+
+    Precondition: <path> is a valid path for this computer.
+                  processes is None or processes >= 1
+                  workers >= 1
+
+    @type path: str
+    @type processes: int | None
+        The number of worker processes, or None for one per CPU.
+    @type workers: int
+        The number of threads each worker process lists directories with.
+    @type disk_usage: bool
+    @type one_file_system: bool
+    @rtype: FileSystemTree
+
+    >>> T = scan_file_system_sharded('TestFolder', 2)
+    >>> T.data_size
+    11
+    """
+    if disk_usage:
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode):
+            return FileSystemTree(path, [], allocated_size(info))
+        root_size = allocated_size(info)
+        device = info.st_dev if one_file_system else None
+        root_entries = list_directory_usage(path, device)
+    else:
+        if not os.path.isdir(path):
+            return FileSystemTree(path)
+        root_size = 0
+        device = None
+        root_entries = list_directory(path)
+
+    seen_inodes = InodeSet()
+    subtrees = []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        shards = []
+        for entry in root_entries:
+            if entry[1]:
+                shards.append(pool.submit(
+                    _scan_shard, os.path.join(path, entry[0]), entry[2],
+                    workers, disk_usage, device))
+            else:
+                shards.append(None)
+        # Shards are joined in the order of the root's entries, so hard
+        # links are de-duplicated in the same order as in build_tree.
+        for entry, shard in zip(root_entries, shards):
+            if shard is not None:
+                subtrees.append(_build_shard(shard.result(), seen_inodes))
+            else:
+                subtrees.append(FileSystemTree(
+                    entry[0], [], _dedup_size(entry, seen_inodes)))
+    if root_size != 0:
+        subtrees.append(FileSystemTree(os.curdir, [], root_size))
+    return FileSystemTree(path, subtrees)
+
+
+def _scan_shard(path, size, workers, disk_usage, device):
+    """Scan the folder at <path> in a worker process, and return it in the
+    compact form described in the module docstring.
+
+    The compact form is a tuple (names, child_counts, sizes, inodes):
+      - names is the name of every entry in the folder, in pre-order,
+        starting with the folder itself,
+      - child_counts is the number of entries directly inside each folder,
+        or -1 for a file,
+      - sizes is the size of each entry, as reported by the listing,
+      - inodes maps the pre-order position of each hard-linked file to its
+        inode.
+
+    @type path: str
+    @type size: int
+        The size of the entry for <path> in its parent's listing.
+    @type workers: int
+    @type disk_usage: bool
+    @type device: int | None
+    @rtype: (list[str], array[int], array[int], dict[int, int])
+    """
+    if disk_usage:
+        listings = scan_listings(path, workers,
+                                 partial(list_directory_usage, device=device))
+    else:
+        listings = scan_listings(path, workers)
+    names = [os.path.basename(path)]
+    child_counts = array('i', [len(listings[path])])
+    sizes = array('q', [size])
+    inodes = {}
+    stack = [(path, iter(listings[path]))]
+    while stack:
+        dir_path, entries = stack[-1]
+        for entry in entries:
+            names.append(entry[0])
+            sizes.append(entry[2])
+            if entry[1]:
+                subpath = os.path.join(dir_path, entry[0])
+                child_counts.append(len(listings[subpath]))
+                stack.append((subpath, iter(listings[subpath])))
+                break
+            child_counts.append(-1)
+            if len(entry) > 3 and entry[3] is not None:
+                inodes[len(names) - 1] = entry[3]
+        else:
+            stack.pop()
+    return names, child_counts, sizes, inodes
+
+
+def _build_shard(shard, seen_inodes):
+    """Return the FileSystemTree for a folder scanned by _scan_shard.
+
+    Hard-linked files whose inode is in <seen_inodes> get a data_size of 0,
+    and the inodes of the others are added to it.
+
+    @type shard: (list[str], array[int], array[int], dict[int, int])
+    @type seen_inodes: InodeSet
+    @rtype: FileSystemTree
+    """
+    names, child_counts, sizes, inodes = shard
+    # Each stack frame holds a folder name, the size of the folder itself,
+    # the number of its entries not built yet, and the subtrees built so
+    # far for the others.
+    stack = []
+    for position, name in enumerate(names):
+        if child_counts[position] < 0:
+            entry = name, False, sizes[position], inodes.get(position)
+            tree = FileSystemTree(name, [], _dedup_size(entry, seen_inodes))
+        else:
+            stack.append([name, sizes[position], child_counts[position], []])
+            tree = None
+            if child_counts[position] > 0:
+                continue
+        while True:
+            if tree is None:
+                name, dir_size, _, subtrees = stack.pop()
+                if dir_size != 0:
+                    subtrees.append(FileSystemTree(os.curdir, [], dir_size))
+                tree = FileSystemTree(name, subtrees)
+            if not stack:
+                return tree
+            stack[-1][3].append(tree)
+            stack[-1][2] -= 1
+            if stack[-1][2] > 0:
+                break
+            tree = None
+
+
+def _dedup_size(entry, seen_inodes):
+    """Return the size to use for the file <entry>: 0 if it is a hard link
+    to an inode already in <seen_inodes>, and its size otherwise.
+
+    The entry's inode, if it has one, is added to <seen_inodes>.
+
+    @type entry: tuple
+        (name, is_dir, size) or (name, is_dir, size, inode)
+    @type seen_inodes: InodeSet
+    @rtype: int
+    """
+    if len(entry) > 3 and entry[3] is not None and \
+            not seen_inodes.add(entry[3]):
+        return 0
+    return entry[2]
+
+
+class InodeSet:
+    """A set of files, identified as in list_directory_usage by their device
+    and inode number combined into one integer.
+
+    A Python set of such integers takes about 70 bytes per file, since
+    each is a separate integer object. Instead, the inode numbers of each
+    device are kept in their own hash table, in an array of 64-bit
+    integers that is at most three quarters full, which takes 11 to 21
+    bytes per file.
+
+    === Private Attributes ===
+    @type _tables: dict[int, array[int]]
+        The hash table of inode numbers for each device, with linear
+        probing. Its length is a power of two, and 0 marks an empty slot.
+    @type _counts: dict[int, int]
+        The number of inode numbers in each device's hash table.
+    @type _zero: set[int]
+        The devices whose inode number 0 is in this set, since it cannot
+        be stored in a hash table.
+    """
+    def __init__(self):
+        """Initialize a new, empty InodeSet.
+
+        @type self: InodeSet
+        @rtype: None
+        """
+        self._tables = {}
+        self._counts = {}
+        self._zero = set()
+
+    def __contains__(self, inode):
+        """Return whether <inode> is in this set.
+
+        @type self: InodeSet
+        @type inode: int
+        @rtype: bool
+
+        >>> inodes = InodeSet()
+        >>> inodes.add((3 << 64) | 12)
+        True
+        >>> (3 << 64) | 12 in inodes, (4 << 64) | 12 in inodes
+        (True, False)
+        """
+        device, number = inode >> 64, inode & _INODE_MASK
+        if number == 0:
+            return device in self._zero
+        table = self._tables.get(device)
+        return table is not None and table[_slot(table, number)] == number
+
+    def add(self, inode):
+        """Add <inode> to this set, and return True if it was not in this
+        set already.
+
+        @type self: InodeSet
+        @type inode: int
+        @rtype: bool
+
+        >>> inodes = InodeSet()
+        >>> inodes.add(12), inodes.add(12), 12 in inodes
+        (True, False, True)
+        """
+        device, number = inode >> 64, inode & _INODE_MASK
+        if number == 0:
+            if device in self._zero:
+                return False
+            self._zero.add(device)
+            return True
+        table = self._tables.get(device)
+        if table is None:
+            table = array('Q', bytes(8 * _INITIAL_SLOTS))
+            self._tables[device] = table
+            self._counts[device] = 0
+        slot = _slot(table, number)
+        if table[slot] == number:
+            return False
+        table[slot] = number
+        self._counts[device] += 1
+        if self._counts[device] * 4 > len(table) * 3:
+            self._tables[device] = _grown(table)
+        return True
+
+
+def _slot(table, number):
+    """Return the slot of the hash table <table> holding the inode number
+    <number>, or the empty slot where it would be added.
+
+    @type table: array[int]
+    @type number: int
+    @rtype: int
+    """
+    mask = len(table) - 1
+    slot = (number * _HASH_MULTIPLIER >> 32) & mask
+    while table[slot] != 0 and table[slot] != number:
+        slot = (slot + 1) & mask
+    return slot
+
+
+def _grown(table):
+    """Return a hash table twice the length of <table>, holding the same
+    inode numbers.
+
+    @type table: array[int]
+    @rtype: array[int]
+    """
+    grown = array('Q', bytes(16 * len(table)))
+    for number in table:
+        if number != 0:
+            grown[_slot(grown, number)] = number
+    return grown
+
+
+def list_directory(path):
+    """Return the entries of the directory at <path>.
+
+    Each entry is a tuple (name, is_dir, size). The size of a directory
+    entry is 0, since a directory's size is the total of its contents.
+
+    Like os.path.isdir and os.path.getsize, symbolic links are followed.
+
+    @type path: str
+    @rtype: list[(str, bool, int)]
+    """
+    entries = []
+    with os.scandir(path) as directory:
+        for entry in directory:
+            if entry.is_dir():
+                entries.append((entry.name, True, 0))
+            else:
+                entries.append((entry.name, False, entry.stat().st_size))
+    return entries
+
+
+def list_directory_usage(path, device=None):
+    """Return the entries of the directory at <path>, sized for disk usage
+    mode.
+
+    Each entry is a tuple (name, is_dir, size, inode). The size of every
+    entry, including a directory, is the space allocated to the entry
+    itself. inode identifies the file for hard link de-duplication if it
+    has more than one link, and is None otherwise.
+
+    Symbolic links are not followed.
+
+    @type path: str
+    @type device: int | None
+        If not None, directories on any other device are left out.
+    @rtype: list[(str, bool, int, int | None)]
+    """
+    entries = []
+    with os.scandir(path) as directory:
+        for entry in directory:
+            info = entry.stat(follow_symlinks=False)
+            is_dir = stat.S_ISDIR(info.st_mode)
+            if is_dir and device is not None and info.st_dev != device:
+                continue
+            inode = None
+            if not is_dir and info.st_nlink > 1:
+                inode = (info.st_dev << 64) | info.st_ino
+            entries.append((entry.name, is_dir, allocated_size(info), inode))
+    return entries
+
+
+def allocated_size(info):
+    """Return the number of bytes allocated on disk for the file described
+    by the stat result <info>.
+
+    The length of the file is used instead on systems which do not report
+    allocated blocks.
+
+    @type info: os.stat_result
+    @rtype: int
+    """
+    blocks = getattr(info, 'st_blocks', None)
+    if blocks is None:
+        return info.st_size
+    return blocks * 512
+
+
+def submit_listing(pool, list_dir, path, pending, finished):
+    """Start listing the directory <path> in <pool>.
+
+    The future is recorded in <pending> with <path>, and is put on
+    <finished> once it is done, so that finished listings can be taken in
+    the order they finish without looking at every pending one.
+
+    @type pool: ThreadPoolExecutor
+    @type list_dir: (str) -> list[tuple]
+    @type path: str
+    @type pending: dict[Future, str]
+    @type finished: Queue
+    @rtype: None
+    """
+    future = pool.submit(list_dir, path)
+    # The future must be in <pending> before it can reach <finished>.
+    pending[future] = path
+    future.add_done_callback(finished.put)
+
+
+def scan_listings(path, workers=DEFAULT_WORKERS, list_dir=list_directory):
+    """Return the listing of every directory under the directory <path>.
+
+    The returned dictionary maps the path of <path> and each of its
+    subdirectories to the entries returned by <list_dir> for it.
+    Subdirectory paths are formed with os.path.join, starting from <path>.
+
+    Precondition: <path> is a directory.
+                  workers >= 1
+
+    @type path: str
+    @type workers: int
+        The number of threads used to list directories.
+    @type list_dir: (str) -> list[tuple]
+        Lists a single directory. The first two items of each entry must be
+        the entry's name and whether it is a directory.
+    @rtype: dict[str, list[tuple]]
+    """
+    listings = {}
+    # Each future puts itself on <finished> when it is done, so taking the
+    # next result costs the same however many directories are pending.
+    finished = Queue()
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        submit_listing(pool, list_dir, path, pending, finished)
+        while pending:
+            future = finished.get()
+            dir_path = pending.pop(future)
+            entries = future.result()
+            listings[dir_path] = entries
+            for entry in entries:
+                if entry[1]:
+                    submit_listing(pool, list_dir,
+                                    os.path.join(dir_path, entry[0]),
+                                    pending, finished)
+    return listings
+
+
+def build_tree(path, listings, root_size=0):
+    """Return the FileSystemTree for the directory <path> from <listings>.
+
+    The tree is built bottom-up using an explicit stack, so arbitrarily deep
+    directory structures do not hit Python's recursion limit.
+
+    Entries may carry a fourth item, as in disk usage mode. Then, a file
+    whose inode has already been seen gets a data_size of 0, and a
+    directory entry with a non-zero size gets an extra leaf named '.' with
+    that size, for the space allocated to the directory itself.
+
+    Precondition: <listings> contains the listing of <path> and of every
+                  directory under it, as returned by scan_listings.
+
+    @type path: str
+    @type listings: dict[str, list[tuple]]
+    @type root_size: int
+        The space allocated to <path> itself.
+    @rtype: FileSystemTree
+    """
+    seen_inodes = InodeSet()
+    # Each stack frame holds a directory path, the size of the directory
+    # itself, an iterator over the entries of that directory which have not
+    # been visited yet, and the subtrees built so far for the entries which
+    # have.
+    stack = [(path, root_size, iter(listings[path]), [])]
+    while True:
+        dir_path, dir_size, entries, subtrees = stack[-1]
+        for entry in entries:
+            if entry[1]:
+                subpath = os.path.join(dir_path, entry[0])
+                stack.append((subpath, entry[2], iter(listings[subpath]), []))
+                break
+            subtrees.append(FileSystemTree(
+                entry[0], [], _dedup_size(entry, seen_inodes)))
+        else:
+            stack.pop()
+            if dir_size != 0:
+                subtrees.append(FileSystemTree(os.curdir, [], dir_size))
+            tree = FileSystemTree(dir_path, subtrees)
+            if not stack:
+                return tree
+            stack[-1][3].append(tree)
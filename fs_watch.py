@@ -0,0 +1,549 @@
+"""Assignment 2: Watching the File System
+
+=== Module Description ===
+This module contains watchers which keep a FileSystemTree up to date while
+files are created, deleted and resized underneath it, without rescanning
+the whole folder.
+
+A watcher finds the node of the tree at each path under the watched folder
+through a PathIndex. Each call to poll applies the changes seen since the
+previous call:
+  - a created file or folder is scanned and inserted into its parent folder,
+  - a deleted file or folder is removed from its parent folder,
+  - a resized file has its data_size changed.
+In every case the data_size of all parent folders is updated through
+AbstractTree.update_data_size.
+
+The watcher keeps its PathIndex in sync with the changes it makes. Any
+other edits to the tree, such as the user deleting files in the treemap
+visualiser, should keep the same index in sync, e.g. by going through an
+EditJournal given it. A node deleted some other way is still recognized as
+no longer in the tree, and left alone, but at the cost of searching the
+subtrees of every folder above it.
+
+A tree scanned in disk usage mode (see fs_scan) is watched in the same
+mode, so that every size in it is an allocated size. A file with several
+hard links keeps the size it was scanned with, since it is not known which
+of its links was counted.
+
+If inotify drops changes because too many happened at once, the whole
+folder is scanned again, and its subtrees in the tree are replaced.
+
+Two watchers are provided:
+  - InotifyWatcher uses the Linux inotify API, so it only does work when
+    something actually changes.
+  - PollingWatcher works everywhere, by rescanning the folder every few
+    seconds and comparing against the previous scan. It is meant for small
+    folders and local testing.
+Use watch_tree to get the best watcher available on this computer.
+"""
+import os
+import sys
+import time
+import struct
+import ctypes
+import ctypes.util
+import stat
+
+from tree_data import FileSystemTree
+from path_index import PathIndex
+from fs_scan import scan_file_system, allocated_size
+
+
+# The kinds of change a watcher can apply to its tree.
+CREATED = 'created'
+DELETED = 'deleted'
+MODIFIED = 'modified'
+RESCAN = 'rescan'
+
+# inotify event flags, from <sys/inotify.h>.
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+               _IN_CREATE | _IN_DELETE)
+
+# The fixed-size part of a struct inotify_event: wd, mask, cookie, len.
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def watch_tree(tree, path, interval=1.0, paths=None, disk_usage=False):
+    """Return a watcher that keeps <tree> up to date with the folder <path>.
+
+    An InotifyWatcher is returned if inotify is available on this computer,
+    and a PollingWatcher otherwise.
+
+    Precondition: <tree> was scanned from the folder <path>.
+
+    @type tree: FileSystemTree
+    @type path: str
+    @type interval: float
+        The minimum number of seconds between rescans, if polling is used.
+    @type paths: PathIndex | None
+        The index of the paths in <tree>, if one is kept in sync with the
+        other edits to it; a new one is built otherwise.
+    @type disk_usage: bool
+        True if <tree> was scanned in disk usage mode.
+    @rtype: TreeWatcher
+    """
+    if inotify_available():
+        return InotifyWatcher(tree, path, paths, disk_usage)
+    return PollingWatcher(tree, path, interval, paths, disk_usage)
+
+
+def inotify_available():
+    """Return True if the inotify API can be used on this computer.
+
+    @rtype: bool
+    """
+    return sys.platform.startswith('linux') and _load_libc() is not None
+
+
+def _load_libc():
+    """Return the C library with its inotify functions, or None if it does
+    not provide them.
+
+    @rtype: ctypes.CDLL | None
+    """
+    name = ctypes.util.find_library('c')
+    if name is None:
+        return None
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+
+class TreeWatcher:
+    """Applies changes to a folder on disk to the FileSystemTree scanned
+    from it.
+
+    This is an abstract class: subclasses decide how changes are detected by
+    implementing _read_changes.
+
+    === Private Attributes ===
+    @type _path: str
+        The path of the watched folder.
+    @type _tree: FileSystemTree
+        The tree kept up to date.
+    @type _paths: PathIndex
+        The index of the paths in the tree, as get_separator gives them.
+    @type _disk_usage: bool
+        True if the tree was scanned in disk usage mode.
+    """
+    def __init__(self, tree, path, paths=None, disk_usage=False):
+        """Initialize a new watcher for the folder <path>.
+
+        Precondition: <tree> was scanned from the folder <path>.
+
+        @type self: TreeWatcher
+        @type tree: FileSystemTree
+        @type path: str
+        @type paths: PathIndex | None
+            The index of the paths in <tree>, if one is kept in sync with
+            the other edits to it; a new one is built otherwise.
+        @type disk_usage: bool
+            True if <tree> was scanned in disk usage mode.
+        @rtype: None
+        """
+        self._path = path
+        self._tree = tree
+        if paths is None:
+            paths = PathIndex(tree)
+        self._paths = paths
+        self._disk_usage = disk_usage
+
+    def poll(self):
+        """Apply all changes made on disk since the last call to the tree.
+
+        Return True if the tree was changed.
+
+        @type self: TreeWatcher
+        @rtype: bool
+        """
+        changed = False
+        for kind, path in self._read_changes():
+            if self._apply(kind, path):
+                changed = True
+        return changed
+
+    def close(self):
+        """Stop watching the folder.
+
+        @type self: TreeWatcher
+        @rtype: None
+        """
+        pass
+
+    def _read_changes(self):
+        """Return the changes made on disk since the last call.
+
+        Each change is a tuple (kind, path), where kind is one of CREATED,
+        DELETED and MODIFIED, or RESCAN with the watched folder's path if
+        changes were lost.
+
+        @type self: TreeWatcher
+        @rtype: list[(str, str)]
+        """
+        raise NotImplementedError
+
+    def _apply(self, kind, path):
+        """Apply a single change to the tree, and return True if the tree
+        was changed.
+
+        Changes to paths which have since disappeared from disk are ignored,
+        as a DELETED change for them will follow.
+
+        @type self: TreeWatcher
+        @type kind: str
+        @type path: str
+        @rtype: bool
+        """
+        if kind == RESCAN:
+            self._rescan()
+            return True
+        node = self._find(path)
+        try:
+            if kind == CREATED:
+                parent = self._find(os.path.dirname(path))
+                if parent is None or not self._in_tree(parent):
+                    return False
+                if node is not None:
+                    self._remove(node)
+                created = scan_file_system(path, disk_usage=self._disk_usage)
+                parent.insert_child(created)
+                self._paths.add(created)
+                return True
+            elif node is None or node is self._tree:
+                return False
+            elif not self._in_tree(node):
+                self._paths.remove(node)
+                return False
+            elif kind == DELETED:
+                self._remove(node)
+                return True
+            elif node._subtrees == []:
+                size_change = self._file_size(path, node) - node.data_size
+                node.data_size += size_change
+                node.update_data_size(size_change)
+                return size_change != 0
+            return False
+        except FileNotFoundError:
+            return False
+
+    def _in_tree(self, node):
+        """Return True if <node> is still inside the tree, i.e. was not
+        deleted from it, or from a folder deleted from it, without this
+        watcher's PathIndex being told.
+
+        @type self: TreeWatcher
+        @type node: FileSystemTree
+        @rtype: bool
+        """
+        while node is not self._tree:
+            parent = node._parent_tree
+            if parent is None or node not in parent._subtrees:
+                return False
+            node = parent
+        return True
+
+    def _file_size(self, path, node):
+        """Return the size of the file at <path>, found at <node>, as the
+        tree was scanned: its length, or in disk usage mode, the space
+        allocated to it.
+
+        Anything other than a regular file keeps the size of <node>, as
+        does a file with several hard links in disk usage mode.
+
+        @type self: TreeWatcher
+        @type path: str
+        @type node: FileSystemTree
+        @rtype: int
+        """
+        if not self._disk_usage:
+            if not os.path.isfile(path):
+                return node.data_size
+            return os.path.getsize(path)
+        info = os.lstat(path)
+        if not stat.S_ISREG(info.st_mode) or info.st_nlink > 1:
+            return node.data_size
+        return allocated_size(info)
+
+    def _rescan(self):
+        """Scan the watched folder again, and replace the subtrees of the
+        tree with the ones scanned.
+
+        Nodes deleted this way are gone for good: an EditJournal of the
+        tree can no longer undo the edits it made to them.
+
+        @type self: TreeWatcher
+        @rtype: None
+        """
+        scanned = scan_file_system(self._path, disk_usage=self._disk_usage)
+        old_subtrees = list(self._tree._subtrees)
+        for subtree in old_subtrees:
+            self._paths.remove(subtree)
+        self._tree.delete_subtrees(old_subtrees)
+        for subtree in scanned._subtrees:
+            self._tree.insert_child(subtree)
+            self._paths.add(subtree)
+
+    def _find(self, path):
+        """Return the node of the tree at <path> on disk, or None if there
+        is none.
+
+        @type self: TreeWatcher
+        @type path: str
+        @rtype: FileSystemTree | None
+        """
+        relative = os.path.relpath(path, self._path)
+        if relative == os.curdir:
+            return self._tree
+        return self._paths.find(os.path.join(self._tree.get_separator(),
+                                             relative))
+
+    def _remove(self, node):
+        """Remove <node> and everything inside it from the tree and from
+        its index.
+
+        @type self: TreeWatcher
+        @type node: FileSystemTree
+        @rtype: None
+        """
+        self._paths.remove(node)
+        node.delete_selected_leaf()
+
+
+class InotifyWatcher(TreeWatcher):
+    """A watcher which is told about changes by the Linux inotify API.
+
+    inotify watches are not recursive, so every folder under the watched
+    folder gets its own watch, including folders created later.
+
+    === Private Attributes ===
+    @type _libc: ctypes.CDLL
+    @type _fd: int
+        The inotify file descriptor, opened in non-blocking mode.
+    @type _watches: dict[int, str]
+        The folder path for each inotify watch descriptor.
+    """
+    def __init__(self, tree, path, paths=None, disk_usage=False):
+        """Initialize a new watcher for the folder <path>.
+
+        Precondition: <tree> was scanned from the folder <path>.
+                      inotify_available()
+
+        @type self: InotifyWatcher
+        @type tree: FileSystemTree
+        @type path: str
+        @type paths: PathIndex | None
+        @type disk_usage: bool
+        @rtype: None
+        """
+        TreeWatcher.__init__(self, tree, path, paths, disk_usage)
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watches = {}
+        self._watch_folders(path)
+
+    def close(self):
+        """Stop watching the folder.
+
+        @type self: InotifyWatcher
+        @rtype: None
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _watch_folders(self, path):
+        """Add a watch for the folder <path> and every folder inside it.
+
+        @type self: InotifyWatcher
+        @type path: str
+        @rtype: None
+        """
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder),
+                                              _WATCH_MASK)
+            if wd < 0:
+                # The folder was removed or cannot be read; any change to it
+                # will be reported on its parent.
+                continue
+            self._watches[wd] = folder
+            try:
+                with os.scandir(folder) as directory:
+                    for entry in directory:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                pass
+
+    def _read_changes(self):
+        """Return the changes reported by inotify since the last call.
+
+        Repeated MODIFIED changes for the same path are merged into one.
+        If inotify's queue overflowed, changes were lost, so a single
+        RESCAN is returned instead.
+
+        @type self: InotifyWatcher
+        @rtype: list[(str, str)]
+        """
+        changes = []
+        modified = set()
+        overflowed = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    overflowed = True
+                    continue
+                if mask & _IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                if wd not in self._watches or not name:
+                    continue
+                path = os.path.join(self._watches[wd], os.fsdecode(name))
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    changes.append((CREATED, path))
+                elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    changes.append((DELETED, path))
+                elif path not in modified:
+                    modified.add(path)
+                    changes.append((MODIFIED, path))
+        if overflowed:
+            return [(RESCAN, self._path)]
+        return changes
+
+    def _apply(self, kind, path):
+        """Apply a single change to the tree, and return True if the tree
+        was changed. Created folders, and after a rescan any folders missed,
+        are watched as well.
+
+        @type self: InotifyWatcher
+        @type kind: str
+        @type path: str
+        @rtype: bool
+        """
+        changed = TreeWatcher._apply(self, kind, path)
+        if changed and kind in (CREATED, RESCAN) and os.path.isdir(path):
+            self._watch_folders(path)
+        return changed
+
+
+class PollingWatcher(TreeWatcher):
+    """A watcher which finds changes by rescanning the folder and comparing
+    the result with the previous scan.
+
+    === Private Attributes ===
+    @type _interval: float
+        The minimum number of seconds between rescans.
+    @type _last_scan: float
+        The time of the last rescan, as reported by time.monotonic.
+    @type _entries: dict[str, (bool, int)]
+        For every path under the folder in the last scan, whether it is a
+        folder, and its size if it is a file.
+    """
+    def __init__(self, tree, path, interval=1.0, paths=None,
+                 disk_usage=False):
+        """Initialize a new watcher for the folder <path>.
+
+        Precondition: <tree> was scanned from the folder <path>.
+
+        @type self: PollingWatcher
+        @type tree: FileSystemTree
+        @type path: str
+        @type interval: float
+        @type paths: PathIndex | None
+        @type disk_usage: bool
+        @rtype: None
+        """
+        TreeWatcher.__init__(self, tree, path, paths, disk_usage)
+        self._interval = interval
+        self._last_scan = time.monotonic()
+        self._entries = self._scan()
+
+    def _scan(self):
+        """Return whether each path under the folder is a folder, and its
+        size if it is a file.
+
+        @type self: PollingWatcher
+        @rtype: dict[str, (bool, int)]
+        """
+        entries = {}
+        stack = [self._path]
+        while stack:
+            folder = stack.pop()
+            try:
+                with os.scandir(folder) as directory:
+                    for entry in directory:
+                        if entry.is_dir():
+                            entries[entry.path] = True, 0
+                            stack.append(entry.path)
+                        else:
+                            entries[entry.path] = False, entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def _read_changes(self):
+        """Return the differences between a new scan and the previous one,
+        if at least _interval seconds have passed since the previous one.
+
+        Only the topmost created or deleted path is reported when a whole
+        folder is created or deleted.
+
+        @type self: PollingWatcher
+        @rtype: list[(str, str)]
+        """
+        now = time.monotonic()
+        if now - self._last_scan < self._interval:
+            return []
+        self._last_scan = now
+        old, new = self._entries, self._scan()
+        self._entries = new
+        changes = []
+        for path in sorted(old):
+            if path not in new or new[path][0] != old[path][0]:
+                if not _inside_any(path, old, new):
+                    changes.append((DELETED, path))
+        for path in sorted(new):
+            if path not in old or new[path][0] != old[path][0]:
+                if not _inside_any(path, new, old):
+                    changes.append((CREATED, path))
+            elif new[path] != old[path]:
+                changes.append((MODIFIED, path))
+        return changes
+
+
+def _inside_any(path, entries, other):
+    """Return True if the parent folder of <path> is in <entries> but is not
+    in <other> as a folder, i.e. the parent itself was created or deleted.
+
+    @type path: str
+    @type entries: dict[str, (bool, int)]
+    @type other: dict[str, (bool, int)]
+    @rtype: bool
+    """
+    parent = os.path.dirname(path)
+    return parent in entries and other.get(parent, (False, 0))[0] is False
@@ -0,0 +1,253 @@
+"""Assignment 2: Lazy File System Trees
+
+=== Module Description ===
+This module contains LazyFileSystemTree, a FileSystemTree which only creates
+nodes for the parts of a folder that are big enough to be seen.
+
+A treemap drawn in a window cannot show more rectangles than the window has
+pixels, but FileSystemTree creates a node for every file. A
+LazyFileSystemTree starts out *collapsed*: it has no subtrees, and its
+data_size is the total size of everything inside its folder. Each time the
+treemap is generated, every collapsed folder that would be drawn with an
+area of at least min_area pixels is *expanded*, by creating nodes for the
+files and folders directly inside it (subfolders start out collapsed).
+Clicking on a collapsed folder also expands it. Only the parts of the tree
+whose cached layout was discarded since the last treemap are looked at
+again, so redrawing an unchanged tree does not walk it.
+
+Folder sizes are computed once, in a single walk of the folder, and kept in
+a dictionary shared by the whole tree, so expanding a folder does not walk
+it again. Only one number is kept per folder and no objects are created for
+files that are never shown, so memory use depends on the number of folders
+and on what is visible, rather than on the number of files.
+
+The first treemap needs the total size of every folder, so start-up still
+reads the size of every file once. What is saved is creating a node for
+each of them. Passing the same <sizes> dictionary to a new
+LazyFileSystemTree reuses the totals already computed instead of walking
+the folder again.
+"""
+import os
+
+from tree_data import FileSystemTree, slice_rect
+from fs_scan import list_directory
+
+
+# Collapsed folders drawn with at least this many pixels are expanded.
+DEFAULT_MIN_AREA = 64
+
+
+class LazyFileSystemTree(FileSystemTree):
+    """A FileSystemTree whose folders are only expanded into subtrees when
+    they are drawn large enough to be seen.
+
+    Only folders are represented by LazyFileSystemTree objects; files are
+    plain FileSystemTree leaves.
+
+    === Private Attributes ===
+    @type _path: str
+        The path of this folder on disk.
+    @type _min_area: int
+        Collapsed folders drawn with at least this many pixels are expanded.
+    @type _sizes: dict[str, int]
+        The total size of each folder walked so far, shared by every
+        LazyFileSystemTree in the same tree.
+    @type _collapsed: bool
+        True if the contents of this folder have not been added as subtrees
+        yet.
+
+    === Representation Invariants ===
+    - If _collapsed is True, then _subtrees is empty and data_size is the
+      total size of all files in this folder.
+    """
+    def __init__(self, path, min_area=DEFAULT_MIN_AREA, sizes=None):
+        """Initialize a new, collapsed tree for the folder at <path>.
+
+        Precondition: <path> is a folder on this computer.
+
+        @type self: LazyFileSystemTree
+        @type path: str
+        @type min_area: int
+        @type sizes: dict[str, int] | None
+            The folder sizes computed so far. A new dictionary is used if
+            this is None.
+        @rtype: None
+
+        >>> T = LazyFileSystemTree('TestFolder')
+        >>> T.data_size
+        11
+        >>> T._subtrees
+        []
+        """
+        if sizes is None:
+            sizes = {}
+        self._path = path
+        self._min_area = min_area
+        self._sizes = sizes
+        self._collapsed = True
+        FileSystemTree.__init__(self, path, [], folder_size(path, sizes))
+
+    def expand(self):
+        """Add the files and folders directly inside this folder as
+        subtrees, if that has not been done already.
+
+        If the folder has changed on disk since its size was computed, the
+        data_size of this tree and of its parent trees is updated to match
+        its new contents.
+
+        @type self: LazyFileSystemTree
+        @rtype: None
+
+        >>> T = LazyFileSystemTree('TestFolder')
+        >>> T.expand()
+        >>> len(T._subtrees)
+        3
+        >>> T._subtrees[0]._subtrees
+        []
+        """
+        if not self._collapsed:
+            return
+        self._collapsed = False
+        for name, is_dir, size in list_directory(self._path):
+            if is_dir:
+                subtree = LazyFileSystemTree(os.path.join(self._path, name),
+                                             self._min_area, self._sizes)
+            else:
+                subtree = FileSystemTree(name, [], size)
+            subtree._parent_tree = self
+            self._subtrees.append(subtree)
+        size_change = sum(subtree.data_size for subtree in self._subtrees) - \
+            self.data_size
+        self.data_size += size_change
+        self.update_data_size(size_change)
+
+    def expand_visible(self, rect, strategy=None, min_area=0):
+        """Expand every collapsed folder in this tree that would be drawn
+        with at least min_area pixels when this tree is drawn in <rect>.
+
+        Subtrees drawn with fewer than <min_area> pixels are not divided by
+        generate_treemap, so no folder inside them is expanded. Subtrees
+        whose cached layout is for the same rectangle, strategy and
+        min_area have not changed since they were last expanded and laid
+        out, so they are not walked again.
+
+        @type self: LazyFileSystemTree
+        @type rect: (int, int, int, int)
+        @type strategy: callable | None
+            The layout strategy, as for AbstractTree.generate_treemap.
+        @type min_area: int
+        @rtype: None
+        """
+        if strategy is None:
+            strategy = slice_rect
+        stack = [(self, rect)]
+        while stack:
+            tree, rect = stack.pop()
+            layout = tree._layout
+            if layout is not None and layout[0] == rect and \
+                    layout[1] is strategy and layout[2] == min_area:
+                continue
+            if isinstance(tree, LazyFileSystemTree) and tree._collapsed:
+                if rect[2] * rect[3] < tree._min_area:
+                    continue
+                tree.expand()
+            if tree.data_size != 0 and tree._subtrees != [] and \
+                    rect[2] * rect[3] >= min_area:
+                stack.extend(tree._sub_rects(rect, strategy))
+
+    def iter_treemap(self, rect, strategy=None, min_area=0):
+        """Yield the rectangles of the treemap of this tree, one at a time.
+
+        Collapsed folders that are drawn large enough are expanded first.
+        Collapsed folders that are still too small are drawn as a single
+        rectangle.
+
+        @type self: LazyFileSystemTree
+        @type rect: (int, int, int, int)
+        @type strategy: callable | None
+        @type min_area: int
+        @rtype: generator
+        """
+        self.expand_visible(rect, strategy, min_area)
+        return FileSystemTree.iter_treemap(self, rect, strategy, min_area)
+
+    def generate_treemap(self, rect, changed=None, strategy=None,
+                         min_area=0):
+        """Run the treemap algorithm on this tree and return the rectangles.
+
+        Collapsed folders that are drawn large enough are expanded first.
+
+        @type self: LazyFileSystemTree
+        @type rect: (int, int, int, int)
+        @type changed: list[(AbstractTree, (int, int, int, int))] | None
+        @type strategy: callable | None
+        @type min_area: int
+        @rtype: list[((int, int, int, int), (int, int, int))]
+        """
+        self.expand_visible(rect, strategy, min_area)
+        return FileSystemTree.generate_treemap(self, rect, changed, strategy,
+                                               min_area)
+
+    def find_leaf(self, rect, coordinations, strategy=None):
+        """find the corresponding leaf given the coordinations and the pygame
+        rectangle
+
+        Collapsed folders that are clicked on are expanded, so the leaf
+        returned is always a file or an empty folder.
+
+        @type self: LazyFileSystemTree
+        @type rect: (int, int, int, int)
+        @type coordinations: (int, int)
+        @type strategy: callable | None
+        @rtype: AbstractTree | None
+        """
+        while True:
+            leaf = FileSystemTree.find_leaf(self, rect, coordinations,
+                                            strategy)
+            if not isinstance(leaf, LazyFileSystemTree) or \
+                    not leaf._collapsed:
+                return leaf
+            leaf.expand()
+
+
+def folder_size(path, sizes):
+    """Return the total size of all files in the folder at <path>.
+
+    The size of <path> and of every folder inside it is recorded in <sizes>,
+    and folders already in <sizes> are not walked again. Like the
+    FileSystemTree constructor, symbolic links are followed.
+
+    @type path: str
+    @type sizes: dict[str, int]
+    @rtype: int
+
+    >>> sizes = {}
+    >>> folder_size('TestFolder', sizes)
+    11
+    >>> sizes[os.path.join('TestFolder', 'F1')]
+    3
+    """
+    if path in sizes:
+        return sizes[path]
+    # Each stack frame holds a folder path, an iterator over the entries of
+    # that folder which have not been visited yet, and the total size of
+    # the entries which have.
+    stack = [[path, iter(list_directory(path)), 0]]
+    while True:
+        frame = stack[-1]
+        for name, is_dir, size in frame[1]:
+            if not is_dir:
+                frame[2] += size
+                continue
+            subpath = os.path.join(frame[0], name)
+            if subpath in sizes:
+                frame[2] += sizes[subpath]
+            else:
+                stack.append([subpath, iter(list_directory(subpath)), 0])
+                break
+        else:
+            stack.pop()
+            sizes[frame[0]] = frame[2]
+            if not stack:
+                return frame[2]
+            stack[-1][2] += frame[2]
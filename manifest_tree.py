@@ -0,0 +1,187 @@
+"""Assignment 2: File System Trees from Manifests
+
+=== Module Description ===
+This module builds a FileSystemTree from a file listing (a *manifest*)
+instead of from the disk itself.
+
+A manifest is what
+
+    find <root> -printf '%s %p\\0'
+
+prints: one record per file or folder, each holding the size in bytes, a
+space and the path, with records separated by NUL characters. Manifests may
+be gzip-compressed. find lists a folder before its contents and lists the
+contents of each folder together, so the manifest is read as a stream:
+only the folders on the path of the current record are kept open, and
+every other folder is turned into a finished subtree as soon as the
+listing moves past it. The manifest itself is never loaded into memory.
+
+The record for a folder is recognized by the records for its contents that
+follow it. Folders are sized like FileSystemTree folders, by adding up
+their contents, so the size printed for a folder itself is ignored.
+Manifests without folder records (e.g. from find -type f) work as well;
+the folders are then created from the file paths. Note that an empty
+folder cannot be told apart from a file, so it appears as a leaf with the
+size find printed for it.
+"""
+import os
+import gzip
+
+from tree_data import FileSystemTree
+
+
+# The number of bytes read from a manifest at once.
+_CHUNK_SIZE = 1 << 20
+
+# The first bytes of every gzip file.
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+def tree_from_manifest(manifest_path, root=None, separator=b'\0'):
+    """Return a FileSystemTree of the files listed in the manifest at
+    <manifest_path>.
+
+    If <root> is None, the first record of the manifest is used as the
+    root, as is the case for find's output. Otherwise, the tree is rooted
+    at the folder <root>, and records for <root> itself are skipped.
+
+    Raise ValueError if a record is malformed, or lies outside the root.
+
+    Precondition: records are in the order find prints them: every record
+                  comes after the record for its folder, if there is one,
+                  and the records inside each folder are contiguous.
+
+    @type manifest_path: str
+    @type root: str | None
+    @type separator: bytes
+        The byte separating records; use b'\\n' for newline-separated
+        manifests.
+    @rtype: FileSystemTree
+    """
+    records = _read_records(manifest_path, separator)
+    if root is None:
+        first = next(records, None)
+        if first is None:
+            raise ValueError('manifest is empty: ' + manifest_path)
+        root, root_size = first
+    else:
+        root_size = 0
+    root_parts = _split_path(root)
+    # The stack holds the name and the subtrees built so far of each folder
+    # on the path of the most recent record, starting with the root.
+    # open_parts holds the names of the open folders below the root.
+    stack = [(root_parts[-1], [])]
+    open_parts = []
+    # The most recent record is held back until the next one shows whether
+    # it is a file or a folder.
+    pending = None
+    for path, size in records:
+        parts = _split_path(path)
+        if parts[:len(root_parts)] != root_parts:
+            raise ValueError('record is outside ' + root + ': ' + path)
+        parts = parts[len(root_parts):]
+        if parts == []:
+            continue
+        if pending is not None:
+            pending_parts, pending_size = pending
+            if parts[:len(pending_parts)] == pending_parts:
+                stack.append((pending_parts[-1], []))
+                open_parts.append(pending_parts[-1])
+            else:
+                stack[-1][1].append(
+                    FileSystemTree(pending_parts[-1], [], pending_size))
+        while parts[:len(open_parts)] != open_parts or \
+                len(open_parts) >= len(parts):
+            _close_folder(stack)
+            open_parts.pop()
+        for name in parts[len(open_parts):-1]:
+            stack.append((name, []))
+            open_parts.append(name)
+        pending = parts, size
+    if pending is not None:
+        stack[-1][1].append(FileSystemTree(pending[0][-1], [], pending[1]))
+    elif len(stack) == 1 and stack[0][1] == [] and root_size != 0:
+        # The manifest lists a single file.
+        return FileSystemTree(root_parts[-1], [], root_size)
+    while len(stack) > 1:
+        _close_folder(stack)
+    return FileSystemTree(stack[0][0], stack[0][1])
+
+
+def _close_folder(stack):
+    """Turn the folder at the top of <stack> into a FileSystemTree, and add
+    it to the subtrees of the folder below it.
+
+    @type stack: list[(str, list[FileSystemTree])]
+    @rtype: None
+    """
+    name, subtrees = stack.pop()
+    stack[-1][1].append(FileSystemTree(name, subtrees))
+
+
+def _split_path(path):
+    """Return the components of the manifest path <path>.
+
+    @type path: str
+    @rtype: list[str]
+
+    >>> _split_path('./a/b/')
+    ['.', 'a', 'b']
+    >>> _split_path('/data')
+    ['', 'data']
+    >>> _split_path('/')
+    ['']
+    """
+    path = path.rstrip('/')
+    if path == '':
+        # The root folder: its contents are split as ['', <name>, ...].
+        return ['']
+    return path.split('/')
+
+
+def _read_records(manifest_path, separator):
+    """Yield (path, size) for every record in the manifest at
+    <manifest_path>, reading it in fixed-size chunks.
+
+    Raise ValueError if a record is malformed.
+
+    @type manifest_path: str
+    @type separator: bytes
+    @rtype: generator
+    """
+    with open(manifest_path, 'rb') as raw_file:
+        compressed = raw_file.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+    if compressed:
+        file = gzip.open(manifest_path, 'rb')
+    else:
+        file = open(manifest_path, 'rb')
+    with file:
+        leftover = b''
+        while True:
+            chunk = file.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            records = (leftover + chunk).split(separator)
+            leftover = records.pop()
+            for record in records:
+                if record:
+                    yield _parse_record(record)
+        if leftover:
+            yield _parse_record(leftover)
+
+
+def _parse_record(record):
+    """Return the path and size in a single manifest record.
+
+    Raise ValueError if <record> is not a size, a space and a path.
+
+    @type record: bytes
+    @rtype: (str, int)
+
+    >>> _parse_record(b'15 ./a b.txt')
+    ('./a b.txt', 15)
+    """
+    size, space, path = record.partition(b' ')
+    if not space or not size.isdigit() or not path:
+        raise ValueError('malformed manifest record: ' + repr(record))
+    return os.fsdecode(path), int(size)
@@ -0,0 +1,172 @@
+"""Assignment 2: Parallel Treemap Layout
+
+=== Module Description ===
+This module lays out the treemap of a very large tree with a pool of worker
+processes.
+
+Once the rectangle of a tree is known, the layout of each of its subtrees
+depends only on that subtree and the rectangle it gets, so subtrees can be
+laid out independently of each other. parallel_treemap lays out the top
+levels of the tree itself, down to a chosen split depth, which gives the
+rectangle of every subtree at that depth. Each of those subtrees is then
+laid out by a worker, and the rectangles the workers return are put
+together in the order of the subtrees, so the result is exactly the list
+generate_treemap returns.
+
+The workers are processes rather than threads, so that they run in
+parallel in spite of the global interpreter lock. The tree is sent to each
+worker once, when the worker starts, as a CompactTree: its columns are
+pickled as flat arrays, whereas pickling an AbstractTree would take every
+parent of the subtree along with it. A job is then just the row of a
+subtree and its rectangle. The rectangles come back packed into flat
+arrays of numbers, which are much faster to pickle than lists of tuples.
+"""
+import os
+from array import array
+from struct import iter_unpack
+from concurrent.futures import ProcessPoolExecutor
+
+from tree_data import AbstractTree
+from compact_tree import CompactNode, NO_NODE, compact_from_tree
+
+
+# Subtrees this many levels below the root are laid out by the workers.
+DEFAULT_SPLIT_DEPTH = 2
+
+# The number of batches the jobs are split into for each worker, so that a
+# worker which finishes early can take over work from a slower one.
+_BATCHES_PER_WORKER = 4
+
+# The CompactTree laid out by this worker process.
+_worker_tree = None
+
+
+def parallel_treemap(tree, rect, split_depth=DEFAULT_SPLIT_DEPTH,
+                     workers=None, strategy=None, min_area=0):
+    """Return the treemap of <tree> drawn in <rect>, laid out by a pool of
+    worker processes.
+
+    The rectangles are exactly the ones generate_treemap returns for the
+    same arguments. An AbstractTree is copied with compact_from_tree first,
+    and is not changed.
+
+    Precondition: split_depth >= 0
+                  workers is None or workers >= 1
+                  <strategy> is None or a module-level function, so that it
+                  can be sent to the workers.
+
+    @type tree: AbstractTree | CompactNode
+    @type rect: (int, int, int, int)
+    @type split_depth: int
+        The depth below <tree> of the subtrees laid out by the workers.
+        The levels above it are laid out by this process.
+    @type workers: int | None
+        The number of worker processes, or None for one per processor.
+    @type strategy: callable | None
+        The layout strategy, as for AbstractTree.generate_treemap.
+    @type min_area: int
+        Subtrees drawn with fewer pixels are not divided, as for
+        AbstractTree.generate_treemap.
+    @rtype: list[((int, int, int, int), (int, int, int))]
+
+    >>> from tree_data import FileSystemTree
+    >>> T = FileSystemTree('TestFolder')
+    >>> parallel_treemap(T, (0, 0, 100, 50), 1, 2) == \\
+    ...     T.generate_treemap((0, 0, 100, 50))
+    True
+    """
+    if isinstance(tree, AbstractTree):
+        tree = compact_from_tree(tree).root()
+    parts, jobs = _split_layout(tree, rect, split_depth, strategy, min_area)
+    if jobs == []:
+        return parts
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunk_size = max(1, len(jobs) // (workers * _BATCHES_PER_WORKER))
+    tree_map = []
+    with ProcessPoolExecutor(workers, initializer=_start_worker,
+                             initargs=(tree._tree,)) as pool:
+        results = pool.map(_layout_job, jobs, chunksize=chunk_size)
+        for part in parts:
+            if part is None:
+                coordinates, colours = next(results)
+                tree_map.extend(zip(iter_unpack('4i', coordinates),
+                                    iter_unpack('3B', colours)))
+            else:
+                tree_map.append(part)
+    return tree_map
+
+
+def _split_layout(node, rect, split_depth, strategy, min_area):
+    """Lay out the levels of <node> above <split_depth>, and return the
+    rectangles found and the jobs left for the workers.
+
+    The first list holds the rectangles of the treemap in order, with
+    None in place of the rectangles of each subtree left to a worker. The
+    second list holds the job for each None, in the same order.
+
+    @type node: CompactNode
+    @type rect: (int, int, int, int)
+    @type split_depth: int
+    @type strategy: callable | None
+    @type min_area: int
+    @rtype: (list[((int, int, int, int), (int, int, int)) | None],
+             list[(int, (int, int, int, int), callable | None, int)])
+    """
+    tree = node._tree
+    parts = []
+    jobs = []
+    if tree._sizes[node._index] == 0:
+        return parts, jobs
+    # As in CompactNode.iter_treemap, each stack frame is an iterator over
+    # the non-empty children of a node and their rectangles, so the nodes
+    # in the frame at stack[depth] are depth levels below <node>.
+    stack = [iter([(node._index, rect)])]
+    while stack:
+        for index, rect in stack[-1]:
+            area = rect[2] * rect[3]
+            if area == 0 < min_area:
+                continue
+            if tree._first_child[index] == NO_NODE or area < min_area:
+                parts.append((rect, CompactNode(tree, index).colour))
+                continue
+            if len(stack) > split_depth:
+                parts.append(None)
+                jobs.append((index, rect, strategy, min_area))
+                continue
+            stack.append(iter(tree.child_rects(index, rect, True,
+                                               strategy)))
+            break
+        else:
+            stack.pop()
+    return parts, jobs
+
+
+def _start_worker(tree):
+    """Keep <tree> as the tree laid out by this worker process.
+
+    @type tree: CompactTree
+    @rtype: None
+    """
+    global _worker_tree
+    _worker_tree = tree
+
+
+def _layout_job(job):
+    """Return the treemap of the subtree of the worker's tree given by
+    <job>, as the coordinates of each rectangle, and the red, green and
+    blue values of each colour, one after the other.
+
+    @type job: (int, (int, int, int, int), callable | None, int)
+        The row of the subtree, its rectangle, the layout strategy and the
+        min_area.
+    @rtype: (array[int], bytearray)
+    """
+    index, rect, strategy, min_area = job
+    coordinates = array('i')
+    colours = bytearray()
+    for rect, colour in CompactNode(_worker_tree, index).iter_treemap(
+            rect, strategy, min_area):
+        coordinates.extend(rect)
+        colours.extend(colour)
+    return coordinates, colours
@@ -0,0 +1,165 @@
+"""Assignment 2: Path Index
+
+=== Module Description ===
+This module contains PathIndex, which finds the node of a FileSystemTree
+with a given path, or all the nodes whose paths start with a given prefix,
+without walking the tree.
+
+The path of a node is the one get_separator returns: the names from the
+root of the tree down to the node, joined with os.path.join.
+
+The index is kept in sync by telling it about every node inserted into the
+tree or deleted from it. The tree's own methods do not know about the
+index, so every edit to an indexed tree should go through an owner that
+shares it: an EditJournal given a PathIndex does this for every edit it
+makes, undoes and redoes, and fs_watch's watchers look nodes up in, and
+update, the PathIndex they are given. The treemap visualiser gives the
+same index to both, so a file the user deletes is no longer found by the
+watcher.
+"""
+import os
+
+from tree_data import FileSystemTree
+
+
+class PathIndex:
+    """A map from the path of every node in a FileSystemTree to the node.
+
+    === Private Attributes ===
+    @type _tree: FileSystemTree
+        The indexed tree.
+    @type _nodes: dict[str, FileSystemTree]
+        The node at each path in the tree.
+    """
+    def __init__(self, tree):
+        """Initialize a new index of every node in <tree>.
+
+        @type self: PathIndex
+        @type tree: FileSystemTree
+        @rtype: None
+        """
+        self._tree = tree
+        self._nodes = {}
+        self.add(tree)
+
+    def __len__(self):
+        """Return the number of nodes in the index.
+
+        @type self: PathIndex
+        @rtype: int
+        """
+        return len(self._nodes)
+
+    def find(self, path):
+        """Return the node at <path>, or None if there is none.
+
+        @type self: PathIndex
+        @type path: str
+        @rtype: FileSystemTree | None
+
+        >>> T1 = FileSystemTree('f1.txt', [], 5)
+        >>> T = FileSystemTree('top', [FileSystemTree('sub', [T1])])
+        >>> index = PathIndex(T)
+        >>> index.find(os.path.join('top', 'sub', 'f1.txt')) is T1
+        True
+        >>> index.find('sub') is None
+        True
+        """
+        return self._nodes.get(path)
+
+    def with_prefix(self, prefix):
+        """Return the path and node of every node whose path starts with
+        <prefix>, each before the nodes inside it.
+
+        Only the nodes inside the folders named by <prefix> are looked at:
+        a prefix ending in a separator gives everything inside that folder,
+        and one ending part-way through a name also gives the other nodes
+        in the same folder whose names start the same way.
+
+        @type self: PathIndex
+        @type prefix: str
+        @rtype: list[(str, FileSystemTree)]
+
+        >>> T = FileSystemTree('top', [FileSystemTree('a.txt', [], 1),
+        ...                            FileSystemTree('ab.txt', [], 2),
+        ...                            FileSystemTree('b.txt', [], 3)])
+        >>> index = PathIndex(T)
+        >>> [node._root for _, node in index.with_prefix(
+        ...     os.path.join('top', 'a'))]
+        ['a.txt', 'ab.txt']
+        >>> len(index.with_prefix('to'))
+        4
+        """
+        root_path = self._tree.get_separator()
+        if root_path.startswith(prefix):
+            return _paths_in(self._tree, root_path)
+        folder_path, name = os.path.split(prefix)
+        folder = self._nodes.get(folder_path)
+        found = []
+        # os.path.split drops repeated separators, which no path has.
+        if folder is not None and os.path.join(folder_path, name) == prefix:
+            for subtree in folder._subtrees:
+                if subtree._root.startswith(name):
+                    found.extend(_paths_in(
+                        subtree, os.path.join(folder_path, subtree._root)))
+        return found
+
+    def add(self, tree):
+        """Record the path of <tree> and of every node inside it.
+
+        Call this after <tree> is inserted into the indexed tree.
+
+        @type self: PathIndex
+        @type tree: FileSystemTree
+        @rtype: None
+
+        >>> T = FileSystemTree('top', [FileSystemTree('f1.txt', [], 5)])
+        >>> index = PathIndex(T)
+        >>> T2 = FileSystemTree('f2.txt', [], 5)
+        >>> T.insert_child(T2)
+        >>> index.add(T2)
+        >>> index.find(os.path.join('top', 'f2.txt')) is T2
+        True
+        """
+        for path, node in _paths_in(tree, tree.get_separator()):
+            self._nodes[path] = node
+
+    def remove(self, tree):
+        """Forget the path of <tree> and of every node inside it.
+
+        Call this before or after <tree> is deleted from the indexed tree.
+        Deleting a tree does not change its path, so either works.
+
+        @type self: PathIndex
+        @type tree: FileSystemTree
+        @rtype: None
+
+        >>> T1 = FileSystemTree('f1.txt', [], 5)
+        >>> T = FileSystemTree('top', [T1])
+        >>> index = PathIndex(T)
+        >>> T1.delete_selected_leaf()
+        >>> index.remove(T1)
+        >>> len(index)
+        1
+        """
+        for path, node in _paths_in(tree, tree.get_separator()):
+            if self._nodes.get(path) is node:
+                del self._nodes[path]
+
+
+def _paths_in(tree, path):
+    """Return the path and node of <tree>, found at <path>, and of every
+    node inside it, each before the nodes inside it.
+
+    @type tree: FileSystemTree
+    @type path: str
+    @rtype: list[(str, FileSystemTree)]
+    """
+    found = []
+    stack = [(tree, path)]
+    while stack:
+        node, node_path = stack.pop()
+        found.append((node_path, node))
+        for subtree in reversed(node._subtrees):
+            stack.append((subtree, os.path.join(node_path, subtree._root)))
+    return found
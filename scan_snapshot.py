@@ -0,0 +1,214 @@
+"""Assignment 2: Scan Snapshots
+
+=== Module Description ===
+This module saves the result of a file system scan to a snapshot file, so
+that later scans of the same folder only have to list the directories that
+have changed.
+
+A directory's modification time changes whenever an entry is created,
+deleted or renamed inside it. When rescanning, every directory is still
+stat-ed (one system call each), but a directory whose modification time
+matches the one in the snapshot is not listed again: its entries are taken
+from the snapshot instead.
+
+Writing to an existing file does not change the modification time of its
+directory, so the files in a reused directory are stat-ed again to pick up
+files that have grown or shrunk in place. Scans that pass
+check_files=False take file sizes from the snapshot too, saving a system
+call per file, but then the size of a file that has changed in place is
+only picked up once something else in its directory changes.
+
+=== Snapshot File Format ===
+A snapshot is a gzip-compressed text file with one JSON value per line.
+The first line is a header:
+    {"version": 1, "root": <absolute path of the scanned folder>}
+Every other line describes a single directory:
+    [<path components relative to the root>, <mtime in ns | null>,
+     [[<name>, <is_dir>, <size>], ...]]
+The entries of a directory are in os.scandir order, and the directory lines
+are sorted by their path components, so that a parent directory always
+comes before its contents. This lets snapshots be read as a stream.
+"""
+import os
+import gzip
+import json
+import time
+
+from tree_data import FileSystemTree
+from fs_scan import DEFAULT_WORKERS, list_directory, scan_listings, build_tree
+
+
+# The version number written to the header of new snapshots.
+SNAPSHOT_VERSION = 1
+
+# Directories modified less than this many nanoseconds before a scan
+# started are listed again on the next scan, since they may change again
+# within the resolution of the file system's timestamps.
+_MTIME_GRACE_NS = 2 * 10 ** 9
+
+
+def scan_with_snapshot(path, snapshot_path, workers=DEFAULT_WORKERS,
+                       check_files=True):
+    """Return a FileSystemTree of <path>, reusing the snapshot at
+    <snapshot_path> for directories that have not changed since it was
+    saved, and save a new snapshot there afterwards.
+
+    If there is no snapshot at <snapshot_path>, or it was saved for a
+    different folder, every directory is listed.
+
+    Precondition: <path> is a valid path for this computer.
+                  workers >= 1
+
+    @type path: str
+    @type snapshot_path: str
+    @type workers: int
+        The number of threads used to list directories.
+    @type check_files: bool
+        If False, the sizes of the files in reused directories are taken
+        from the snapshot without checking them.
+    @rtype: FileSystemTree
+    """
+    if not os.path.isdir(path):
+        return FileSystemTree(path)
+    old_listings = load_snapshot(snapshot_path, path)
+    mtimes = {}
+    scan_start = time.time_ns()
+
+    def list_changed_directory(dir_path):
+        """Return the entries of <dir_path>, from the old snapshot if the
+        directory has not been modified since.
+
+        @type dir_path: str
+        @rtype: list[(str, bool, int)]
+        """
+        mtime = os.stat(dir_path).st_mtime_ns
+        if mtime > scan_start - _MTIME_GRACE_NS:
+            mtimes[dir_path] = None
+        else:
+            mtimes[dir_path] = mtime
+        if dir_path in old_listings:
+            old_mtime, entries = old_listings[dir_path]
+            if old_mtime == mtime:
+                if not check_files:
+                    return entries
+                try:
+                    return _restat_files(dir_path, entries)
+                except OSError:
+                    # An entry was replaced within the mtime resolution.
+                    pass
+        return list_directory(dir_path)
+
+    listings = scan_listings(path, workers, list_changed_directory)
+    save_snapshot(snapshot_path, path, listings, mtimes)
+    return build_tree(path, listings)
+
+
+def save_snapshot(snapshot_path, path, listings, mtimes):
+    """Save the listings of a scan of the folder <path> to <snapshot_path>.
+
+    The snapshot is written to a temporary file first and then moved into
+    place, so an interrupted save never leaves a corrupt snapshot behind.
+
+    @type snapshot_path: str
+    @type path: str
+    @type listings: dict[str, list[(str, bool, int)]]
+        As returned by fs_scan.scan_listings for <path>.
+    @type mtimes: dict[str, int | None]
+        The modification time of each directory in <listings>, or None if
+        the directory must be listed again on the next scan.
+    @rtype: None
+    """
+    lines = []
+    for dir_path in listings:
+        components = _relative_components(path, dir_path)
+        lines.append((components, mtimes.get(dir_path), listings[dir_path]))
+    lines.sort(key=lambda line: line[0])
+    temp_path = snapshot_path + '.tmp'
+    with gzip.open(temp_path, 'wt', encoding='utf-8',
+                   errors='surrogateescape') as file:
+        header = {'version': SNAPSHOT_VERSION, 'root': os.path.abspath(path)}
+        file.write(json.dumps(header) + '\n')
+        for line in lines:
+            file.write(json.dumps(line) + '\n')
+    os.replace(temp_path, snapshot_path)
+
+
+def iter_snapshot(snapshot_path):
+    """Yield the directories saved in the snapshot at <snapshot_path>.
+
+    The header is yielded first, as a dictionary. Every following item is a
+    tuple (components, mtime, entries) for a single directory, in the order
+    described in the module docstring. Only one directory is held in memory
+    at a time.
+
+    @type snapshot_path: str
+    @rtype: generator
+    """
+    with gzip.open(snapshot_path, 'rt', encoding='utf-8',
+                   errors='surrogateescape') as file:
+        yield json.loads(file.readline())
+        for line in file:
+            components, mtime, entries = json.loads(line)
+            yield tuple(components), mtime, entries
+
+
+def load_snapshot(snapshot_path, path):
+    """Return the listings saved in the snapshot at <snapshot_path>.
+
+    The returned dictionary maps each directory path, formed by joining its
+    components onto <path>, to a tuple (mtime, entries).
+    An empty dictionary is returned if there is no usable snapshot for the
+    folder <path> at <snapshot_path>.
+
+    @type snapshot_path: str
+    @type path: str
+    @rtype: dict[str, (int | None, list[[str, bool, int]])]
+    """
+    if not os.path.exists(snapshot_path):
+        return {}
+    listings = {}
+    snapshot = iter_snapshot(snapshot_path)
+    header = next(snapshot)
+    if header.get('version') != SNAPSHOT_VERSION or \
+            header.get('root') != os.path.abspath(path):
+        snapshot.close()
+        return {}
+    for components, mtime, entries in snapshot:
+        listings[os.path.join(path, *components)] = mtime, entries
+    return listings
+
+
+def _restat_files(dir_path, entries):
+    """Return <entries> of the directory <dir_path>, with the size of each
+    file read from disk again.
+
+    Like list_directory, symbolic links are followed.
+
+    @type dir_path: str
+    @type entries: list[[str, bool, int]]
+    @rtype: list[(str, bool, int)]
+    """
+    return [(name, is_dir, size if is_dir else
+             os.stat(os.path.join(dir_path, name)).st_size)
+            for name, is_dir, size in entries]
+
+
+def _relative_components(path, dir_path):
+    """Return the path components of <dir_path> relative to <path>.
+
+    Precondition: <dir_path> was formed by os.path.join-ing names onto
+                  <path>.
+
+    @type path: str
+    @type dir_path: str
+    @rtype: list[str]
+
+    >>> _relative_components('a', 'a')
+    []
+    >>> _relative_components('a', os.path.join('a', 'b', 'c'))
+    ['b', 'c']
+    """
+    relative = os.path.relpath(dir_path, path)
+    if relative == os.curdir:
+        return []
+    return relative.split(os.sep)
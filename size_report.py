@@ -0,0 +1,76 @@
+"""Assignment 2: Size Report
+
+=== Module Description ===
+This module prints the largest files and folders of a tree as text, for
+finding what takes up the most space without opening the treemap
+visualiser. It does not need pygame, so it can run on a server or in a
+script:
+
+    python size_report.py <path> [k] [pattern]
+
+prints the <k> largest files under <path> (10 by default), then its <k>
+largest folders, leaving out the folder at <path> itself. If a shell-style
+<pattern> like '*.log' is given, only files and folders whose names match
+it are listed.
+
+The queries are AbstractTree.largest_leaves and largest_internal_trees,
+which only look inside the folders that can hold one of the <k> largest,
+so a report on a large tree takes far less time than the scan that built
+it.
+"""
+import sys
+
+from fs_scan import scan_file_system
+
+
+def size_report(tree, k=10, max_depth=None, pattern=None):
+    """Return a report of the <k> largest leaves of <tree> and its <k>
+    largest trees with subtrees, other than <tree> itself, leaving out any
+    more than <max_depth> trees below <tree> or whose root does not match
+    the shell-style <pattern>.
+
+    Each line of the report gives the data_size of a tree and its
+    get_separator.
+
+    @type tree: AbstractTree
+    @type k: int
+    @type max_depth: int | None
+    @type pattern: str | None
+    @rtype: str
+
+    >>> from tree_data import FileSystemTree
+    >>> T1 = FileSystemTree('sub', [FileSystemTree('a.txt', [], 5),
+    ...                             FileSystemTree('b.txt', [], 300)])
+    >>> T = FileSystemTree('top', [T1, FileSystemTree('c.txt', [], 40)])
+    >>> print(size_report(T, 2).replace('\\\\', '/'))
+    Largest 2 files:
+             300  top/sub/b.txt
+              40  top/c.txt
+    Largest 2 folders:
+             305  top/sub
+    """
+    lines = ['Largest {} files:'.format(k)]
+    for leaf in tree.largest_leaves(k, 1, max_depth, pattern):
+        lines.append(_report_line(leaf))
+    lines.append('Largest {} folders:'.format(k))
+    for folder in tree.largest_internal_trees(k, 1, max_depth, pattern):
+        lines.append(_report_line(folder))
+    return '\n'.join(lines)
+
+
+def _report_line(tree):
+    """Return the line of a size report for <tree>.
+
+    @type tree: AbstractTree
+    @rtype: str
+    """
+    return '{:>12}  {}'.format(tree.data_size, tree.get_separator())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python size_report.py <path> [k] [pattern]')
+    else:
+        print(size_report(scan_file_system(sys.argv[1]),
+                          int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+                          None, sys.argv[3] if len(sys.argv) > 3 else None))
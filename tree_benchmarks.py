@@ -0,0 +1,997 @@
+"""Assignment 2: Benchmarks
+
+=== Module Description ===
+This module contains benchmarks for the tree and treemap code. They are not
+run as part of the tests, since some of them take minutes and gigabytes of
+memory at their default sizes.
+
+Run a benchmark from the command line by name, optionally followed by its
+arguments, e.g.
+
+    python tree_benchmarks.py deep 10000
+"""
+import math
+import os
+import sys
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from tree_data import FileSystemTree, slice_rect, squarify_rect
+from compact_tree import CompactTree, NO_NODE, compact_from_tree
+from fs_scan import scan_file_system, scan_file_system_sharded, build_tree
+from scan_snapshot import iter_snapshot, load_snapshot, save_snapshot
+from treemap_index import TreemapIndex
+from parallel_layout import parallel_treemap
+from edit_journal import EditJournal
+from path_index import PathIndex
+from tree_diff import diff_trees, diff_snapshots
+
+
+def _timed(function, *args):
+    """Return the result of calling <function> on <args>, and the number of
+    seconds the call took.
+
+    @type function: callable
+    @rtype: (object, float)
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def _report(name, seconds):
+    """Print a single benchmark result line.
+
+    @type name: str
+    @type seconds: float | None
+        None if the benchmark could not be run.
+    @rtype: None
+    """
+    if seconds is None:
+        print('{:<55} {:>12}'.format(name, 'failed'))
+    else:
+        print('{:<55} {:>10.4f} s'.format(name, seconds))
+
+
+def make_chain_tree(depth):
+    """Return a FileSystemTree which is a single chain of <depth> folders
+    ending in a file of size 1.
+
+    @type depth: int
+    @rtype: FileSystemTree
+    """
+    tree = FileSystemTree('f', [], 1)
+    for _ in range(depth):
+        tree = FileSystemTree('d', [tree])
+    return tree
+
+
+# ---------------------------------------------------------------------------
+# Recursive reference implementations
+# ---------------------------------------------------------------------------
+# These are the recursive versions of the traversals in tree_data, kept
+# here so the explicit-stack versions can be compared against them.
+def _recursive_generate_treemap(tree, rect):
+    """Return the treemap of <tree> in <rect>, recursing once per level.
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @rtype: list[((int, int, int, int), (int, int, int))]
+    """
+    tree_map = []
+    x, y, width, height = rect
+    if tree.data_size == 0:
+        return tree_map
+    elif tree._subtrees == []:
+        return [(rect, tree.colour)]
+    elif width > height:
+        accumulated_width = 0
+        for subtree in tree._subtrees:
+            if subtree is tree._subtrees[len(tree._subtrees) - 1]:
+                sub_width = width - accumulated_width
+            else:
+                sub_width = subtree.proportionate_tree(width)
+            tree_map += _recursive_generate_treemap(
+                subtree, (x, y, sub_width, height))
+            x += sub_width
+            accumulated_width += sub_width
+    else:
+        accumulated_height = 0
+        for subtree in tree._subtrees:
+            if subtree is tree._subtrees[len(tree._subtrees) - 1]:
+                sub_height = height - accumulated_height
+            else:
+                sub_height = subtree.proportionate_tree(height)
+            tree_map += _recursive_generate_treemap(
+                subtree, (x, y, width, sub_height))
+            y += sub_height
+            accumulated_height += sub_height
+    return tree_map
+
+
+def _recursive_find_leaf(tree, rect, coordinations):
+    """Return the leaf of <tree> at <coordinations>, recursing once per level.
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @type coordinations: (int, int)
+    @rtype: AbstractTree | None
+    """
+    x, y, width, height = rect
+    coord_x, coord_y = coordinations
+    if tree._subtrees == []:
+        return tree
+    accumulated = 0
+    for subtree in tree._subtrees:
+        if width > height:
+            if subtree is tree._subtrees[len(tree._subtrees) - 1]:
+                sub_width = width - accumulated
+            else:
+                sub_width = subtree.proportionate_tree(width)
+            if x <= coord_x <= x + sub_width:
+                return _recursive_find_leaf(subtree, (x, y, sub_width, height),
+                                            coordinations)
+            accumulated += sub_width
+            x += sub_width
+        else:
+            if subtree is tree._subtrees[len(tree._subtrees) - 1]:
+                sub_height = height - accumulated
+            else:
+                sub_height = subtree.proportionate_tree(height)
+            if y <= coord_y <= y + sub_height:
+                return _recursive_find_leaf(subtree, (x, y, width, sub_height),
+                                            coordinations)
+            accumulated += sub_height
+            y += sub_height
+    return None
+
+
+def _recursive_get_separator(tree):
+    """Return the path of <tree>, recursing once per level.
+
+    @type tree: FileSystemTree
+    @rtype: str
+    """
+    if tree._parent_tree is None:
+        return tree._root
+    return os.path.join(_recursive_get_separator(tree._parent_tree),
+                        tree._root)
+
+
+def _recursive_update_data_size(tree, data_size):
+    """Add <data_size> to every parent of <tree>, recursing once per level.
+
+    @type tree: AbstractTree
+    @type data_size: int
+    @rtype: None
+    """
+    if tree._parent_tree is not None:
+        tree._parent_tree.data_size += data_size
+        _recursive_update_data_size(tree._parent_tree, data_size)
+
+
+def _recursive_file_system_tree(path):
+    """Return a FileSystemTree of <path>, recursing once per folder level.
+
+    @type path: str
+    @rtype: FileSystemTree
+    """
+    if not os.path.isdir(path):
+        return FileSystemTree(path, [], os.path.getsize(path))
+    subtrees = [_recursive_file_system_tree(os.path.join(path, filename))
+                for filename in os.listdir(path)]
+    return FileSystemTree(path, subtrees)
+
+
+def _try_timed(function, *args):
+    """Like _timed, but return None for the time if <function> raises
+    RecursionError.
+
+    @type function: callable
+    @rtype: (object, float | None)
+    """
+    try:
+        return _timed(function, *args)
+    except RecursionError:
+        return None, None
+
+
+def benchmark_deep_trees(depth=10000, disk_depth=1500):
+    """Compare the explicit-stack traversals in tree_data against recursive
+    versions on a synthetic chain of <depth> folders, and scan a real chain
+    of <disk_depth> nested folders.
+
+    The recursive versions are run twice: once with Python's default
+    recursion limit, where they fail for deep trees, and once with the limit
+    raised far enough for them to finish.
+
+    @type depth: int
+    @type disk_depth: int
+        Kept small enough for the full path to fit in the OS path limit.
+    @rtype: None
+    """
+    tree = make_chain_tree(depth)
+    leaf = tree
+    while leaf._subtrees:
+        leaf = leaf._subtrees[0]
+    rect = (0, 0, 1024, 738)
+    point = (512, 369)
+
+    print('Synthetic chain of {} folders'.format(depth))
+    for limit in [sys.getrecursionlimit(), depth * 3 + 100]:
+        old_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(limit)
+        try:
+            suffix = ' (recursion limit {})'.format(limit)
+            _report('recursive generate_treemap' + suffix, _try_timed(
+                _recursive_generate_treemap, tree, rect)[1])
+            _report('recursive find_leaf' + suffix, _try_timed(
+                _recursive_find_leaf, tree, rect, point)[1])
+            _report('recursive get_separator' + suffix, _try_timed(
+                _recursive_get_separator, leaf)[1])
+            _report('recursive update_data_size' + suffix, _try_timed(
+                _recursive_update_data_size, leaf, 0)[1])
+        finally:
+            sys.setrecursionlimit(old_limit)
+    _report('generate_treemap', _timed(tree.generate_treemap, rect)[1])
+    _report('find_leaf', _timed(tree.find_leaf, rect, point)[1])
+    _report('get_separator', _timed(leaf.get_separator)[1])
+    _report('update_data_size', _timed(leaf.update_data_size, 0)[1])
+    _report('delete_empty_trees', _timed(tree.delete_empty_trees)[1])
+
+    print('Folder chain of {} levels on disk'.format(disk_depth))
+    root = tempfile.mkdtemp()
+    path = root
+    try:
+        # os.makedirs recurses once per level, so create the chain by hand.
+        for _ in range(disk_depth):
+            path = os.path.join(path, 'd')
+            os.mkdir(path)
+        with open(os.path.join(path, 'f'), 'w') as file:
+            file.write('x')
+        top = os.path.join(root, 'd')
+        _report('recursive FileSystemTree', _try_timed(
+            _recursive_file_system_tree, top)[1])
+        _report('FileSystemTree', _timed(FileSystemTree, top)[1])
+    finally:
+        # shutil.rmtree also recurses once per level.
+        os.remove(os.path.join(path, 'f'))
+        while path != root:
+            os.rmdir(path)
+            path = os.path.dirname(path)
+        os.rmdir(root)
+
+
+def _synthetic_names(node_count, fan_out):
+    """Yield (folder number, file name, size) for <node_count> files spread
+    over folders of <fan_out> files each, with the file names repeating from
+    folder to folder like they would on a real disk.
+
+    @type node_count: int
+    @type fan_out: int
+    @rtype: generator
+    """
+    for i in range(node_count):
+        yield i // fan_out, 'file{}.dat'.format(i % fan_out), i % 4096 + 1
+
+
+def _object_tree(node_count, fan_out):
+    """Return a FileSystemTree of <node_count> files in folders of
+    <fan_out> files each.
+
+    @type node_count: int
+    @type fan_out: int
+    @rtype: FileSystemTree
+    """
+    folders = []
+    files = []
+    for folder, name, size in _synthetic_names(node_count, fan_out):
+        if folder != len(folders):
+            folders.append(FileSystemTree('dir{}'.format(folder), files))
+            files = []
+        files.append(FileSystemTree(name, [], size))
+    folders.append(FileSystemTree('dir{}'.format(len(folders)), files))
+    return FileSystemTree('root', folders)
+
+
+def _compact_tree(node_count, fan_out):
+    """Return a CompactTree of <node_count> files in folders of <fan_out>
+    files each.
+
+    @type node_count: int
+    @type fan_out: int
+    @rtype: CompactTree
+    """
+    tree = CompactTree()
+    root = tree.add_node('root', NO_NODE)
+    folder_index = NO_NODE
+    folder_count = 0
+    for folder, name, size in _synthetic_names(node_count, fan_out):
+        if folder_index == NO_NODE or folder != folder_count - 1:
+            folder_index = tree.add_node('dir{}'.format(folder), root)
+            folder_count += 1
+        tree.add_node(name, folder_index, size)
+        tree._sizes[folder_index] += size
+        tree._sizes[root] += size
+    tree.finish()
+    return tree
+
+
+def _measure_memory(function, *args):
+    """Return the result of calling <function> on <args>, the number of
+    bytes allocated by the call that are still in use afterwards, and the
+    number of seconds the call took.
+
+    @type function: callable
+    @rtype: (object, int, float)
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result, seconds = _timed(function, *args)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before, seconds
+
+
+def benchmark_compact_memory(*node_counts):
+    """Compare the memory used by FileSystemTree objects and by a
+    CompactTree for synthetic trees of each of <node_counts> files.
+
+    With no arguments, trees of 1 million and 10 million files are used;
+    the 10 million file object tree needs several gigabytes of memory.
+
+    @type node_counts: int
+    @rtype: None
+    """
+    if not node_counts:
+        node_counts = (10 ** 6, 10 ** 7)
+    fan_out = 100
+    rect = (0, 0, 1024, 738)
+    for node_count in node_counts:
+        print('{} files in folders of {}'.format(node_count, fan_out))
+        tree, used, seconds = _measure_memory(_object_tree, node_count,
+                                              fan_out)
+        print('{:<55} {:>10.1f} MB {:>8.1f} B/node {:>8.2f} s'.format(
+            'FileSystemTree objects', used / 2 ** 20, used / node_count,
+            seconds))
+        _report('  generate_treemap', _timed(tree.generate_treemap, rect)[1])
+        del tree
+        compact, used, seconds = _measure_memory(_compact_tree, node_count,
+                                                 fan_out)
+        print('{:<55} {:>10.1f} MB {:>8.1f} B/node {:>8.2f} s'.format(
+            'CompactTree', used / 2 ** 20, used / node_count, seconds))
+        _report('  generate_treemap',
+                _timed(compact.root().generate_treemap, rect)[1])
+        del compact
+
+
+def _make_folder_tree(root, file_count, shard_count=64, fan_out=100):
+    """Create <file_count> small files under the folder <root>, spread over
+    <shard_count> top-level folders, each holding sub-folders of <fan_out>
+    files.
+
+    @type root: str
+    @type file_count: int
+    @type shard_count: int
+    @type fan_out: int
+    @rtype: None
+    """
+    for i in range(file_count):
+        folder = os.path.join(root, 'shard{}'.format(i % shard_count),
+                              'dir{}'.format(i // (shard_count * fan_out)))
+        if i < shard_count or i % (shard_count * fan_out) < shard_count:
+            os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, 'file{}'.format(i)), 'w') as file:
+            file.write('x' * (i % 97))
+
+
+def benchmark_sharded_scan(target=200000):
+    """Time scanning a folder with 1, 2, 4, 8 and 16 worker processes,
+    compared with the threaded scan and the FileSystemTree constructor.
+
+    @type target: int | str
+        The path of a folder to scan, or the number of files to put in a
+        temporary folder that is scanned instead.
+    @rtype: None
+    """
+    root = None
+    if isinstance(target, int):
+        root = tempfile.mkdtemp()
+        _make_folder_tree(root, target)
+        target = root
+    try:
+        _report('FileSystemTree', _timed(FileSystemTree, target)[1])
+        _report('scan_file_system', _timed(scan_file_system, target)[1])
+        for processes in [1, 2, 4, 8, 16]:
+            _report('scan_file_system_sharded, {} processes'.format(
+                processes), _timed(scan_file_system_sharded, target,
+                                   processes)[1])
+    finally:
+        if root is not None:
+            shutil.rmtree(root)
+
+
+def _consume(iterator):
+    """Return the number of items in <iterator>, without keeping them.
+
+    @type iterator: iterator
+    @rtype: int
+    """
+    count = 0
+    for _ in iterator:
+        count += 1
+    return count
+
+
+def benchmark_layout(leaf_count=10 ** 6):
+    """Compare the recursive treemap layout with generate_treemap and the
+    streaming iter_treemap, for FileSystemTree objects and a CompactTree of
+    <leaf_count> files.
+
+    generate_treemap is also timed again with its cached layouts, before
+    and after changing the size of a single file.
+
+    @type leaf_count: int
+    @rtype: None
+    """
+    fan_out = 100
+    rect = (0, 0, 1024, 738)
+    tree = _object_tree(leaf_count, fan_out)
+    print('{} files in folders of {}'.format(leaf_count, fan_out))
+    expected, seconds = _timed(_recursive_generate_treemap, tree, rect)
+    _report('recursive generate_treemap', seconds)
+    rects, seconds = _timed(tree.generate_treemap, rect)
+    _report('generate_treemap', seconds)
+    _report('generate_treemap, unchanged',
+            _timed(tree.generate_treemap, rect)[1])
+    tree._subtrees[len(tree._subtrees) // 2]._subtrees[0].mutate_size(
+        'increase')
+    _report('generate_treemap, after mutate_size',
+            _timed(tree.generate_treemap, rect)[1])
+    _report('iter_treemap', _timed(_consume, tree.iter_treemap(rect))[1])
+    compact = compact_from_tree(tree).root()
+    del tree
+    _report('CompactNode.iter_treemap',
+            _timed(_consume, compact.iter_treemap(rect))[1])
+    if rects != expected or compact.generate_treemap(rect) != \
+            list(compact.iter_treemap(rect)):
+        print('layouts differ')
+
+
+def _find_leaves(tree, rect, points):
+    """Return the leaf at each of <points> when <tree> is drawn in <rect>.
+
+    @type tree: AbstractTree | TreemapIndex
+    @type rect: (int, int, int, int)
+    @type points: list[(int, int)]
+    @rtype: list[AbstractTree | None]
+    """
+    return [tree.find_leaf(rect, point) for point in points]
+
+
+def benchmark_hit_testing(leaf_count=10 ** 6, click_count=1000):
+    """Compare answering <click_count> clicks with AbstractTree.find_leaf
+    and with a TreemapIndex, for a tree of <leaf_count> files.
+
+    @type leaf_count: int
+    @type click_count: int
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+    tree = _object_tree(leaf_count, 100)
+    points = [((i * 7919) % rect[2], (i * 104729) % rect[3])
+              for i in range(click_count)]
+    index = TreemapIndex(tree)
+    _report('TreemapIndex, first layout',
+            _timed(index.generate_treemap, rect)[1])
+    _report('{} clicks, find_leaf'.format(click_count),
+            _timed(_find_leaves, tree, rect, points)[1])
+    _report('{} clicks, TreemapIndex'.format(click_count),
+            _timed(_find_leaves, index, rect, points)[1])
+    tree._subtrees[len(tree._subtrees) // 2]._subtrees[0].mutate_size(
+        'increase')
+    _report('TreemapIndex, layout after mutate_size',
+            _timed(index.generate_treemap, rect)[1])
+
+
+def _snapshot_tree(snapshot_path):
+    """Return the FileSystemTree saved in the scan snapshot at
+    <snapshot_path>, without touching the scanned folder.
+
+    @type snapshot_path: str
+    @rtype: FileSystemTree
+    """
+    snapshot = iter_snapshot(snapshot_path)
+    root = next(snapshot)['root']
+    snapshot.close()
+    listings = load_snapshot(snapshot_path, root)
+    return build_tree(root, {dir_path: entries
+                             for dir_path, (_, entries) in listings.items()})
+
+
+def _mean_aspect_ratio(tree_map):
+    """Return the mean ratio of the longer side to the shorter side of
+    the rectangles in <tree_map> that have an area.
+
+    @type tree_map: list[((int, int, int, int), (int, int, int))]
+    @rtype: float
+    """
+    ratios = [max(width / height, height / width)
+              for (_, _, width, height), _ in tree_map
+              if width > 0 and height > 0]
+    if ratios == []:
+        return 0.0
+    return sum(ratios) / len(ratios)
+
+
+def benchmark_squarify(*snapshot_paths):
+    """Compare the time taken and the mean aspect ratio of the rectangles
+    produced by the slice-and-dice and squarified layouts, for the trees
+    saved in <snapshot_paths> by scan_snapshot.
+
+    With no arguments, a synthetic tree of 1 million files is used.
+
+    @type snapshot_paths: str
+    @rtype: None
+    """
+    if snapshot_paths:
+        trees = [(path, _snapshot_tree(path)) for path in snapshot_paths]
+    else:
+        trees = [('synthetic', _object_tree(10 ** 6, 100))]
+    rect = (0, 0, 1024, 738)
+    resized = (0, 0, 1280, 960)
+    for name, tree in trees:
+        print(name)
+        for label, strategy in [('slice-and-dice', slice_rect),
+                                ('squarified', squarify_rect)]:
+            tree_map, seconds = _timed(tree.generate_treemap, rect, None,
+                                       strategy)
+            print('{:<55} {:>10.4f} s {:>10.2f} mean aspect ratio'.format(
+                '  ' + label, seconds, _mean_aspect_ratio(tree_map)))
+            # Subtrees stay sorted, so only the layout itself is redone.
+            _report('  ' + label + ', resized window',
+                    _timed(tree.generate_treemap, resized, None,
+                           strategy)[1])
+
+
+def benchmark_level_of_detail(leaf_count=10 ** 6):
+    """Compare laying out a tree of <leaf_count> files from scratch with
+    generate_treemap for several values of min_area, with and without
+    squarifying.
+
+    @type leaf_count: int
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+    tree = _object_tree(leaf_count, 100)
+    print('{} files in a {} by {} window'.format(leaf_count, rect[2],
+                                                 rect[3]))
+    for label, strategy in [('slice-and-dice', slice_rect),
+                            ('squarified', squarify_rect)]:
+        for min_area in [0, 1, 4, 16]:
+            tree.invalidate_layout()
+            tree_map, seconds = _timed(tree.generate_treemap, rect, None,
+                                       strategy, min_area)
+            print('{:<55} {:>10.4f} s {:>10} rectangles'.format(
+                '{}, min_area {}'.format(label, min_area), seconds,
+                len(tree_map)))
+
+
+def benchmark_parallel_layout(leaf_count=10 ** 6, split_depth=1):
+    """Compare laying out a CompactTree of <leaf_count> files in a single
+    process with parallel_treemap, for every number of worker processes
+    from 1 up to the number of processors (and at least 2).
+
+    @type leaf_count: int
+    @type split_depth: int
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+    root = _compact_tree(leaf_count, 100).root()
+    print('{} files, {} processors'.format(leaf_count, os.cpu_count()))
+    expected, seconds = _timed(root.generate_treemap, rect)
+    _report('CompactNode.generate_treemap', seconds)
+    for workers in range(1, max(os.cpu_count() or 1, 2) + 1):
+        tree_map, seconds = _timed(parallel_treemap, root, rect,
+                                   split_depth, workers)
+        _report('parallel_treemap, {} workers'.format(workers), seconds)
+        if tree_map != expected:
+            print('layouts differ')
+
+
+def benchmark_zoom(leaf_count=10 ** 6):
+    """Compare drawing a tree of <leaf_count> files through a TreemapIndex
+    with drawing one of its folders zoomed in to fill the whole window, as
+    the visualiser does when a folder is double-clicked.
+
+    @type leaf_count: int
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+    tree = _object_tree(leaf_count, 100)
+    folder = tree._subtrees[len(tree._subtrees) // 2]
+    _report('whole tree, first layout',
+            _timed(TreemapIndex(tree).generate_treemap, rect)[1])
+    zoomed = TreemapIndex(folder)
+    _report('zoomed in on one folder, first layout',
+            _timed(zoomed.generate_treemap, rect)[1])
+    point = rect[2] // 2, rect[3] // 2
+    _report('zoomed in on one folder, click',
+            _timed(zoomed.find_leaf, rect, point)[1])
+
+
+def benchmark_batch_delete(delete_count=100000, fan_out=100000):
+    """Compare deleting <delete_count> leaves one at a time with
+    delete_selected_leaf, and all at once with delete_subtrees, from a tree
+    of twice as many files in folders of <fan_out> files.
+
+    @type delete_count: int
+    @type fan_out: int
+    @rtype: None
+    """
+    print('{} of {} files in folders of {}'.format(
+        delete_count, 2 * delete_count, fan_out))
+    results = []
+    for label, delete in [('delete_selected_leaf, one at a time',
+                           _delete_one_at_a_time),
+                          ('delete_subtrees', _delete_all_at_once)]:
+        tree = _object_tree(2 * delete_count, fan_out)
+        leaves = [leaf for folder in tree._subtrees
+                  for leaf in folder._subtrees[::2]]
+        _report(label, _timed(delete, tree, leaves)[1])
+        results.append([(folder.data_size, len(folder._subtrees))
+                        for folder in tree._subtrees])
+    if results[0] != results[1]:
+        print('trees differ')
+
+
+def _delete_one_at_a_time(tree, leaves):
+    """Delete each of <leaves> from <tree> with delete_selected_leaf.
+
+    @type tree: AbstractTree
+    @type leaves: list[AbstractTree]
+    @rtype: None
+    """
+    for leaf in leaves:
+        leaf.delete_selected_leaf()
+
+
+def _delete_all_at_once(tree, leaves):
+    """Delete <leaves> from <tree> with delete_subtrees.
+
+    @type tree: AbstractTree
+    @type leaves: list[AbstractTree]
+    @rtype: None
+    """
+    tree.delete_subtrees(leaves)
+
+
+def benchmark_mutate_size(mutation_count=100000, depth=100,
+                          leaf_count=10 ** 5):
+    """Compare making <mutation_count> changes with mutate_size, which
+    defers passing them up, against passing each change straight up to the
+    root, in a tree of <leaf_count> files in folders of 100, <depth>
+    folders below the root.
+
+    Each version is followed by a layout of the whole tree, which adds up
+    the deferred changes.
+
+    @type mutation_count: int
+    @type depth: int
+    @type leaf_count: int
+    @rtype: None
+    """
+    rect = (0, 0, 1024, 738)
+    print('{} changes to {} files, {} levels deep'.format(
+        mutation_count, leaf_count, depth + 2))
+    results = []
+    for label, mutate in [('passed straight up', _mutate_eagerly),
+                          ('mutate_size, deferred', _mutate_deferred)]:
+        tree = _object_tree(leaf_count, 100)
+        for _ in range(depth):
+            tree = FileSystemTree('d', [tree])
+        leaves = _leaves(tree)
+        chosen = [leaves[i * 7919 % len(leaves)]
+                  for i in range(mutation_count)]
+        tree.generate_treemap(rect)
+        _report(label, _timed(mutate, chosen)[1])
+        tree_map, seconds = _timed(tree.generate_treemap, rect)
+        _report('  then generate_treemap', seconds)
+        results.append((tree.data_size, [rect for rect, _ in tree_map]))
+    if results[0] != results[1]:
+        print('trees differ')
+
+
+def _leaves(tree):
+    """Return the leaves of <tree>.
+
+    @type tree: AbstractTree
+    @rtype: list[AbstractTree]
+    """
+    leaves = []
+    stack = [tree]
+    while stack:
+        tree = stack.pop()
+        if tree._subtrees == []:
+            leaves.append(tree)
+        stack.extend(tree._subtrees)
+    return leaves
+
+
+def _mutate_eagerly(leaves):
+    """Increase the data_size of each of <leaves> by 1%, adding the change
+    to every parent straight away.
+
+    @type leaves: list[AbstractTree]
+    @rtype: None
+    """
+    for leaf in leaves:
+        size_change = math.ceil(leaf.data_size * 0.01)
+        leaf.data_size += size_change
+        leaf.invalidate_layout()
+        tree = leaf._parent_tree
+        while tree is not None:
+            tree.data_size += size_change
+            tree = tree._parent_tree
+
+
+def _mutate_deferred(leaves):
+    """Increase the data_size of each of <leaves> by 1% with mutate_size.
+
+    @type leaves: list[AbstractTree]
+    @rtype: None
+    """
+    for leaf in leaves:
+        leaf.mutate_size('increase')
+
+
+def benchmark_undo(edit_count=1000, leaf_count=10 ** 6):
+    """Time making <edit_count> deletions and resizes through an
+    EditJournal on a tree of <leaf_count> files, then undoing and redoing
+    them all, against building the tree again from scratch.
+
+    @type edit_count: int
+    @type leaf_count: int
+    @rtype: None
+    """
+    tree, seconds = _timed(_object_tree, leaf_count, 100)
+    _report('building the tree', seconds)
+    leaves = _leaves(tree)
+    chosen = [leaves[i * 7919 % len(leaves)] for i in range(edit_count)]
+    journal = EditJournal(tree)
+    before = tree.data_size
+    _report('{} edits'.format(edit_count),
+            _timed(_edit, journal, chosen)[1])
+    after = tree.data_size
+    _report('undo all', _timed(_repeat, journal.undo, edit_count)[1])
+    if tree.data_size != before:
+        print('undo did not restore the tree')
+    _report('redo all', _timed(_repeat, journal.redo, edit_count)[1])
+    if tree.data_size != after:
+        print('redo did not repeat the edits')
+
+
+def _edit(journal, leaves):
+    """Delete every other one of <leaves> through <journal>, and increase
+    the size of the others.
+
+    @type journal: EditJournal
+    @type leaves: list[AbstractTree]
+    @rtype: None
+    """
+    for i, leaf in enumerate(leaves):
+        if i % 2 == 0 and leaf._parent_tree is not None:
+            journal.delete_selected_leaf(leaf)
+        else:
+            journal.mutate_size(leaf, 'increase')
+
+
+def _repeat(function, count):
+    """Call <function> <count> times.
+
+    @type function: callable
+    @type count: int
+    @rtype: None
+    """
+    for _ in range(count):
+        function()
+
+
+def benchmark_paths(leaf_count=10 ** 6, depth=30, frame_count=10000):
+    """Time drawing the path of a file <depth> folders down on each of
+    <frame_count> frames, by joining every name along it each time and
+    with get_separator, and time building a PathIndex of a tree of
+    <leaf_count> files and looking paths up in it.
+
+    @type leaf_count: int
+    @type depth: int
+    @type frame_count: int
+    @rtype: None
+    """
+    leaf = make_chain_tree(depth)
+    while leaf._subtrees:
+        leaf = leaf._subtrees[0]
+    _report('joining the path, {} frames'.format(frame_count),
+            _timed(_repeat, lambda: _joined_path(leaf), frame_count)[1])
+    _report('get_separator, {} frames'.format(frame_count),
+            _timed(_repeat, leaf.get_separator, frame_count)[1])
+    tree = _object_tree(leaf_count, 100)
+    index, seconds = _timed(PathIndex, tree)
+    _report('PathIndex of {} files'.format(leaf_count), seconds)
+    paths = [leaf.get_separator() for leaf in _leaves(tree)[::1000]]
+    _report('{} lookups'.format(len(paths)),
+            _timed(lambda: [index.find(path) for path in paths])[1])
+    folder = tree._subtrees[len(tree._subtrees) // 2]
+    _report('prefix lookup of one folder',
+            _timed(index.with_prefix, folder.get_separator())[1])
+
+
+def _joined_path(tree):
+    """Return the path of <tree>, joining every name along it.
+
+    @type tree: FileSystemTree
+    @rtype: str
+    """
+    names = []
+    while tree is not None:
+        names.append(tree._root)
+        tree = tree._parent_tree
+    names.reverse()
+    return os.path.join(*names)
+
+
+def benchmark_largest(leaf_count=10 ** 6, k=10):
+    """Compare finding the <k> largest files and folders of a tree of
+    <leaf_count> files by sorting every node, against largest_leaves and
+    largest_internal_trees.
+
+    @type leaf_count: int
+    @type k: int
+    @rtype: None
+    """
+    tree = _object_tree(leaf_count, 100)
+    _report('sorting every file and folder', _timed(_sort_largest, tree, k)[1])
+    _report('largest_leaves and largest_internal_trees', _timed(
+        lambda: (tree.largest_leaves(k), tree.largest_internal_trees(k)))[1])
+
+
+def _sort_largest(tree, k):
+    """Return the <k> largest leaves and the <k> largest trees with subtrees
+    in <tree>, by sorting all of them.
+
+    @type tree: AbstractTree
+    @type k: int
+    @rtype: (list[AbstractTree], list[AbstractTree])
+    """
+    leaves = []
+    folders = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node._subtrees:
+            folders.append(node)
+            stack.extend(node._subtrees)
+        else:
+            leaves.append(node)
+    leaves.sort(key=lambda node: node.data_size, reverse=True)
+    folders.sort(key=lambda node: node.data_size, reverse=True)
+    return leaves[:k], folders[:k]
+
+
+def benchmark_diff(leaf_count=10 ** 6, change_every=100):
+    """Compare diffing two saved scans of <leaf_count> files, one in every
+    <change_every> of which changed, by streaming both snapshots with
+    diff_snapshots, against loading both scans as trees and diffing them
+    with diff_trees.
+
+    @type leaf_count: int
+    @type change_every: int
+    @rtype: None
+    """
+    temp_dir = tempfile.mkdtemp()
+    try:
+        root = os.path.join(temp_dir, 'root')
+        old_path = os.path.join(temp_dir, 'old.snapshot')
+        new_path = os.path.join(temp_dir, 'new.snapshot')
+        save_snapshot(old_path, root,
+                      _synthetic_listings(root, leaf_count, 0), {})
+        save_snapshot(new_path, root, _synthetic_listings(
+            root, leaf_count, change_every), {})
+        print('{} files, one in {} changed'.format(leaf_count, change_every))
+        for label, function in [('diff_snapshots', diff_snapshots),
+                                ('diff_trees of both scans loaded',
+                                 _diff_loaded)]:
+            diff, peak, seconds = _measure_peak(function, old_path, new_path)
+            print('{:<55} {:>10.4f} s {:>8.1f} MB peak {:>8} changed'.format(
+                label, seconds, peak / 2 ** 20, len(_leaves(diff))))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def _synthetic_listings(root, leaf_count, change_every):
+    """Return the listings of a folder <root> of <leaf_count> files in
+    folders of 100, as fs_scan.scan_listings does.
+
+    If <change_every> is not 0, one in every <change_every> files grows,
+    and as many again are renamed, i.e. removed and added.
+
+    @type root: str
+    @type leaf_count: int
+    @type change_every: int
+    @rtype: dict[str, list[(str, bool, int)]]
+    """
+    listings = {root: []}
+    for i, (folder, name, size) in enumerate(_synthetic_names(leaf_count,
+                                                              100)):
+        folder_path = os.path.join(root, 'dir{}'.format(folder))
+        if folder_path not in listings:
+            listings[root].append(('dir{}'.format(folder), True, 0))
+            listings[folder_path] = []
+        if change_every and i % change_every == 0:
+            size += 1000
+        elif change_every and i % change_every == 1:
+            name = 'renamed-' + name
+        listings[folder_path].append((name, False, size))
+    return listings
+
+
+def _diff_loaded(old_path, new_path):
+    """Return diff_trees of the scans saved in the snapshots at <old_path>
+    and <new_path>, loaded as FileSystemTrees.
+
+    @type old_path: str
+    @type new_path: str
+    @rtype: DiffTree
+    """
+    trees = []
+    for path in [old_path, new_path]:
+        root = next(iter_snapshot(path))['root']
+        listings = {dir_path: entries for dir_path, (_, entries)
+                    in load_snapshot(path, root).items()}
+        trees.append(build_tree(root, listings))
+    return diff_trees(trees[0], trees[1])
+
+
+def _measure_peak(function, *args):
+    """Return the result of calling <function> on <args>, the largest
+    number of bytes allocated by the call at any one time, and the number
+    of seconds the call took.
+
+    @type function: callable
+    @rtype: (object, int, float)
+    """
+    tracemalloc.start()
+    result, seconds = _timed(function, *args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak, seconds
+
+
+BENCHMARKS = {
+    'deep': benchmark_deep_trees,
+    'delete': benchmark_batch_delete,
+    'diff': benchmark_diff,
+    'lod': benchmark_level_of_detail,
+    'squarify': benchmark_squarify,
+    'hits': benchmark_hit_testing,
+    'largest': benchmark_largest,
+    'layout': benchmark_layout,
+    'parallel': benchmark_parallel_layout,
+    'paths': benchmark_paths,
+    'resize': benchmark_mutate_size,
+    'undo': benchmark_undo,
+    'compact': benchmark_compact_memory,
+    'shards': benchmark_sharded_scan,
+    'zoom': benchmark_zoom,
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print('usage: python tree_benchmarks.py {' +
+              '|'.join(sorted(BENCHMARKS)) + '} [arguments...]')
+    else:
+        BENCHMARKS[sys.argv[1]](*[int(arg) if arg.isdigit() else arg
+                                  for arg in sys.argv[2:]])
@@ -13,17 +13,24 @@ computer's file system.
 """
 import os
 from random import randint
+from bisect import bisect_left
+from threading import Lock
+from heapq import heappush, heappop, heappushpop
+from fnmatch import fnmatch
 import math
 
+# Held while the changes below a tree are added to its data_size.
+_reconcile_lock = Lock()
+
 
 class AbstractTree:
     """A tree that is compatible with the treemap visualiser.
 
     This is an abstract class that should not be instantiated directly.
 
-    You may NOT add any attributes, public or private, to this class.
-    However, part of this assignment will involve you adding and implementing
-    new public *methods* for this interface.
+    Part of this assignment will involve you adding and implementing new
+    public *methods* for this interface. The only attributes added are the
+    private caches below, which keep the treemap fast to redraw.
 
     === Public Attributes ===
     @type data_size: int
@@ -40,6 +47,34 @@ class AbstractTree:
     @type _parent_tree: AbstractTree | None
         The parent tree of this tree; i.e., the tree that contains this tree
         as a subtree, or None if this tree is not part of a larger tree.
+    @type _layout: ((int, int, int, int), callable, int,
+                    list[(AbstractTree, (int, int, int, int))] | None,
+                    tuple | None) | None
+        The rectangle, layout strategy and min_area this tree was last laid
+        out with by generate_treemap, and either the rectangles they gave
+        its non-empty subtrees or the treemap of this tree they produced;
+        or None if this tree has not been laid out since it, or a tree
+        inside it, changed.
+    @type _order: list[int] | None
+        The positions of the non-empty subtrees of this tree among the
+        non-empty subtrees, from largest to smallest; or None if they have
+        not been sorted since a subtree changed.
+    @type _offsets: (int, list[AbstractTree], list[int]) | None
+        A length, the non-empty subtrees of this tree, and where the slice
+        of each of them starts when slice_rect slices a side of that
+        length, followed by the length itself; or None if they have not
+        been computed since a subtree changed.
+    @type _data_size: int
+        The data_size of this tree, not counting the changes below it that
+        are still recorded in _delta.
+    @type _delta: int
+        The change in the data_size of this tree that its parent tree has
+        not been told about yet.
+    @type _dirty: set[AbstractTree] | None
+        The subtrees of this tree with a change in _delta, or a tree in
+        _dirty, that this tree has not added to its data_size yet; or None
+        if there are none. A tree with such a subtree is in the _dirty of
+        its own parent tree.
 
     === Representation Invariants ===
     - data_size >= 0
@@ -55,6 +90,11 @@ class AbstractTree:
 
     - if _parent_tree is not empty, then self is in _parent_tree._subtrees
     """
+    # The number of times generate_treemap has been run, on any tree, so
+    # that a caller can tell whether a tree it laid out may have been laid
+    # out by something else since.
+    _layouts_made = 0
+
     def __init__(self, root, subtrees, data_size=0):
         """Initialize a new AbstractTree.
 
@@ -91,11 +131,90 @@ class AbstractTree:
         self._root = root
         self._subtrees = subtrees
         self._parent_tree = None
-        self.data_size = data_size
+        self._layout = None
+        self._order = None
+        self._offsets = None
+        self._delta = 0
+        self._dirty = None
+        self._data_size = data_size
         self.colour = (randint(0, 255), randint(0, 255), randint(0, 255))
         for tree in subtrees:
             tree._parent_tree = self
-            self.data_size += tree.data_size
+            self._data_size += tree.data_size
+
+    @property
+    def data_size(self):
+        """The total size of all leaves of this tree.
+
+        Changes made below this tree by update_data_size are added to it
+        the first time it is read, rather than when they are made.
+
+        @type self: AbstractTree
+        @rtype: int
+        """
+        if self._dirty:
+            self._reconcile()
+        return self._data_size
+
+    @data_size.setter
+    def data_size(self, data_size):
+        """Set the data_size of this tree alone; update_data_size passes
+        the change on to its parent trees.
+
+        @type self: AbstractTree
+        @type data_size: int
+        @rtype: None
+        """
+        if self._dirty:
+            self._reconcile()
+        self._data_size = data_size
+
+    def _reconcile(self):
+        """Add every change recorded by update_data_size below this tree
+        to the data_size of the trees in between and of this tree.
+
+        Only the trees in _dirty are visited, from the bottom up, so each
+        of them is updated once however many changes were made below it.
+        The changes are kept in the _delta of this tree, to be passed on
+        to its parent tree when that is read.
+
+        @type self: AbstractTree
+        @rtype: None
+
+        >>> T1 = AbstractTree('Test1', [], 10)
+        >>> T2 = AbstractTree('Test2', [T1])
+        >>> T = AbstractTree('Test', [T2])
+        >>> T1.update_data_size(5)
+        >>> T._dirty == {T2}, T2._data_size
+        (True, 10)
+        >>> T._reconcile()
+        >>> T._dirty is None, T2._data_size, T._data_size
+        (True, 15, 15)
+        """
+        # Threads laying out the same tree may read it at the same time, so
+        # one of them reconciles it while the others wait. A tree's
+        # _data_size is final once its _dirty is None.
+        with _reconcile_lock:
+            if not self._dirty:
+                return
+            stack = [self]
+            dirty = []
+            while stack:
+                tree = stack.pop()
+                dirty.append(tree)
+                stack.extend(subtree for subtree in tree._dirty
+                             if subtree._dirty)
+            # Every tree comes after the trees in its _dirty, so their
+            # changes are complete when they are added to it.
+            for tree in reversed(dirty):
+                change = 0
+                for subtree in tree._dirty:
+                    change += subtree._delta
+                    subtree._delta = 0
+                tree._data_size += change
+                if tree._parent_tree is not None:
+                    tree._delta += change
+                tree._dirty = None
 
     def is_empty(self):
         """Return True if this tree is empty.
@@ -105,7 +224,8 @@ class AbstractTree:
         """
         return self._root is None
 
-    def generate_treemap(self, rect):
+    def generate_treemap(self, rect, changed=None, strategy=None,
+                         min_area=0):
         """Run the treemap algorithm on this tree and return the rectangles.
 
         Each returned tuple contains a pygame rectangle and a colour:
@@ -113,9 +233,34 @@ class AbstractTree:
 
         One tuple should be returned per non-empty leaf in this tree.
 
+        A subtree drawn with an area of fewer than <min_area> pixels is not
+        divided any further: it is returned as a single rectangle in its
+        own colour, in place of the rectangles of its leaves, which would
+        be too small to see. Leaves and subtrees drawn with no area at all
+        are then left out. The default of 0 divides every subtree.
+
+        If <changed> is a list, a pair (leaf, rect) is appended to it for
+        each leaf, or subtree drawn as a single rectangle, whose rectangle
+        was computed again rather than taken from a cached layout. Every
+        other leaf has the same rectangle as in the last call.
+
+        <strategy> is the layout strategy used to divide a tree's rectangle
+        among its subtrees: slice_rect (the default) or squarify_rect.
+
+        The tree is not changed: subtrees with a data_size of 0 are skipped
+        rather than deleted (delete_empty_trees removes them), and only the
+        private layout caches are written. Several threads may therefore
+        lay out the same tree at once, e.g. for different rectangles, as
+        long as none of them changes the tree meanwhile. To lay out a tree
+        that may be changed at the same time, or in another process, lay
+        out a copy made by compact_tree.compact_from_tree instead.
+
         @type self: AbstractTree
         @type rect: (int, int, int, int)
             Input is in the pygame format: (x, y, width, height)
+        @type changed: list[(AbstractTree, (int, int, int, int))] | None
+        @type strategy: callable | None
+        @type min_area: int
         @rtype: list[((int, int, int, int), (int, int, int))]
 
         >>> T1 = AbstractTree('Test1', [], 15)
@@ -139,6 +284,9 @@ class AbstractTree:
         (0, 33, 100, 33)
         >>> rects[2][0]
         (0, 66, 100, 34)
+        >>> rects = T.generate_treemap((0, 0, 10, 10), min_area=200)
+        >>> rects == [((0, 0, 10, 10), T.colour)]
+        True
         """
         # Read the handout carefully to help get started identifying base cases,
         # and the outline of a recursive step.
@@ -146,39 +294,120 @@ class AbstractTree:
         # Programming tip: use "tuple unpacking assignment" to easily extract
         # coordinates of a rectangle, as follows.
         # x, y, width, height = rect
-        tree_map = []
-        x, y, width, height = rect
-        self.delete_empty_trees()
+        #
+        # Every internal tree keeps its layout, so only the trees changed
+        # since the last call divide their rectangles again: those trees
+        # are on the paths from the changed trees up to the root, since
+        # every change goes through update_data_size. A tree whose cached
+        # layout matches has not changed, and neither has anything inside
+        # it.
+        #
+        # The tree laid out, and every subtree with at most half the
+        # data_size of its parent tree, keeps its part of the treemap,
+        # which is reused as is. Each rectangle is then kept by at most
+        # one tree in every halving of the data_size above it, rather than
+        # by every tree above it. Any other tree keeps the rectangles it
+        # gave its subtrees instead, and its part is put together again
+        # from theirs. The cached layout of a tree is read once, since
+        # another thread laying out the same tree may replace it at any
+        # time.
+        AbstractTree._layouts_made += 1
+        if strategy is None:
+            strategy = slice_rect
         if self.data_size == 0:
-            return tree_map
-        elif self._subtrees == []:
-            tree_map.append((rect, self.colour))
-            return tree_map
-        elif width > height:
-            accumulated_width = 0
-            for subtree in self._subtrees:
-                if subtree == self._subtrees[len(self._subtrees) - 1]:
-                    sub_width = width - accumulated_width
-                else:
-                    sub_width = subtree.proportionate_tree(width)
-                sub_rect = x, y, sub_width, height
-                tree_map += (subtree.generate_treemap(sub_rect))
-                x += sub_width
-                accumulated_width += sub_width
-        else:
-            accumulated_height = 0
-            for subtree in self._subtrees:
-                if subtree == self._subtrees[len(self._subtrees) - 1]:
-                    sub_height = height - accumulated_height
+            return []
+        tree_map = []
+        # Each stack frame is an iterator over the subtrees of a tree and
+        # their rectangles. laid_out holds, for each frame, the layout of
+        # its tree, the tree, the start of its part of tree_map, and
+        # whether its subtrees' rectangles were computed again.
+        stack = [iter([(self, rect)])]
+        laid_out = []
+        fresh = True
+        while stack:
+            for tree, rect in stack[-1]:
+                area = rect[2] * rect[3]
+                if area == 0 < min_area:
+                    continue
+                if tree._subtrees == [] or area < min_area:
+                    tree_map.append((rect, tree.colour))
+                    if changed is not None and fresh:
+                        changed.append((tree, rect))
+                    continue
+                layout = tree._layout
+                if layout is not None and layout[0] == rect and \
+                        layout[1] is strategy and layout[2] == min_area:
+                    if layout[4] is not None:
+                        tree_map.extend(layout[4])
+                        continue
+                    fresh = False
                 else:
-                    sub_height = subtree.proportionate_tree(height)
-                sub_rect = x, y, width, sub_height
-                tree_map += (subtree.generate_treemap(sub_rect))
-                y += sub_height
-                accumulated_height += sub_height
+                    layout = (rect, strategy, min_area,
+                              tree._sub_rects(rect, strategy), None)
+                    tree._layout = layout
+                    fresh = True
+                stack.append(iter(layout[3]))
+                laid_out.append((layout, tree, len(tree_map), fresh))
+                break
+            else:
+                stack.pop()
+                if laid_out:
+                    layout, tree, start, _ = laid_out.pop()
+                    if laid_out == [] or tree._data_size * 2 <= \
+                            tree._parent_tree._data_size:
+                        tree._layout = layout[:3] + (
+                            None, tuple(tree_map[start:]))
+                    if laid_out:
+                        fresh = laid_out[-1][3]
         return tree_map
 
-    def find_leaf(self, rect, coordinations):
+    def iter_treemap(self, rect, strategy=None, min_area=0):
+        """Yield the rectangles of the treemap of this tree, one at a time.
+
+        The rectangles and their order are exactly the ones generate_treemap
+        returns, but the tree is walked only once and no layouts are
+        cached.
+
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+        @type strategy: callable | None
+            The layout strategy, as for generate_treemap.
+        @type min_area: int
+            Subtrees drawn with fewer pixels are not divided, as for
+            generate_treemap.
+        @rtype: generator
+
+        >>> T1 = AbstractTree('Test1', [], 15)
+        >>> T2 = AbstractTree('Test2', [], 0)
+        >>> T3 = AbstractTree('Test3', [], 15)
+        >>> T = AbstractTree('Test', [T1, T2, T3])
+        >>> [rect for rect, _ in T.iter_treemap((0, 0, 100, 80))]
+        [(0, 0, 50, 80), (50, 0, 50, 80)]
+        >>> len(T._subtrees)
+        3
+        """
+        # The tree is traversed with an explicit stack rather than recursion,
+        # so that very deep trees do not exceed Python's recursion limit.
+        # Each stack frame is an iterator over the non-empty subtrees of a
+        # tree and their rectangles; leaves are yielded as soon as they are
+        # reached, and only internal trees are pushed.
+        if self.data_size == 0:
+            return
+        stack = [iter([(self, rect)])]
+        while stack:
+            for tree, rect in stack[-1]:
+                area = rect[2] * rect[3]
+                if area == 0 < min_area:
+                    continue
+                if tree._subtrees == [] or area < min_area:
+                    yield rect, tree.colour
+                    continue
+                stack.append(iter(tree._sub_rects(rect, strategy)))
+                break
+            else:
+                stack.pop()
+
+    def find_leaf(self, rect, coordinations, strategy=None):
         """find the corresponding leaf given the coordinations and the pygame
          rectangle
 
@@ -189,6 +418,8 @@ class AbstractTree:
             input is in pygame format: (x, y, width, height)
         @type coordinations = (int, int)
             coordinates where the <rect> was clicked
+        @type strategy = callable | None
+            the layout strategy the treemap was generated with
         @rtype = AbstractTree
 
         >>> T1 = AbstractTree('Test1', [], 15)
@@ -199,34 +430,159 @@ class AbstractTree:
         >>> leaf == T2
         True
         """
+        coord_x, coord_y = coordinations
+        tree = self
+        while tree._subtrees != []:
+            if strategy is None or strategy is slice_rect:
+                found = tree._find_slice(rect, coordinations)
+                if found is None:
+                    return None
+                tree, rect = found
+                continue
+            found = None
+            for subtree, sub_rect in tree._sub_rects(rect, strategy):
+                x, y, sub_width, sub_height = sub_rect
+                if x <= coord_x <= x + sub_width and \
+                        y <= coord_y <= y + sub_height:
+                    found = subtree, sub_rect
+                    break
+            if found is None:
+                return None
+            tree, rect = found
+        return tree
+
+    def _find_slice(self, rect, coordinations):
+        """Return the subtree whose slice of <rect> holds <coordinations>,
+        and that slice, when this tree is drawn in <rect> by slice_rect; or
+        None if no slice holds it.
+
+        Slices are closed, so a point on the edge between two slices is in
+        the first of them, as in find_leaf. The slice is found by a binary
+        search of the offsets from _slice_offsets.
+
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+        @type coordinations: (int, int)
+        @rtype: (AbstractTree, (int, int, int, int)) | None
+
+        >>> T1 = AbstractTree('Test1', [], 15)
+        >>> T2 = AbstractTree('Test2', [], 15)
+        >>> T = AbstractTree('Test', [T1, T2])
+        >>> T._find_slice((0, 0, 100, 80), (50, 10)) == (T1, (0, 0, 50, 80))
+        True
+        """
         x, y, width, height = rect
         coord_x, coord_y = coordinations
-        if self._subtrees == []:
-            return self
-        elif width > height:
-            accumulated_width = 0
-            for subtree in self._subtrees:
-                if subtree == self._subtrees[len(self._subtrees) - 1]:
-                    sub_width = width - accumulated_width
-                else:
-                    sub_width = subtree.proportionate_tree(width)
-                sub_rect = x, y, sub_width, height
-                if x <= coord_x <= x + sub_width:
-                    return subtree.find_leaf(sub_rect, coordinations)
-                accumulated_width += sub_width
-                x += sub_width
-        elif height >= width:
-            accumulated_height = 0
-            for subtree in self._subtrees:
-                if subtree == self._subtrees[len(self._subtrees) - 1]:
-                    sub_height = height - accumulated_height
-                else:
-                    sub_height = subtree.proportionate_tree(height)
-                sub_rect = x, y, width, sub_height
-                if y <= coord_y <= y + sub_height:
-                    return subtree.find_leaf(sub_rect, coordinations)
-                accumulated_height += sub_height
-                y += sub_height
+        if self.data_size == 0 or not (x <= coord_x <= x + width and
+                                       y <= coord_y <= y + height):
+            return None
+        if width > height:
+            subtrees, offsets = self._slice_offsets(width)
+            i = bisect_left(offsets, coord_x - x, 1) - 1
+            return subtrees[i], (x + offsets[i], y,
+                                 offsets[i + 1] - offsets[i], height)
+        subtrees, offsets = self._slice_offsets(height)
+        i = bisect_left(offsets, coord_y - y, 1) - 1
+        return subtrees[i], (x, y + offsets[i], width,
+                             offsets[i + 1] - offsets[i])
+
+    def _slice_offsets(self, length):
+        """Return the non-empty subtrees of this tree, and where the slice
+        of each of them starts when slice_rect slices a side of <length>
+        pixels of this tree's rectangle, followed by <length>.
+
+        The slice of the i-th subtree spans offsets[i] to offsets[i + 1],
+        so it is read in constant time. The offsets are cached until a
+        subtree changes, or a different length is asked for.
+
+        Precondition: this tree has at least one subtree, and its data_size
+                      is not 0.
+
+        @type self: AbstractTree
+        @type length: int
+        @rtype: (list[AbstractTree], list[int])
+
+        >>> T = AbstractTree('Test', [AbstractTree('Test1', [], 15),
+        ...                           AbstractTree('Test2', [], 0),
+        ...                           AbstractTree('Test3', [], 15),
+        ...                           AbstractTree('Test4', [], 15)])
+        >>> T._slice_offsets(100)[1]
+        [0, 33, 66, 100]
+        """
+        cached = self._offsets
+        if cached is not None and cached[0] == length:
+            return cached[1], cached[2]
+        total = self.data_size
+        subtrees = [subtree for subtree in self._subtrees
+                    if subtree._data_size != 0]
+        offsets = [0]
+        for sub_length in _slice_lengths(
+                [subtree._data_size for subtree in subtrees], total,
+                length):
+            offsets.append(offsets[-1] + sub_length)
+        self._offsets = length, subtrees, offsets
+        return subtrees, offsets
+
+    def _sub_rects(self, rect, strategy=None):
+        """Return the rectangle of each non-empty subtree of this tree, when
+        this tree is drawn in <rect>.
+
+        This is a single step of the treemap algorithm: <rect> is divided
+        among the subtrees in proportion to their data_size, by <strategy>
+        (slice_rect if it is None). Subtrees with a data_size of 0 are not
+        drawn, so they are left out.
+
+        Precondition: this tree has at least one subtree, and its data_size
+                      is not 0.
+
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+        @type strategy: callable | None
+        @rtype: list[(AbstractTree, (int, int, int, int))]
+
+        >>> T1 = AbstractTree('Test1', [], 15)
+        >>> T2 = AbstractTree('Test2', [], 15)
+        >>> T3 = AbstractTree('Test3', [], 15)
+        >>> T = AbstractTree('Test', [T1, T2, T3])
+        >>> [sub_rect for _, sub_rect in T._sub_rects((0, 0, 100, 80))]
+        [(0, 0, 33, 80), (33, 0, 33, 80), (66, 0, 34, 80)]
+        """
+        if strategy is None:
+            strategy = slice_rect
+        # Reading data_size adds up every change made below this tree, so
+        # the _data_size of its subtrees is up to date after it.
+        total = self.data_size
+        subtrees = [subtree for subtree in self._subtrees
+                    if subtree._data_size != 0]
+        sub_rects = strategy(rect, [subtree._data_size for subtree in subtrees],
+                             total, self._size_order)
+        return list(zip(subtrees, sub_rects))
+
+    def _size_order(self):
+        """Return the positions of the non-empty subtrees of this tree
+        among the non-empty subtrees, from largest to smallest.
+
+        Subtrees of the same size keep their order. The result is cached
+        until a subtree changes, so the subtrees are sorted only once no
+        matter how often this tree is laid out.
+
+        @type self: AbstractTree
+        @rtype: list[int]
+
+        >>> T = AbstractTree('Test', [AbstractTree('Test1', [], 5),
+        ...                           AbstractTree('Test2', [], 0),
+        ...                           AbstractTree('Test3', [], 15)])
+        >>> T._size_order()
+        [1, 0]
+        """
+        if self._order is None:
+            if self._dirty:
+                self._reconcile()
+            sizes = [subtree._data_size for subtree in self._subtrees
+                     if subtree._data_size != 0]
+            self._order = sorted(range(len(sizes)), key=sizes.__getitem__,
+                                 reverse=True)
+        return self._order
 
     def proportionate_tree(self, parameter):
         """return the proportionated parameter of this tree's data size compared
@@ -319,6 +675,10 @@ class AbstractTree:
         nothing
         The parent trees of this tree will have data_size updated after deletion
 
+        Finding the child takes time linear in the number of subtrees of
+        this tree. To delete many subtrees, use delete_subtrees, which goes
+        through each parent's subtrees only once.
+
         @type self = AbstractTree
         @type child = AbstractTree
             the subtree targeted for deletion
@@ -331,14 +691,129 @@ class AbstractTree:
         >>> T.data_size
         0
         """
-        count = 0
-        for subtree in self._subtrees:
-            if subtree == child:
-                data_size = self._subtrees[count].data_size
-                subtree.update_data_size(-data_size)
-                self._subtrees.pop(count)
-                count = len(self._subtrees)
-            count += 1
+        # A single list.index both checks for the child and finds where it
+        # is, so the subtrees are only searched once.
+        try:
+            index = self._subtrees.index(child)
+        except ValueError:
+            return
+        del self._subtrees[index]
+        child.update_data_size(-child.data_size)
+
+    def delete_subtrees(self, subtrees):
+        """Delete every tree in <subtrees> from its parent tree, and update
+        the data_size of the trees above them.
+
+        This has the same effect as calling delete_selected_leaf on each
+        of them, but every parent's list of subtrees is rebuilt only once,
+        and the data_size of each tree above the deleted ones is updated
+        only once, however many deleted trees are below it. Trees inside
+        other deleted trees are deleted as well, and only counted once.
+
+        If this tree is in <subtrees>, it is deleted as by
+        delete_selected_leaf, and the trees inside it are left alone.
+
+        Precondition: every tree in <subtrees> is this tree or a tree
+                      inside it.
+
+        @type self: AbstractTree
+        @type subtrees: collection[AbstractTree]
+        @rtype: None
+
+        >>> T1 = AbstractTree('Test1', [], 1)
+        >>> T2 = AbstractTree('Test2', [], 2)
+        >>> T3 = AbstractTree('Test3', [], 4)
+        >>> T4 = AbstractTree('Test4', [T2, T3])
+        >>> T = AbstractTree('Test', [T1, T4, AbstractTree('Test5', [], 8)])
+        >>> T.delete_subtrees([T1, T2, T4])
+        >>> [subtree._root for subtree in T._subtrees]
+        ['Test5']
+        >>> T.data_size, T4.data_size
+        (8, 4)
+        """
+        doomed = set(subtrees)
+        if self in doomed:
+            # Every other tree in <subtrees> goes with this one, and its
+            # size is already taken away from the trees above.
+            self.delete_selected_leaf()
+            return
+        # The change in data_size of every tree whose subtrees are deleted,
+        # or which is above such a tree, and the number of trees directly
+        # below it whose change is not known yet. Each tree is reached once
+        # when walking up from the deleted trees.
+        changes = {}
+        waiting = {}
+        for tree in doomed:
+            parent = tree._parent_tree
+            if parent not in changes:
+                changes[parent] = 0
+                waiting[parent] = 0
+                while parent._parent_tree is not None and \
+                        parent._parent_tree not in changes:
+                    changes[parent._parent_tree] = 0
+                    waiting[parent._parent_tree] = 1
+                    parent = parent._parent_tree
+                if parent._parent_tree is not None:
+                    waiting[parent._parent_tree] += 1
+        for parent in {tree._parent_tree for tree in doomed}:
+            parent._subtrees = [subtree for subtree in parent._subtrees
+                                if subtree not in doomed]
+        # Trees are finished from the bottom up: once all the trees below a
+        # tree are finished, its change is final and is passed up, except
+        # that a deleted tree takes its whole data_size away from its
+        # parent instead.
+        for tree in doomed:
+            changes[tree._parent_tree] -= tree.data_size
+        ready = [tree for tree in changes if waiting[tree] == 0]
+        while ready:
+            tree = ready.pop()
+            tree.data_size += changes[tree]
+            tree._layout = None
+            tree._order = None
+            tree._offsets = None
+            parent = tree._parent_tree
+            if parent is None:
+                continue
+            if tree not in doomed:
+                changes[parent] += changes[tree]
+            waiting[parent] -= 1
+            if waiting[parent] == 0:
+                ready.append(parent)
+
+    def insert_child(self, child, index=None):
+        """add <child> as a subtree of this tree at position <index>
+
+        If <index> is None, <child> is added after all other subtrees.
+        The data_size of this tree and its parent trees are updated after
+        insertion. The cached layouts of <child> and of every tree inside it
+        are discarded, since they were made for wherever <child> was drawn
+        before, so generate_treemap reports all of its leaves as changed.
+
+        Precondition: if this tree has no subtrees, its data_size is 0
+                      <child> is not a subtree of any other tree
+
+        @type self: AbstractTree
+        @type child: AbstractTree
+            the subtree to be inserted
+        @type index: int | None
+        @rtype: None
+
+        >>> T1 = AbstractTree('Test1', [], 1)
+        >>> T2 = AbstractTree('Test2', [], 5)
+        >>> T = AbstractTree('Test', [T1])
+        >>> T.insert_child(T2, 0)
+        >>> T._subtrees[0]._root
+        'Test2'
+        >>> T.data_size
+        6
+        """
+        if index is None:
+            self._subtrees.append(child)
+        else:
+            self._subtrees.insert(index, child)
+        child._parent_tree = self
+        child._discard_layouts()
+        child.update_data_size(child.data_size)
 
     def update_data_size(self, data_size):
         """update the data_size on parent trees of this tree
@@ -346,7 +821,15 @@ class AbstractTree:
         <data_size> can be positive or negative.
         If data_size is positive all parent trees' data size will increase
         If data_size is negative all parent trees' data size will decrease
+        The cached layouts of this tree and its parent trees are discarded,
+        even if <data_size> is 0, so this must be called after any change to
+        a tree.
 
+        The parent trees are not updated straight away: the change is kept
+        by this tree, and every parent tree is marked as having a changed
+        subtree, until a marked parent tree is reached. The data_size of a
+        parent tree adds up the changes below it when it is read, so many
+        changes below the same tree take a single pass up to it.
 
         @type self = AbstractTree
         @type data_size = int
@@ -364,15 +847,80 @@ class AbstractTree:
         >>> T.data_size
         10
         """
-        if self._parent_tree is None:
-            pass
-        else:
-            self._parent_tree.data_size += data_size
-            self._parent_tree.update_data_size(data_size)
+        # A tree already in the _dirty of its parent had its parent trees'
+        # caches discarded when it was marked, and trees with a marked
+        # subtree are never laid out before they are read again.
+        if self._parent_tree is not None:
+            self._delta += data_size
+        tree = self
+        while True:
+            tree._layout = None
+            tree._order = None
+            tree._offsets = None
+            parent = tree._parent_tree
+            if parent is None:
+                break
+            if parent._dirty is None:
+                parent._dirty = {tree}
+            elif tree in parent._dirty:
+                break
+            else:
+                parent._dirty.add(tree)
+            tree = parent
+
+    def invalidate_layout(self, subtrees=False):
+        """Discard the cached layouts, subtree orders and slice offsets of
+        this tree and of its parent trees, so that generate_treemap lays
+        them out again.
+
+        If <subtrees> is True, those of every tree inside this tree are
+        discarded too, so that generate_treemap reports every leaf of this
+        tree as changed.
+
+        @type self: AbstractTree
+        @type subtrees: bool
+        @rtype: None
+
+        >>> T1 = AbstractTree('Test1', [], 10)
+        >>> T = AbstractTree('Test', [T1, AbstractTree('Test2', [], 10)])
+        >>> rects = T.generate_treemap((0, 0, 100, 100))
+        >>> T._layout is None
+        False
+        >>> T1.invalidate_layout()
+        >>> T._layout is None
+        True
+        """
+        if subtrees:
+            self._discard_layouts()
+        tree = self
+        while tree is not None:
+            tree._layout = None
+            tree._order = None
+            tree._offsets = None
+            tree = tree._parent_tree
+
+    def _discard_layouts(self):
+        """Discard the cached layouts, subtree orders and slice offsets of
+        this tree and of every tree inside it.
+
+        @type self: AbstractTree
+        @rtype: None
+        """
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            tree._layout = None
+            tree._order = None
+            tree._offsets = None
+            stack.extend(tree._subtrees)
 
     def delete_empty_trees(self):
         """delete all empty subtrees in this tree
 
+        Subtrees with a data_size of 0 are removed at every level of this
+        tree, not just from this tree's own subtrees. If this tree itself
+        is empty, it is removed from its parent tree.
+
         @type self = AbstractTree
         @rtype = None
 
@@ -389,12 +937,136 @@ class AbstractTree:
         if self.data_size == 0:
             self.delete_selected_leaf()
         else:
-            index = 0
-            while index < len(self._subtrees):
-                if self._subtrees[index].data_size == 0:
-                    self._subtrees[index].delete_empty_trees()
-                else:
-                    index += 1
+            # Subtree lists are only rebuilt if they hold an empty subtree,
+            # and leaves are never pushed.
+            stack = [self]
+            while stack:
+                tree = stack.pop()
+                for subtree in tree._subtrees:
+                    if subtree.data_size == 0:
+                        tree._subtrees = [subtree for subtree in tree._subtrees
+                                          if subtree.data_size != 0]
+                        break
+                for subtree in tree._subtrees:
+                    if subtree._subtrees:
+                        stack.append(subtree)
+
+    def largest_leaves(self, k, min_depth=0, max_depth=None, pattern=None):
+        """Return the <k> largest leaves of this tree, from largest to
+        smallest, leaving out any which are not at least <min_depth> and at
+        most <max_depth> trees below this tree, or whose root does not
+        match the shell-style <pattern>.
+
+        If there are fewer than <k> such leaves, all of them are returned.
+        See _largest for how the tree is searched.
+
+        @type self: AbstractTree
+        @type k: int
+        @type min_depth: int
+        @type max_depth: int | None
+        @type pattern: str | None
+        @rtype: list[AbstractTree]
+
+        >>> T1 = AbstractTree('a.txt', [], 5)
+        >>> T2 = AbstractTree('b.py', [], 3)
+        >>> T3 = AbstractTree('c.txt', [], 4)
+        >>> T = AbstractTree('Test', [AbstractTree('Test1', [T1, T2]), T3])
+        >>> [leaf._root for leaf in T.largest_leaves(2)]
+        ['a.txt', 'c.txt']
+        >>> [leaf._root for leaf in T.largest_leaves(2, pattern='*.py')]
+        ['b.py']
+        >>> [leaf._root for leaf in T.largest_leaves(2, max_depth=1)]
+        ['c.txt']
+        """
+        return self._largest(k, True, min_depth, max_depth, pattern)
+
+    def largest_internal_trees(self, k, min_depth=0, max_depth=None,
+                               pattern=None):
+        """Return the <k> largest trees with subtrees in this tree, this
+        tree included, from largest to smallest, leaving out any which are
+        not at least <min_depth> and at most <max_depth> trees below this
+        tree, or whose root does not match the shell-style <pattern>.
+
+        If there are fewer than <k> such trees, all of them are returned.
+        See _largest for how the tree is searched.
+
+        @type self: AbstractTree
+        @type k: int
+        @type min_depth: int
+        @type max_depth: int | None
+        @type pattern: str | None
+        @rtype: list[AbstractTree]
+
+        >>> T1 = AbstractTree('Test1', [AbstractTree('a.txt', [], 5)])
+        >>> T2 = AbstractTree('Test2', [AbstractTree('b.txt', [], 3)])
+        >>> T = AbstractTree('Test', [T1, T2])
+        >>> [tree._root for tree in T.largest_internal_trees(2)]
+        ['Test', 'Test1']
+        >>> [tree._root for tree in T.largest_internal_trees(5, 1)]
+        ['Test1', 'Test2']
+        """
+        return self._largest(k, False, min_depth, max_depth, pattern)
+
+    def _largest(self, k, leaves, min_depth, max_depth, pattern):
+        """Return the <k> largest leaves of this tree if <leaves> is True,
+        or its <k> largest trees with subtrees otherwise, as
+        largest_leaves and largest_internal_trees do.
+
+        The best matches found so far are kept in a heap of at most <k>
+        trees, smallest first. No tree inside a tree is larger than it, so
+        once there are <k> of them, every tree no larger than the smallest
+        is passed over along with everything inside it. The trees with
+        subtrees still to be looked inside are kept in a second heap,
+        largest first, and looked inside from the largest down: the search
+        stops as soon as the largest left is no larger than the smallest
+        match, so no other tree is ever sorted or even visited.
+
+        @type self: AbstractTree
+        @type k: int
+        @type leaves: bool
+        @type min_depth: int
+        @type max_depth: int | None
+        @type pattern: str | None
+        @rtype: list[AbstractTree]
+        """
+        if self._root is None or k <= 0:
+            return []
+        # Reading data_size adds up every change made below this tree, so
+        # the _data_size of every tree inside it is up to date after it.
+        # Both heaps hold a size and the number of trees pushed before, so
+        # that trees themselves are never compared: the matches as
+        # (data_size, minus that number, tree), and the trees to look
+        # inside as (minus data_size, that number, depth, tree).
+        best = []
+        to_visit = [(-self.data_size, 0, 0, self)]
+        pushed = 1
+        if self._subtrees == []:
+            to_visit = []
+            if leaves and min_depth <= 0 and _is_match(self, pattern):
+                best.append((self._data_size, 0, self))
+        while to_visit:
+            size, _, depth, tree = heappop(to_visit)
+            if len(best) == k and -size <= best[0][0]:
+                break
+            if depth >= min_depth and not leaves and \
+                    _is_match(tree, pattern):
+                _keep(best, k, (-size, -pushed, tree))
+                pushed += 1
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for subtree in tree._subtrees:
+                size = subtree._data_size
+                if len(best) == k and size <= best[0][0]:
+                    continue
+                if subtree._subtrees:
+                    heappush(to_visit, (-size, pushed, depth + 1, subtree))
+                elif leaves and subtree._root is not None and \
+                        depth + 1 >= min_depth and \
+                        _is_match(subtree, pattern):
+                    _keep(best, k, (size, -pushed, subtree))
+                pushed += 1
+        best.sort(reverse=True)
+        return [match[2] for match in best]
 
     def get_separator(self):
         """Return the string used to separate nodes in the string
@@ -423,14 +1095,30 @@ class FileSystemTree(AbstractTree):
 
     The data_size attribute for regular files as simply the size of the file,
     as reported by os.path.getsize.
+
+    === Private Attributes ===
+    @type _separator: (FileSystemTree | None, str | None, str) | None
+        The parent tree and path of the parent tree this tree's path was
+        last built from by get_separator, and that path; or None if it has
+        not been built yet.
     """
-    def __init__(self, path):
+    def __init__(self, path, subtrees=None, data_size=0):
         """Store the file tree structure contained in the given file or folder.
 
+        If <subtrees> is None, the file system is walked starting at <path>.
+
+        If <subtrees> is a list, the file system is not accessed at all:
+        this tree's root is the basename of <path>, and <subtrees> and
+        <data_size> are passed directly to the superclass constructor. This
+        lets other scanners (see fs_scan.py) build FileSystemTree objects
+        from data they have already collected.
+
         Precondition: <path> is a valid path for this computer.
 
         @type self: FileSystemTree
         @type path: str
+        @type subtrees: list[FileSystemTree] | None
+        @type data_size: int
         @rtype: None
 
         >>> T = FileSystemTree('TestFolder')
@@ -439,20 +1127,45 @@ class FileSystemTree(AbstractTree):
         >>> T = FileSystemTree('TestFolder\\F1')
         >>> T.data_size
         3
+        >>> T = FileSystemTree('f1.txt', [], 15)
+        >>> T._root
+        'f1.txt'
+        >>> T.data_size
+        15
         """
         # Remember that you should recursively go through the file system
         # and create new FileSystemTree objects for each file and folder
         # encountered.
         #
         # Also remember to make good use of the superclass constructor!
-        if not os.path.isdir(path):
+        self._separator = None
+        if subtrees is not None:
+            AbstractTree.__init__(self, os.path.basename(path), subtrees,
+                                  data_size)
+        elif not os.path.isdir(path):
             AbstractTree.__init__(self, os.path.basename(path),
                                   [], os.path.getsize(path))
         else:
-            subtrees = []
-            for filename in os.listdir(path):
-                subpath = os.path.join(path, filename)
-                subtrees.append(FileSystemTree(subpath))
+            # Walk the folder with an explicit stack instead of recursing, so
+            # that very deep folders do not exceed Python's recursion limit.
+            # Each stack frame holds a folder path, an iterator over the
+            # names in that folder not visited yet, and the subtrees built
+            # so far for the names which have been.
+            stack = [(path, iter(os.listdir(path)), [])]
+            while True:
+                dir_path, filenames, subtrees = stack[-1]
+                for filename in filenames:
+                    subpath = os.path.join(dir_path, filename)
+                    if os.path.isdir(subpath):
+                        stack.append((subpath, iter(os.listdir(subpath)), []))
+                        break
+                    subtrees.append(FileSystemTree(
+                        subpath, [], os.path.getsize(subpath)))
+                else:
+                    stack.pop()
+                    if not stack:
+                        break
+                    stack[-1][2].append(FileSystemTree(dir_path, subtrees))
             AbstractTree.__init__(self, os.path.basename(path), subtrees)
 
     def get_separator(self):
@@ -470,11 +1183,240 @@ class FileSystemTree(AbstractTree):
         >>> leaf.get_separator()
         'TestFolder\\F1\\T1.txt'
         """
-        path = self._root
-        if self._parent_tree is None:
-            return path
+        # Every tree keeps its path, along with the parent tree and the
+        # parent's path string it was joined to. The path is still right as
+        # long as both are the same objects, so it is only joined again for
+        # a tree that was moved, or is inside one that was.
+        trees = []
+        tree = self
+        while tree is not None:
+            trees.append(tree)
+            tree = tree._parent_tree
+        parent = None
+        path = None
+        for tree in reversed(trees):
+            memo = tree._separator
+            if memo is None or memo[0] is not parent or memo[1] is not path:
+                if parent is None:
+                    memo = None, None, tree._root
+                else:
+                    memo = parent, path, os.path.join(path, tree._root)
+                tree._separator = memo
+            parent = tree
+            path = memo[2]
+        return path
+
+
+def _is_match(tree, pattern):
+    """Return whether the root of <tree> matches the shell-style <pattern>,
+    if one is given.
+
+    @type tree: AbstractTree
+    @type pattern: str | None
+    @rtype: bool
+    """
+    return pattern is None or fnmatch(str(tree._root), pattern)
+
+
+def _keep(best, k, match):
+    """Add <match> to the heap <best>, dropping its smallest match if it
+    then holds more than <k>.
+
+    @type best: list[(int, int, AbstractTree)]
+    @type k: int
+    @type match: (int, int, AbstractTree)
+    @rtype: None
+    """
+    if len(best) < k:
+        heappush(best, match)
+    else:
+        heappushpop(best, match)
+
+
+def slice_rect(rect, sizes, total, sorted_order=None):
+    """Return the rectangles that <rect> is sliced into, one for each of
+    <sizes>, in order.
+
+    This is the slice-and-dice layout strategy, and a single step of the
+    treemap algorithm: <rect> is sliced along its longer side, and each size
+    gets the share of it that the size is of <total>, rounded down. The last
+    size takes whatever is left over after rounding down the others. All the
+    slices are computed in one pass over <sizes>, so the same step serves
+    every tree representation.
+
+    Precondition: <sizes> is not empty, and total != 0.
+
+    @type rect: (int, int, int, int)
+    @type sizes: list[int]
+    @type total: int
+    @type sorted_order: (() -> list[int]) | None
+        Not used by this strategy; see squarify_rect.
+    @rtype: list[(int, int, int, int)]
+
+    >>> slice_rect((0, 0, 100, 80), [15, 15, 15], 45)
+    [(0, 0, 33, 80), (33, 0, 33, 80), (66, 0, 34, 80)]
+    >>> slice_rect((10, 0, 50, 100), [1, 3], 4)
+    [(10, 0, 50, 25), (10, 25, 50, 75)]
+    """
+    x, y, width, height = rect
+    lengths = _slice_lengths(sizes, total,
+                             width if width > height else height)
+    sub_rects = []
+    if width > height:
+        for sub_width in lengths:
+            sub_rects.append((x, y, sub_width, height))
+            x += sub_width
+    else:
+        for sub_height in lengths:
+            sub_rects.append((x, y, width, sub_height))
+            y += sub_height
+    return sub_rects
+
+
+def _slice_lengths(sizes, total, length):
+    """Return the length of the slice of each of <sizes> when slice_rect
+    slices a side of <length> pixels.
+
+    Precondition: <sizes> is not empty, and total != 0.
+
+    @type sizes: list[int]
+    @type total: int
+    @type length: int
+    @rtype: list[int]
+
+    >>> _slice_lengths([15, 15, 15], 45, 100)
+    [33, 33, 34]
+    """
+    lengths = [int((size / total) * length) for size in sizes]
+    lengths[-1] = length - sum(lengths) + lengths[-1]
+    return lengths
+
+
+def squarify_rect(rect, sizes, total, sorted_order=None):
+    """Return the rectangles that <rect> is divided into, one for each of
+    <sizes>, in order, with the squarified layout strategy.
+
+    Sizes are placed from largest to smallest, in rows along the shorter
+    side of the part of <rect> not filled yet. A row is closed as soon as
+    adding the next size would make the most elongated rectangle in it
+    more elongated, so the rectangles come out close to squares. Their
+    edges are rounded to whole pixels, so the rectangles still fill <rect>
+    exactly. Sizes of 0 get empty rectangles.
+
+    Precondition: <sizes> is not empty, and total != 0.
+
+    @type rect: (int, int, int, int)
+    @type sizes: list[int]
+    @type total: int
+    @type sorted_order: (() -> list[int]) | None
+        Returns the positions of <sizes> from largest to smallest, e.g. from
+        a cache. The sizes are sorted here if this is None.
+    @rtype: list[(int, int, int, int)]
+
+    >>> squarify_rect((0, 0, 100, 50), [25, 25, 50], 100)
+    [(50, 0, 50, 25), (50, 25, 50, 25), (0, 0, 50, 50)]
+    """
+    x, y, width, height = rect
+    if width <= 0 or height <= 0:
+        return slice_rect(rect, sizes, total)
+    if sorted_order is None:
+        order = sorted(range(len(sizes)), key=sizes.__getitem__,
+                       reverse=True)
+    else:
+        order = sorted_order()
+    sub_rects = [(x, y, 0, 0)] * len(sizes)
+    scale = width * height / total
+    # The part of <rect> not filled yet always reaches its right and bottom
+    # edges, so only its top left corner and size are tracked.
+    left, top = float(x), float(y)
+    free_width, free_height = float(width), float(height)
+    start = 0
+    while start < len(order) and sizes[order[start]] != 0:
+        side = min(free_width, free_height)
+        largest = sizes[order[start]] * scale
+        row_area = largest
+        worst = _worst_ratio(row_area, largest, largest, side)
+        end = start + 1
+        while end < len(order) and sizes[order[end]] != 0:
+            area = sizes[order[end]] * scale
+            new_worst = _worst_ratio(row_area + area, largest, area, side)
+            if new_worst > worst:
+                break
+            row_area += area
+            worst = new_worst
+            end += 1
+        last_row = end == len(order) or sizes[order[end]] == 0
+        if free_width >= free_height:
+            # The row is a column along the left of the free part.
+            right = x + width if last_row else left + row_area / free_height
+            position = top
+            for k in range(start, end):
+                if k == end - 1:
+                    bottom = y + height
+                else:
+                    bottom = position + \
+                        sizes[order[k]] * scale / (right - left)
+                sub_rects[order[k]] = _round_rect(left, position, right,
+                                                  bottom)
+                position = bottom
+            free_width -= right - left
+            left = right
         else:
-            return os.path.join(self._parent_tree.get_separator(), path)
+            # The row runs along the top of the free part.
+            bottom = y + height if last_row else top + row_area / free_width
+            position = left
+            for k in range(start, end):
+                if k == end - 1:
+                    right = x + width
+                else:
+                    right = position + \
+                        sizes[order[k]] * scale / (bottom - top)
+                sub_rects[order[k]] = _round_rect(position, top, right,
+                                                  bottom)
+                position = right
+            free_height -= bottom - top
+            top = bottom
+        start = end
+    return sub_rects
+
+
+def _worst_ratio(row_area, largest, smallest, side):
+    """Return the aspect ratio of the most elongated rectangle in a row of
+    rectangles with total area <row_area> laid along a side of length
+    <side>, whose largest and smallest areas are <largest> and <smallest>.
+
+    @type row_area: float
+    @type largest: float
+    @type smallest: float
+    @type side: float
+    @rtype: float
+
+    >>> _worst_ratio(4.0, 4.0, 4.0, 2.0)
+    1.0
+    """
+    side_squared = side * side
+    row_squared = row_area * row_area
+    return max(side_squared * largest / row_squared,
+               row_squared / (side_squared * smallest))
+
+
+def _round_rect(left, top, right, bottom):
+    """Return the pygame rectangle with the given edges, rounded to whole
+    pixels.
+
+    @type left: float
+    @type top: float
+    @type right: float
+    @type bottom: float
+    @rtype: (int, int, int, int)
+
+    >>> _round_rect(0.4, 1.6, 10.5, 3.0)
+    (0, 2, 10, 1)
+    """
+    x = int(round(left))
+    y = int(round(top))
+    return x, y, int(round(right)) - x, int(round(bottom)) - y
+
 
 if __name__ == '__main__':
     import python_ta
@@ -0,0 +1,289 @@
+"""Assignment 2: Differences Between Scans
+
+=== Module Description ===
+This module compares two scans of the same folder, to show what grew or
+shrank between them rather than what is big now.
+
+The result is a DiffTree: a FileSystemTree holding only the files that were
+added, removed or changed in size, and the folders they are in. The
+data_size of each file is the absolute change in its size, so a treemap of
+a DiffTree gives every file an area in proportion to how much it changed,
+and its colour tells whether it grew or shrank.
+
+Nodes are matched by path. The files and folders in each folder are matched
+by name through a dictionary, so two trees are compared in time linear in
+their sizes. Two saved snapshots (see scan_snapshot) are compared as
+streams: their directories are sorted by path, so both files are read side
+by side, one directory at a time, like a merge. Neither scan is ever held in
+memory, and unchanged files are dropped as soon as they are compared, so
+the snapshots can be far larger than the memory available, as long as the
+changes between them are not.
+"""
+import os
+
+from tree_data import FileSystemTree
+from scan_snapshot import iter_snapshot
+
+
+# The status of a node in a DiffTree.
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+# The colours of files and folders by the direction of their change.
+_GROWN_COLOUR = (46, 160, 67)
+_ADDED_COLOUR = (86, 211, 100)
+_SHRUNK_COLOUR = (207, 34, 46)
+_REMOVED_COLOUR = (248, 81, 73)
+_UNCHANGED_COLOUR = (128, 128, 128)
+
+
+class DiffTree(FileSystemTree):
+    """The difference between two scans of a file or folder.
+
+    The data_size of a file is the absolute change in its size, and the
+    data_size of a folder is the total of these over the files inside it.
+    The colour of a node is green if it grew and red if it shrank, brighter
+    for files and folders which were added or removed altogether.
+
+    === Public Attributes ===
+    @type status: str
+        ADDED if this file or folder is only in the new scan, REMOVED if it
+        is only in the old one, CHANGED if it is in both and changed, and
+        UNCHANGED for a folder in which nothing changed.
+    @type size_change: int
+        The size of this file or folder in the new scan, minus its size in
+        the old scan.
+    """
+    def __init__(self, name, subtrees, status, size_change=0):
+        """Initialize a new DiffTree.
+
+        If <subtrees> is not empty, <size_change> should not be specified:
+        this tree's size_change is the total of its subtrees'.
+
+        @type self: DiffTree
+        @type name: str
+        @type subtrees: list[DiffTree]
+        @type status: str
+        @type size_change: int
+        @rtype: None
+
+        >>> T1 = DiffTree('a.txt', [], ADDED, 10)
+        >>> T2 = DiffTree('b.txt', [], CHANGED, -4)
+        >>> T = DiffTree('top', [T1, T2], CHANGED)
+        >>> T.size_change, T.data_size
+        (6, 14)
+        """
+        FileSystemTree.__init__(self, name, subtrees, abs(size_change))
+        if subtrees:
+            size_change = sum(subtree.size_change for subtree in subtrees)
+        self.status = status
+        self.size_change = size_change
+        if size_change > 0:
+            self.colour = _ADDED_COLOUR if status == ADDED else _GROWN_COLOUR
+        elif size_change < 0:
+            self.colour = _REMOVED_COLOUR if status == REMOVED else \
+                _SHRUNK_COLOUR
+        else:
+            self.colour = _UNCHANGED_COLOUR
+
+
+def diff_trees(old, new):
+    """Return the difference between <old> and <new>, two scans of the same
+    file or folder.
+
+    A node with no subtrees is taken to be a file, and any other node a
+    folder.
+
+    @type old: FileSystemTree
+    @type new: FileSystemTree
+    @rtype: DiffTree
+
+    >>> old = FileSystemTree('top', [FileSystemTree('a.txt', [], 5),
+    ...                              FileSystemTree('b.txt', [], 7)])
+    >>> new = FileSystemTree('top', [FileSystemTree('a.txt', [], 9),
+    ...                              FileSystemTree('c.txt', [], 1)])
+    >>> diff = diff_trees(old, new)
+    >>> [(node._root, node.status, node.size_change)
+    ...  for node in diff._subtrees]
+    [('a.txt', 'changed', 4), ('c.txt', 'added', 1), ('b.txt', 'removed', -7)]
+    >>> diff.size_change, diff.data_size
+    (-2, 12)
+    """
+    if old._subtrees == [] and new._subtrees == []:
+        changes = _diff_files([(old._root, old.data_size)],
+                              [(new._root, new.data_size)])
+        if changes:
+            return changes[0]
+        return DiffTree(new._root, [], UNCHANGED)
+    # Each stack frame holds a folder's name, status and the DiffTrees
+    # found in it so far, and an iterator over the pairs of folders inside
+    # it, as (name, status, old folder, new folder), not compared yet.
+    stack = [_open_folder(new._root, CHANGED, old, new)]
+    while True:
+        for name, status, old_folder, new_folder in stack[-1][3]:
+            stack.append(_open_folder(name, status, old_folder, new_folder))
+            break
+        else:
+            folder = _close_folder(stack)
+            if folder is not None:
+                return folder
+
+
+def diff_snapshots(old_path, new_path):
+    """Return the difference between the scans saved in the snapshots at
+    <old_path> and <new_path>, of the same folder.
+
+    Both snapshots are read as streams, a directory at a time. Sizes are
+    compared as saved, so if either scan was made with check_files=False,
+    a file that changed size in place may be missed; see scan_snapshot.
+
+    @type old_path: str
+    @type new_path: str
+    @rtype: DiffTree
+    """
+    old_lines = iter_snapshot(old_path)
+    next(old_lines)
+    new_lines = iter_snapshot(new_path)
+    root = next(new_lines)['root']
+    # The stack holds the name, status and DiffTrees found so far of each
+    # folder on the path of the current directory, as in
+    # manifest_tree.tree_from_manifest. Folders with no changes are
+    # dropped when they are closed.
+    stack = [[os.path.basename(root), CHANGED, [], iter([])]]
+    open_parts = ()
+    for parts, old_entries, new_entries in _merge_snapshots(old_lines,
+                                                            new_lines):
+        while open_parts != parts[:len(open_parts)]:
+            _close_folder(stack)
+            open_parts = open_parts[:-1]
+        for name in parts[len(open_parts):]:
+            stack.append([name, CHANGED, [], iter([])])
+        open_parts = parts
+        if old_entries is None:
+            stack[-1][1] = ADDED
+        elif new_entries is None:
+            stack[-1][1] = REMOVED
+        stack[-1][2].extend(_diff_files(_files_in(old_entries),
+                                        _files_in(new_entries)))
+    while True:
+        folder = _close_folder(stack)
+        if folder is not None:
+            return folder
+
+
+def _merge_snapshots(old_lines, new_lines):
+    """Yield the path components of every directory in either of two
+    snapshots, with its entries in the old and in the new one, in the order
+    the snapshots list them.
+
+    The entries are None for a directory missing from one of the
+    snapshots.
+
+    @type old_lines: iterator[(tuple[str], int | None, list)]
+    @type new_lines: iterator[(tuple[str], int | None, list)]
+    @rtype: generator
+    """
+    old = next(old_lines, None)
+    new = next(new_lines, None)
+    while old is not None or new is not None:
+        if new is None or old is not None and old[0] < new[0]:
+            yield old[0], old[2], None
+            old = next(old_lines, None)
+        elif old is None or new[0] < old[0]:
+            yield new[0], None, new[2]
+            new = next(new_lines, None)
+        else:
+            yield new[0], old[2], new[2]
+            old = next(old_lines, None)
+            new = next(new_lines, None)
+
+
+def _files_in(entries):
+    """Return the name and size of every file in <entries>, a directory
+    listing from a snapshot, or nothing if <entries> is None.
+
+    Folders are left out, since each has a listing of its own.
+
+    @type entries: list[[str, bool, int]] | None
+    @rtype: list[(str, int)]
+    """
+    if entries is None:
+        return []
+    return [(name, size) for name, is_dir, size in entries if not is_dir]
+
+
+def _open_folder(name, status, old, new):
+    """Compare the files directly inside the folders <old> and <new>, and
+    return a stack frame for the folder, as in diff_trees.
+
+    @type name: str
+    @type status: str
+    @type old: FileSystemTree | None
+    @type new: FileSystemTree | None
+    @rtype: [str, str, list[DiffTree], iterator]
+    """
+    old_subtrees = [] if old is None else old._subtrees
+    new_subtrees = [] if new is None else new._subtrees
+    changes = _diff_files(
+        [(tree._root, tree.data_size) for tree in old_subtrees
+         if tree._subtrees == []],
+        [(tree._root, tree.data_size) for tree in new_subtrees
+         if tree._subtrees == []])
+    old_folders = {tree._root: tree for tree in old_subtrees
+                   if tree._subtrees != []}
+    folders = []
+    for tree in new_subtrees:
+        if tree._subtrees != []:
+            old_folder = old_folders.pop(tree._root, None)
+            folders.append((tree._root, ADDED if old_folder is None else
+                            CHANGED, old_folder, tree))
+    for folder_name, old_folder in old_folders.items():
+        folders.append((folder_name, REMOVED, old_folder, None))
+    return [name, status, changes, iter(folders)]
+
+
+def _close_folder(stack):
+    """Turn the folder at the top of <stack> into a DiffTree, and add it to
+    the folder below it if anything changed inside it.
+
+    Return the DiffTree if it was the last folder on the stack, and None
+    otherwise.
+
+    @type stack: list[[str, str, list[DiffTree], iterator]]
+    @rtype: DiffTree | None
+    """
+    name, status, subtrees, _ = stack.pop()
+    if stack == []:
+        return DiffTree(name, subtrees, status if subtrees else UNCHANGED)
+    if subtrees:
+        stack[-1][2].append(DiffTree(name, subtrees, status))
+    return None
+
+
+def _diff_files(old_files, new_files):
+    """Return a DiffTree for each file added, removed or changed in size
+    between <old_files> and <new_files>, the names and sizes of the files
+    in the same folder in two scans.
+
+    @type old_files: list[(str, int)]
+    @type new_files: list[(str, int)]
+    @rtype: list[DiffTree]
+
+    >>> [(tree._root, tree.status) for tree in _diff_files(
+    ...     [('a', 1), ('b', 2), ('c', 3)], [('c', 4), ('b', 2), ('d', 0)])]
+    [('c', 'changed'), ('d', 'added'), ('a', 'removed')]
+    """
+    old_sizes = dict(old_files)
+    changes = []
+    for name, size in new_files:
+        old_size = old_sizes.pop(name, None)
+        if old_size is None:
+            changes.append(DiffTree(name, [], ADDED, size))
+        elif old_size != size:
+            changes.append(DiffTree(name, [], CHANGED, size - old_size))
+    for name, old_size in old_sizes.items():
+        changes.append(DiffTree(name, [], REMOVED, -old_size))
+    return changes
+
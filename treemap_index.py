@@ -0,0 +1,269 @@
+"""Assignment 2: Treemap Spatial Index
+
+=== Module Description ===
+This module contains TreemapIndex, which answers "which leaf is drawn
+here?" without walking the tree.
+
+AbstractTree.find_leaf slices the rectangles again from the root on every
+click. A TreemapIndex instead lays the tree out itself and files the
+rectangle of every leaf in a uniform grid of square cells, so that a point
+query only looks at the few leaves overlapping a single cell, and a
+rectangle query (e.g. for a drag selection) only at the cells the
+rectangle covers.
+
+The index is kept up to date incrementally. Laying the tree out reports
+which leaves got a new rectangle; every other leaf keeps the rectangle it
+had, and so does its entry in the index. Since the leaves of a treemap
+tile its rectangle, every leaf that disappeared or moved overlapped one of
+the new rectangles, so only the cells those rectangles cover are updated.
+
+Rectangles are treated as half-open: a leaf drawn at (x, y, w, h) holds the
+points with x <= px < x + w and y <= py < y + h. Leaves drawn with no area
+are not indexed. A subtree drawn as a single rectangle because it is
+smaller than min_area is indexed as if it were a leaf.
+"""
+from tree_data import AbstractTree
+
+
+# The width and height of a grid cell, in pixels.
+DEFAULT_CELL_SIZE = 16
+
+
+class TreemapIndex:
+    """A spatial index of the leaf rectangles of a tree's treemap.
+
+    A TreemapIndex can be used in place of its tree by the treemap
+    visualiser: generate_treemap and find_leaf have the same contract as
+    AbstractTree's, but find_leaf answers from the index.
+
+    The tree may be changed freely between calls to generate_treemap. If
+    any tree has been laid out by something else since, the index cannot
+    tell which of its cached layouts are still its own, so it is rebuilt.
+
+    === Private Attributes ===
+    @type _tree: AbstractTree
+        The indexed tree.
+    @type _strategy: callable | None
+        The layout strategy the tree is laid out with.
+    @type _min_area: int
+        Subtrees drawn with fewer pixels than this are drawn, and indexed,
+        as a single rectangle.
+    @type _rect: (int, int, int, int) | None
+        The rectangle the tree was last laid out in, or None if it has not
+        been laid out yet.
+    @type _layouts_made: int | None
+        AbstractTree._layouts_made just after the index was last updated,
+        to tell whether anything has been laid out by something else since.
+    @type _cell_size: int
+    @type _cells: dict[(int, int), dict[AbstractTree, (int, int, int, int)]]
+        The leaves overlapping each grid cell, with their rectangles.
+    @type _rects: dict[AbstractTree, (int, int, int, int)]
+        The rectangle of every indexed leaf.
+
+    === Representation Invariants ===
+    - A leaf is in _cells[(i, j)] if and only if its rectangle in _rects
+      overlaps the cell from (i * _cell_size, j * _cell_size) to
+      ((i + 1) * _cell_size, (j + 1) * _cell_size).
+    - No value in _cells is empty.
+    """
+    def __init__(self, tree, cell_size=DEFAULT_CELL_SIZE, strategy=None,
+                 min_area=0):
+        """Initialize a new, empty index of <tree>.
+
+        The index is filled in by the first call to generate_treemap.
+
+        Precondition: cell_size >= 1
+
+        @type self: TreemapIndex
+        @type tree: AbstractTree
+        @type cell_size: int
+        @type strategy: callable | None
+            The layout strategy the tree is laid out with, as for
+            AbstractTree.generate_treemap.
+        @type min_area: int
+            Subtrees drawn with fewer pixels are not divided, as for
+            AbstractTree.generate_treemap.
+        @rtype: None
+        """
+        self._tree = tree
+        self._strategy = strategy
+        self._min_area = min_area
+        self._rect = None
+        self._layouts_made = None
+        self._cell_size = cell_size
+        self._cells = {}
+        self._rects = {}
+
+    def generate_treemap(self, rect):
+        """Run the treemap algorithm on the indexed tree, update the index
+        to match, and return the rectangles.
+
+        @type self: TreemapIndex
+        @type rect: (int, int, int, int)
+        @rtype: list[((int, int, int, int), (int, int, int))]
+
+        >>> T1 = AbstractTree('Test1', [], 15)
+        >>> T2 = AbstractTree('Test2', [], 15)
+        >>> index = TreemapIndex(AbstractTree('Test', [T1, T2]))
+        >>> index.generate_treemap((0, 0, 100, 50))[1][0]
+        (50, 0, 50, 50)
+        >>> index.find_leaf((0, 0, 100, 50), (60, 10)) is T2
+        True
+        """
+        tree = self._tree
+        # If anything was laid out by something else since the last update,
+        # the cached layouts inside the tree may have been made for other
+        # rectangles, and the leaves they hold are not reported as changed.
+        # Neither are leaves whose cached layouts a resize leaves alone. So
+        # the index is rebuilt from scratch, with every layout discarded so
+        # that every leaf is reported.
+        rebuild = rect != self._rect or \
+            AbstractTree._layouts_made != self._layouts_made
+        if rebuild:
+            tree.invalidate_layout(True)
+        changed = []
+        tree_map = tree.generate_treemap(rect, changed, self._strategy,
+                                         self._min_area)
+        if rebuild or tree_map == []:
+            self._cells = {}
+            self._rects = {}
+        else:
+            for _, leaf_rect in changed:
+                for cell in self._cells_covered(leaf_rect):
+                    for leaf, old_rect in list(self._cells.get(cell,
+                                                               {}).items()):
+                        if _overlaps(old_rect, leaf_rect):
+                            self._remove(leaf)
+        for leaf, leaf_rect in changed:
+            self._insert(leaf, leaf_rect)
+        self._rect = rect
+        self._layouts_made = AbstractTree._layouts_made
+        return tree_map
+
+    def find_leaf(self, rect, coordinations):
+        """Return the leaf drawn at <coordinations>, or None if there is
+        none.
+
+        The indexed tree found is searched with its own find_leaf to get the
+        final leaf, so that subtrees drawn as a single rectangle, and
+        collapsed LazyFileSystemTree folders, are looked inside.
+
+        If <rect> is not the rectangle the index was built for, the tree is
+        searched with AbstractTree.find_leaf instead.
+
+        @type self: TreemapIndex
+        @type rect: (int, int, int, int)
+        @type coordinations: (int, int)
+        @rtype: AbstractTree | None
+        """
+        if rect != self._rect:
+            return self._tree.find_leaf(rect, coordinations, self._strategy)
+        leaf = self.leaf_at(coordinations)
+        if leaf is None:
+            return None
+        return leaf.find_leaf(self._rects[leaf], coordinations,
+                              self._strategy)
+
+    def leaf_at(self, point):
+        """Return the indexed leaf whose rectangle holds <point>, or None if
+        there is none.
+
+        @type self: TreemapIndex
+        @type point: (int, int)
+        @rtype: AbstractTree | None
+        """
+        x, y = point
+        cell = self._cells.get((x // self._cell_size, y // self._cell_size))
+        if cell is not None:
+            for leaf, (left, top, width, height) in cell.items():
+                if left <= x < left + width and top <= y < top + height:
+                    return leaf
+        return None
+
+    def leaves_in(self, rect):
+        """Return the indexed leaves whose rectangles overlap <rect>, in no
+        particular order.
+
+        @type self: TreemapIndex
+        @type rect: (int, int, int, int)
+        @rtype: list[AbstractTree]
+
+        >>> T1 = AbstractTree('Test1', [], 10)
+        >>> T2 = AbstractTree('Test2', [], 10)
+        >>> T3 = AbstractTree('Test3', [], 20)
+        >>> index = TreemapIndex(AbstractTree('Test', [T1, T2, T3]))
+        >>> rects = index.generate_treemap((0, 0, 400, 100))
+        >>> [leaf._root for leaf in index.leaves_in((90, 0, 20, 20))]
+        ['Test1', 'Test2']
+        """
+        found = {}
+        for cell in self._cells_covered(rect):
+            for leaf, leaf_rect in self._cells.get(cell, {}).items():
+                if leaf not in found and _overlaps(leaf_rect, rect):
+                    found[leaf] = None
+        return list(found)
+
+    def _cells_covered(self, rect):
+        """Return the grid cells that <rect> overlaps.
+
+        @type self: TreemapIndex
+        @type rect: (int, int, int, int)
+        @rtype: list[(int, int)]
+        """
+        x, y, width, height = rect
+        if width <= 0 or height <= 0:
+            return []
+        size = self._cell_size
+        return [(i, j)
+                for i in range(x // size, (x + width - 1) // size + 1)
+                for j in range(y // size, (y + height - 1) // size + 1)]
+
+    def _insert(self, leaf, rect):
+        """Add <leaf>, drawn in <rect>, to the index.
+
+        @type self: TreemapIndex
+        @type leaf: AbstractTree
+        @type rect: (int, int, int, int)
+        @rtype: None
+        """
+        if leaf in self._rects:
+            self._remove(leaf)
+        cells = self._cells_covered(rect)
+        if cells == []:
+            return
+        self._rects[leaf] = rect
+        for cell in cells:
+            if cell in self._cells:
+                self._cells[cell][leaf] = rect
+            else:
+                self._cells[cell] = {leaf: rect}
+
+    def _remove(self, leaf):
+        """Remove <leaf> from the index.
+
+        @type self: TreemapIndex
+        @type leaf: AbstractTree
+        @rtype: None
+        """
+        for cell in self._cells_covered(self._rects.pop(leaf)):
+            leaves = self._cells[cell]
+            del leaves[leaf]
+            if not leaves:
+                del self._cells[cell]
+
+
+def _overlaps(rect1, rect2):
+    """Return True if the half-open rectangles <rect1> and <rect2> share at
+    least one point.
+
+    @type rect1: (int, int, int, int)
+    @type rect2: (int, int, int, int)
+    @rtype: bool
+
+    >>> _overlaps((0, 0, 10, 10), (10, 0, 10, 10))
+    False
+    >>> _overlaps((0, 0, 10, 10), (9, 9, 10, 10))
+    True
+    """
+    return rect1[0] < rect2[0] + rect2[2] and rect2[0] < rect1[0] + rect1[2] \
+        and rect1[1] < rect2[1] + rect2[3] and rect2[1] < rect1[1] + rect1[3]
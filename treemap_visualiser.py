@@ -12,9 +12,20 @@ concrete subclass, of course), rendering it to the user using pygame,
 and detecting user events like mouse clicks and key presses and responding
 to them.
 """
+import os
 import pygame
-from tree_data import FileSystemTree
+from fs_scan import scan_file_system
+from scan_snapshot import scan_with_snapshot
+from fs_watch import watch_tree
+from lazy_tree import LazyFileSystemTree
+from compact_tree import compact_scan
+from budget_scan import scan_with_budget, PlaceholderTree
 from population import PopulationTree
+from tree_data import AbstractTree, squarify_rect
+from treemap_index import TreemapIndex
+from edit_journal import EditJournal
+from path_index import PathIndex
+from tree_diff import DiffTree, diff_snapshots
 
 
 # Screen dimensions and coordinates
@@ -24,25 +35,74 @@ HEIGHT = 768
 FONT_HEIGHT = 30                       # The height of the text display.
 TREEMAP_HEIGHT = HEIGHT - FONT_HEIGHT  # The height of the treemap display.
 
+# Subtrees drawn with fewer pixels than this are drawn as one rectangle.
+MIN_AREA = 1
+
+# Two left clicks on the same spot within this many milliseconds are a
+# double click, which zooms in.
+DOUBLE_CLICK_MS = 400
+
 # Font to use for the treemap program.
 FONT_FAMILY = 'Consolas'
 
 
-def run_visualisation(tree):
+def run_visualisation(tree, watcher=None, strategy=None, min_area=MIN_AREA,
+                      paths=None):
     """Display an interactive graphical display of the given tree's treemap.
 
-    @type tree: AbstractTree
+    If <watcher> is given, it is polled for file system changes while the
+    treemap is displayed. If <paths> is given, it is the PathIndex the
+    watcher looks nodes up in, and the user's edits keep it in sync too.
+
+    The treemap of an AbstractTree is drawn through a TreemapIndex, so that
+    clicks are answered from the index instead of by walking the tree.
+    Its subtrees drawn with fewer than <min_area> pixels are drawn as a
+    single rectangle, without laying out the files inside them.
+
+    Double-clicking zooms in on the folder clicked, one level at a time,
+    and Backspace zooms back out. Dragging with the right mouse button
+    deletes every rectangle the dragged area touches. The deletions and
+    resizes made to an AbstractTree are undone with Ctrl+Z and redone with
+    Ctrl+Y.
+
+    Precondition: if <tree> is a CompactNode, <strategy> is None.
+
+    @type tree: AbstractTree | CompactNode
+    @type watcher: TreeWatcher | None
+    @type strategy: callable | None
+        The layout strategy, slice_rect (the default) or squarify_rect.
+    @type min_area: int
+    @type paths: PathIndex | None
     @rtype: None
     """
+    zoom_stack = [(tree, _treemap_view(tree, strategy, min_area))]
+    journal = None
+    if isinstance(tree, AbstractTree):
+        journal = EditJournal(tree, paths)
+
     # Setup pygame
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
 
     # Render the initial display of the static treemap.
-    render_display(screen, tree, '')
+    render_display(screen, zoom_stack[-1][1], '')
 
     # Start an event loop to respond to events.
-    event_loop(screen, tree)
+    event_loop(screen, zoom_stack, watcher, strategy, min_area, journal)
+
+
+def _treemap_view(tree, strategy, min_area):
+    """Return the object that draws <tree> and answers clicks on it: a
+    TreemapIndex for an AbstractTree, or a CompactNode itself.
+
+    @type tree: AbstractTree | CompactNode
+    @type strategy: callable | None
+    @type min_area: int
+    @rtype: TreemapIndex | CompactNode
+    """
+    if isinstance(tree, AbstractTree):
+        return TreemapIndex(tree, strategy=strategy, min_area=min_area)
+    return tree
 
 
 def render_display(screen, tree, text):
@@ -52,7 +112,7 @@ def render_display(screen, tree, text):
     screen vertically into the treemap and text comments.
 
     @type screen: pygame.Surface
-    @type tree: AbstractTree
+    @type tree: TreemapIndex | CompactNode
     @type text: str
         The text to render.
     @rtype: None
@@ -84,7 +144,8 @@ def _render_text(screen, text):
     screen.blit(text_surface, text_pos)
 
 
-def event_loop(screen, tree):
+def event_loop(screen, zoom_stack, watcher=None, strategy=None,
+               min_area=MIN_AREA, journal=None):
     """Respond to events (mouse clicks, key presses) and update the display.
 
         Note that the event loop is an *infinite loop*: it continually waits for
@@ -93,8 +154,25 @@ def event_loop(screen, tree):
         necessary.
         This loop ends when the user closes the window.
 
+        Only the tree at the top of <zoom_stack> is laid out, drawn and
+        clicked on. While zoomed in, the path of that tree is shown when no
+        leaf is selected.
+
+        If <watcher> is given, changes it finds on disk are applied to the
+        tree on every pass through the loop.
+
+        If <journal> is given, deletions and resizes are made through it, so
+        that they can be undone and redone.
+
         @type screen: pygame.Surface
-        @type tree: AbstractTree
+        @type zoom_stack: list[(AbstractTree | CompactNode,
+                                TreemapIndex | CompactNode)]
+            The trees zoomed in on, starting with the whole tree, each with
+            the view that draws it.
+        @type watcher: TreeWatcher | None
+        @type strategy: callable | None
+        @type min_area: int
+        @type journal: EditJournal | None
         @rtype: None
         """
     # We strongly recommend using a variable to keep track of the currently-
@@ -102,30 +180,109 @@ def event_loop(screen, tree):
     # But feel free to remove it, and/or add new variables, to help keep
     # track of the state of the program.
     selected_leaf = None
+    # The time and position of the last left click, to spot double clicks,
+    # and where the right mouse button was pressed, to spot drags.
+    last_click = None
+    drag_start = None
 
     while True:
         # Wait for an event
         event = pygame.event.poll()
         message = ''
+        tree = zoom_stack[-1][1]
         if event.type == pygame.QUIT:
+            if watcher is not None:
+                watcher.close()
             return
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+            drag_start = event.pos
         elif event.type == pygame.MOUSEBUTTONUP:
             rect = 0, 0, WIDTH, TREEMAP_HEIGHT
-            if event.button == 1:
+            if event.button == 1 and _is_double_click(last_click, event):
+                zoom_in(zoom_stack, event, rect, strategy, min_area)
+                last_click = None
+            elif event.button == 1:
                 selected_leaf = left_click_event(selected_leaf, event, rect,
                                                  tree)
-            if event.button == 3:
+                last_click = pygame.time.get_ticks(), event.pos
+            if event.button == 3 and drag_start not in (None, event.pos):
+                selected_leaf = drag_delete_event(selected_leaf, drag_start,
+                                                  event, zoom_stack[-1],
+                                                  journal)
+            elif event.button == 3:
                 selected_leaf = right_click_event(selected_leaf, event, rect,
-                                                  tree)
+                                                  tree, journal)
+            drag_start = None
         elif event.type == pygame.KEYUP:
-            selected_leaf = key_press_event(selected_leaf, event)
+            if event.key == pygame.K_BACKSPACE:
+                zoom_out(zoom_stack)
+            if event.mod & pygame.KMOD_CTRL:
+                selected_leaf = undo_event(selected_leaf, event, journal)
+            else:
+                selected_leaf = key_press_event(selected_leaf, event,
+                                                journal)
+        if watcher is not None:
+            watcher.poll()
         if selected_leaf:
             message = generate_display_message(selected_leaf)
-        render_display(screen, tree, message)
+        elif len(zoom_stack) > 1:
+            message = zoom_stack[-1][0].get_separator()
+        render_display(screen, zoom_stack[-1][1], message)
         # Remember to call render_display if any data_sizes change,
         # as the treemap will change in this case.
 
 
+def _is_double_click(last_click, event):
+    """Return True if the left click <event> is the second click of a
+    double click.
+
+    @type last_click: (int, (int, int)) | None
+        The time and position of the previous left click, if any.
+    @type event: pygame.event
+    @rtype: bool
+    """
+    return last_click is not None and last_click[1] == event.pos and \
+        pygame.time.get_ticks() - last_click[0] <= DOUBLE_CLICK_MS
+
+
+def zoom_in(zoom_stack, event, rect, strategy, min_area):
+    """Zoom in on the subtree of the tree at the top of <zoom_stack> that
+    holds the leaf double-clicked on, if that subtree is not a leaf itself.
+
+    The new view's TreemapIndex is filled in from scratch the first time it
+    is drawn, and so is the view zoomed out to, since the zoomed-in view
+    lays out part of its tree.
+
+    @type zoom_stack: list[(AbstractTree | CompactNode,
+                            TreemapIndex | CompactNode)]
+    @type event: pygame.event
+    @type rect: (int, int, int, int)
+    @type strategy: callable | None
+    @type min_area: int
+    @rtype: None
+    """
+    focused, view = zoom_stack[-1]
+    leaf = view.find_leaf(rect, event.pos)
+    child = None
+    while leaf is not None and leaf != focused:
+        child = leaf
+        leaf = leaf._parent_tree
+    if leaf is not None and child is not None and child._subtrees != []:
+        zoom_stack.append((child, _treemap_view(child, strategy, min_area)))
+
+
+def zoom_out(zoom_stack):
+    """Zoom back out to the tree zoomed in on before the one at the top of
+    <zoom_stack>, if there is one.
+
+    @type zoom_stack: list[(AbstractTree | CompactNode,
+                            TreemapIndex | CompactNode)]
+    @rtype: None
+    """
+    if len(zoom_stack) > 1:
+        zoom_stack.pop()
+
+
 def left_click_event(selected_leaf, event, rect, tree):
     """ generate an event for a left click on the pygame screen
 
@@ -138,7 +295,7 @@ def left_click_event(selected_leaf, event, rect, tree):
     @type selected_leaf = AbstractTree
     @type event = pygame.event
     @type rect = (int, int, int, int)
-    @type tree = AbstractTree
+    @type tree = TreemapIndex | CompactNode
     @rtype = AbstracTree
     """
     if selected_leaf == tree.find_leaf(rect, event.pos):
@@ -147,7 +304,7 @@ def left_click_event(selected_leaf, event, rect, tree):
         return tree.find_leaf(rect, event.pos)
 
 
-def right_click_event(selected_leaf, event, rect, tree):
+def right_click_event(selected_leaf, event, rect, tree, journal=None):
     """generate an event for right click on the pygame screen
 
     - When there is a right click on the screen, this function will search for a
@@ -155,38 +312,109 @@ def right_click_event(selected_leaf, event, rect, tree):
     - The corresponding leaf will be removed from the tree.
     - If the selected leaf is the same as the removed tree, selected leaf will
     be unselected
+    - If <journal> is given, the deletion is recorded in it
+    - If no leaf is drawn there, nothing is deleted
 
     @type selected_leaf = AbstractTree
     @type event = pygame.event
     @type rect = (int, int, int, int)
-    @type tree = AbstractTree
+    @type tree = TreemapIndex | CompactNode
+    @type journal = EditJournal | None
     @rtype = AbstracTree
     """
     leaf_for_deletion = tree.find_leaf(rect, event.pos)
-    leaf_for_deletion.delete_selected_leaf()
+    if leaf_for_deletion is None:
+        return selected_leaf
+    if journal is not None:
+        journal.delete_selected_leaf(leaf_for_deletion)
+    else:
+        leaf_for_deletion.delete_selected_leaf()
     if leaf_for_deletion == selected_leaf:
         selected_leaf = None
     return selected_leaf
 
 
-def key_press_event(selected_leaf, event):
+def drag_delete_event(selected_leaf, start, event, focused, journal=None):
+    """delete every leaf drawn in the area dragged out with the right mouse
+    button, from <start> to where the button was released
+
+    - all the leaves are deleted at once, with delete_subtrees
+    - if the selected leaf is deleted, it will be unselected
+    - only trees drawn through a TreemapIndex can be drag-deleted; for any
+    other tree, this function will do nothing
+    - if <journal> is given, the deletions are recorded in it as one edit
+    - if no leaf is drawn in the area, nothing is deleted
+
+    @type selected_leaf = AbstractTree | None
+    @type start = (int, int)
+    @type event = pygame.event
+    @type focused = (AbstractTree | CompactNode, TreemapIndex | CompactNode)
+        the tree being drawn, and the view that draws it
+    @type journal = EditJournal | None
+    @rtype = AbstractTree | None
+    """
+    tree, view = focused
+    if not isinstance(view, TreemapIndex):
+        return selected_leaf
+    (start_x, start_y), (end_x, end_y) = start, event.pos
+    leaves = set(view.leaves_in((min(start_x, end_x), min(start_y, end_y),
+                                 abs(end_x - start_x) + 1,
+                                 abs(end_y - start_y) + 1)))
+    if not leaves:
+        return selected_leaf
+    if journal is not None:
+        journal.delete_subtrees(leaves)
+    else:
+        tree.delete_subtrees(leaves)
+    if selected_leaf in leaves:
+        selected_leaf = None
+    return selected_leaf
+
+
+def key_press_event(selected_leaf, event, journal=None):
     """generate an event for key press
 
     - if key pressed is up button, the selected leaf will increase by 1% in size
     - if key pressed is down button, the selected leaf will decrease by 1% in
     size
     - if no leaf is selected, this function will do nothing
+    - if <journal> is given, the change in size is recorded in it
 
     @type selected_leaf = AbstractTree
     @type event = pygame.event
+    @type journal = EditJournal | None
     @rtype = None | AbtstractTree
     """
     if selected_leaf:
-        if event.key == pygame.K_UP:
-            selected_leaf.mutate_size('increase')
-        elif event.key == pygame.K_DOWN:
-            selected_leaf.mutate_size('decrease')
+        if event.key in (pygame.K_UP, pygame.K_DOWN):
+            parameter = 'increase' if event.key == pygame.K_UP else 'decrease'
+            if journal is not None:
+                journal.mutate_size(selected_leaf, parameter)
+            else:
+                selected_leaf.mutate_size(parameter)
+        return selected_leaf
+
+
+def undo_event(selected_leaf, event, journal):
+    """generate an event for a key press with Ctrl held down
+
+    - Ctrl+Z undoes the last deletion or change in size
+    - Ctrl+Y redoes the last one undone
+    - if anything is undone or redone, the selected leaf will be unselected,
+    since it may have been deleted
+    - if <journal> is None, this function will do nothing
+
+    @type selected_leaf = AbstractTree | None
+    @type event = pygame.event
+    @type journal = EditJournal | None
+    @rtype = AbstractTree | None
+    """
+    if journal is None:
         return selected_leaf
+    if event.key == pygame.K_z and journal.undo() or \
+            event.key == pygame.K_y and journal.redo():
+        return None
+    return selected_leaf
 
 
 def generate_display_message(selected_leaf):
@@ -197,19 +425,99 @@ def generate_display_message(selected_leaf):
     """
     path = selected_leaf.get_separator()
     data_size = str(selected_leaf.data_size)
+    if isinstance(selected_leaf, PlaceholderTree) and \
+            selected_leaf.is_estimated():
+        data_size = '~' + data_size
+    elif isinstance(selected_leaf, DiffTree):
+        data_size = '{:+d}, {}'.format(selected_leaf.size_change,
+                                       selected_leaf.status)
     return path + '     ' + '(' + data_size + ')'
 
 
-def run_treemap_file_system(path):
+def run_treemap_file_system(path, snapshot_path=None, watch=False,
+                            lazy=False, compact=False, max_seconds=None,
+                            squarify=False):
     """Run a treemap visualisation for the given path's file structure.
 
+    If <snapshot_path> is given, the scan is saved there, and only the
+    directories that have changed since the last saved scan are listed.
+
+    If <watch> is True, files created, deleted or resized under <path> while
+    the visualisation is running are shown without rescanning.
+
+    If <lazy> is True, nodes are only created for folders that are drawn
+    large enough to be seen, or that are clicked on.
+
+    If <compact> is True, the tree is stored in a CompactTree, which uses far
+    less memory for folders with millions of files.
+
+    If <max_seconds> is given, folders are only listed for that long, and
+    the folders left over are shown as grey placeholders.
+
+    If <squarify> is True, the squarified layout is used instead of slices,
+    so that folders with many files are drawn as rectangles close to
+    squares rather than as thin slivers.
+
     Precondition: <path> is a valid path to a file or folder.
+                  If <lazy>, <compact> or <max_seconds> is given,
+                  <snapshot_path> is None and <watch> is False.
+                  At most one of <lazy>, <compact> and <max_seconds> is
+                  given.
+                  <compact> and <squarify> are not both True.
 
     @type path: str
+    @type snapshot_path: str | None
+    @type watch: bool
+    @type lazy: bool
+    @type compact: bool
+    @type max_seconds: float | None
+    @type squarify: bool
+    @rtype: None
+    """
+    if max_seconds is not None:
+        file_tree = scan_with_budget(path, max_seconds)
+    elif compact:
+        file_tree = compact_scan(path).root()
+    elif lazy and os.path.isdir(path):
+        file_tree = LazyFileSystemTree(path)
+    elif snapshot_path is None:
+        file_tree = scan_file_system(path)
+    else:
+        file_tree = scan_with_snapshot(path, snapshot_path)
+    watcher = None
+    paths = None
+    if watch and os.path.isdir(path):
+        # The watcher and the user's edits share one index, so that a file
+        # the user deletes is no longer changed by the watcher.
+        paths = PathIndex(file_tree)
+        watcher = watch_tree(file_tree, path, paths=paths)
+    strategy = None
+    if squarify:
+        strategy = squarify_rect
+    run_visualisation(file_tree, watcher, strategy, paths=paths)
+
+
+def run_treemap_diff(old_snapshot_path, new_snapshot_path, squarify=False):
+    """Run a treemap visualisation of what changed between two saved scans
+    of the same folder.
+
+    Each file added, removed or changed in size is drawn with an area in
+    proportion to how much its size changed, in green if it grew and in red
+    if it shrank. Unchanged files are not drawn.
+
+    Precondition: both paths are snapshots saved by scan_with_snapshot for
+                  the same folder.
+
+    @type old_snapshot_path: str
+    @type new_snapshot_path: str
+    @type squarify: bool
     @rtype: None
     """
-    file_tree = FileSystemTree(path)
-    run_visualisation(file_tree)
+    strategy = None
+    if squarify:
+        strategy = squarify_rect
+    run_visualisation(diff_snapshots(old_snapshot_path, new_snapshot_path),
+                      None, strategy)
 
 
 def run_treemap_population():